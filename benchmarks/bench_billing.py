@@ -0,0 +1,289 @@
+"""Benchmarks `PayableManager.process_subscriptions` against synthetic subscribers and Venmo history.
+
+For each scale, a fresh (in-memory) database is populated with N users, each with a `VenmoAccount`, a due
+`UserSubscription`, last period's `Bill` and (for some) a prior `Payment`. A mocked Venmo client returns
+`--txns-per-user` synthetic transactions per user, a share of which pay the current bill.
+
+Wall time, query count and peak traced memory are then reported per phase of the run. Time and queries are
+exclusive of nested phases (i.e.: the Venmo sync triggered by the first match), while memory is the phase's peak
+over what was allocated when it started.
+
+Usage (from the repository root):
+  python benchmarks/bench_billing.py --users 100 1000 5000
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sandbox.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.contrib.auth.models import Group  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.utils import timezone as django_timezone  # noqa: E402
+from subscriptions.models import MONTH, PlanCost, SubscriptionPlan, UserSubscription  # noqa: E402
+from venmo_api.models.transaction import Transaction  # noqa: E402
+from venmo_api.models.user import User as VenmoUser  # noqa: E402
+
+from payablesubs.management.commands._payable_manager import PayableManager  # noqa: E402
+from payablesubs.models import Bill, Payment, VenmoAccount  # noqa: E402
+
+BENCH_GROUP = "Benchmark Subscribers"
+PLAN_COST = Decimal(2)
+ROOT_VENMO_USER = VenmoUser("1", "bench-root", None, None, None, None, None, None, None, None, None)
+
+
+class PhaseRecorder:
+    """Accumulates wall time, query count and peak memory per (possibly nested) named phase."""
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stats = {}
+        self._stack = []
+
+    def _count_query(self, execute, sql, params, many, context):
+        if self._stack:
+            self._stack[-1]["queries"] += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def recording(self):
+        """Counts the queries issued (on the default connection) while recording."""
+        if self.trace_memory:
+            tracemalloc.start()
+        try:
+            with connection.execute_wrapper(self._count_query):
+                yield self
+        finally:
+            if self.trace_memory:
+                tracemalloc.stop()
+
+    @contextmanager
+    def phase(self, name):
+        current_memory = 0
+        if self.trace_memory:
+            current_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        entry = {"start": time.perf_counter(), "nested": 0.0, "queries": 0, "memory": current_memory, "peak": 0}
+        self._stack.append(entry)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - entry["start"]
+            peak = max(entry["peak"], tracemalloc.get_traced_memory()[1]) if self.trace_memory else 0
+            if self._stack:
+                self._stack[-1]["nested"] += elapsed
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+
+            stats = self.stats.setdefault(name, {"calls": 0, "seconds": 0.0, "queries": 0, "peak_kib": 0.0})
+            stats["calls"] += 1
+            stats["seconds"] += elapsed - entry["nested"]
+            stats["queries"] += entry["queries"]
+            stats["peak_kib"] = max(stats["peak_kib"], (peak - entry["memory"]) / 1024)
+
+
+class BenchmarkManager(PayableManager):
+    """`PayableManager` that records each phase of processing due subscriptions."""
+
+    def __init__(self, recorder, *args, **kwargs):
+        self.recorder = recorder
+        super().__init__(*args, **kwargs)
+
+    def _get_txn_index(self):
+        with self.recorder.phase("venmo sync + index"):
+            return super()._get_txn_index()
+
+    def _get_or_create_bill(self, sub):
+        with self.recorder.phase("bill creation"):
+            return super()._get_or_create_bill(sub)
+
+    def _check_payments(self, sub, current_bill):
+        with self.recorder.phase("matching"):
+            return super()._check_payments(sub, current_bill)
+
+    def _update_due_subscription(self, subscription, matched_txn):
+        with self.recorder.phase("saving"):
+            return super()._update_due_subscription(subscription, matched_txn)
+
+    def _flush_writes(self):
+        with self.recorder.phase("flushing"):
+            return super()._flush_writes()
+
+    def drain_outbox(self):
+        with self.recorder.phase("sending"):
+            return super().drain_outbox()
+
+
+def _venmo_client(txns):
+    """Mocks the parts of the `venmo-api` client used by `PayableManager`."""
+    return SimpleNamespace(
+        my_profile=lambda: ROOT_VENMO_USER,
+        user=SimpleNamespace(get_user_transactions=lambda user_id: list(txns)),
+        payment=SimpleNamespace(request_money=lambda amount, note, target_user_id: True),
+    )
+
+
+def _txn(txn_id, payment_type, amount, actor, target, date_completed):
+    epoch = int(date_completed.timestamp())
+    return Transaction(
+        txn_id, None, epoch, epoch, epoch, payment_type, float(amount), None, None, "bench", None, actor, target, None
+    )
+
+
+def populate(num_users, txns_per_user, paid_ratio, history_ratio, seed=0):
+    """Creates `num_users` due subscribers and returns their synthetic Venmo transactions (newest first)."""
+    rng = random.Random(seed)
+    now = django_timezone.now()
+    date_start = now - timedelta(days=45)
+    date_next = now - timedelta(days=1)
+
+    group, _ = Group.objects.get_or_create(name=BENCH_GROUP)
+    plan = SubscriptionPlan.objects.create(plan_name="Bench", plan_description="Benchmark plan", group=group)
+    plan_cost = PlanCost.objects.create(plan=plan, recurrence_period=1, recurrence_unit=MONTH, cost=PLAN_COST)
+
+    user_model = get_user_model()
+    user_model.objects.bulk_create(
+        user_model(username=f"bench{i}", first_name=f"Bench{i}", email=f"bench{i}@email.com", password="!")
+        for i in range(num_users)
+    )
+    users = list(user_model.objects.filter(username__startswith="bench").order_by("id"))
+    group.user_set.add(*users)
+    VenmoAccount.objects.bulk_create(
+        VenmoAccount(user=user, venmo_username=f"bench{user.id}-venmo", venmo_id=str(10_000 + user.id))
+        for user in users
+    )
+    UserSubscription.objects.bulk_create(
+        UserSubscription(
+            user=user,
+            subscription=plan_cost,
+            date_billing_start=date_start - timedelta(days=31),
+            date_billing_last=date_start,
+            date_billing_next=date_next,
+            active=True,
+            cancelled=False,
+        )
+        for user in users
+    )
+    Bill.objects.bulk_create(
+        Bill(
+            user=user,
+            subscription=plan_cost,
+            amount=PLAN_COST,
+            date_transaction=date_start,
+            status=Bill.SendStatus.SENT,
+        )
+        for user in users
+    )
+    # `bulk_create` doesn't support multi-table inheritance
+    for host_payment_id, user in enumerate(rng.sample(users, int(len(users) * history_ratio)), start=1):
+        Payment.objects.create(
+            user=user,
+            subscription=plan_cost,
+            amount=PLAN_COST,
+            date_transaction=date_start,
+            host_payment_id=host_payment_id,
+            method=Payment.PaymentMethod.VENMO,
+        )
+
+    venmo_users = {
+        user.id: VenmoUser(
+            str(10_000 + user.id), f"bench{user.id}-venmo", None, None, None, None, None, None, None, None, None
+        )
+        for user in users
+    }
+    txns = []
+    next_txn_id = 1_000_000
+    for user in users:
+        counterparty = venmo_users[user.id]
+        for i in range(txns_per_user):
+            date_completed = now - timedelta(days=rng.uniform(0, 90))
+            if i == 0 and rng.random() < paid_ratio:
+                txn = _txn(next_txn_id, "pay", PLAN_COST, counterparty, ROOT_VENMO_USER, date_next)
+            elif rng.random() < 0.5:
+                amount = PLAN_COST + rng.randint(1, 20)
+                txn = _txn(next_txn_id, "pay", amount, counterparty, ROOT_VENMO_USER, date_completed)
+            else:
+                txn = _txn(next_txn_id, "pay", PLAN_COST, ROOT_VENMO_USER, counterparty, date_completed)
+            txns.append(txn)
+            next_txn_id += 1
+    txns.sort(key=lambda t: t.date_created, reverse=True)
+    return txns
+
+
+def run(num_users, args):
+    call_command("flush", interactive=False, verbosity=0)
+    txns = populate(num_users, args.txns_per_user, args.paid_ratio, args.history_ratio, seed=args.seed)
+    recorder = PhaseRecorder(trace_memory=not args.no_memory)
+    initial_payments = Payment.objects.count()
+    manager = BenchmarkManager(recorder, venmo_client=_venmo_client(txns), google_client=SimpleNamespace())
+    with recorder.recording():
+        with recorder.phase("selection + prefetch"):
+            manager.process_subscriptions()
+    return {
+        "users": num_users,
+        "venmo_txns": len(txns),
+        "matched": Payment.objects.count() - initial_payments,
+        "phases": recorder.stats,
+    }
+
+
+def _print_result(result):
+    print(f"\n{result['users']} users, {result['venmo_txns']} Venmo transactions, {result['matched']} matched payments")
+    print(f"{'phase':24} {'calls':>7} {'seconds':>9} {'queries':>8} {'peak KiB':>10}")
+    for name, stats in result["phases"].items():
+        print(f"{name:24} {stats['calls']:7} {stats['seconds']:9.3f} {stats['queries']:8} {stats['peak_kib']:10.1f}")
+    total = sum(stats["seconds"] for stats in result["phases"].values())
+    total_queries = sum(stats["queries"] for stats in result["phases"].values())
+    print(f"{'total':24} {'':7} {total:9.3f} {total_queries:8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[100, 1000], help="the scales (number of users) to run")
+    parser.add_argument("--txns-per-user", type=int, default=5, help="synthetic Venmo transactions per user")
+    parser.add_argument("--paid-ratio", type=float, default=0.5, help="share of users that already paid their bill")
+    parser.add_argument("--history-ratio", type=float, default=0.25, help="share of users with a prior payment")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc, which slows down the run")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    logging.getLogger("payablesubs").setLevel(logging.WARNING)
+    settings.PAYABLESUBS_BILLING_ENABLED = True
+    settings.PAYABLESUBS_DRY_RUN = False
+    settings.PAYABLESUBS_VENMO_REQUESTS_PER_SECOND = 1_000_000
+    settings.PAYABLESUBS_GOOGLE_CONTACT_LABEL = None
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        results = [run(num_users, args) for num_users in args.users]
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            _print_result(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Benchmarks the billing run's `Bill` and `Payment` lookups with and without the indexes of migration 0008.
+
+A fresh (in-memory) database is populated with `--rows` `Bill`s and as many `Payment`s, spread across
+`--periods` monthly periods per user, with a `--pending-ratio` share of the bills still pending send. Each lookup
+the billing run makes is then timed (best of `--repeat`) and its query plan printed, first with the indexes, then
+again after dropping them.
+
+Usage (from the repository root):
+  python benchmarks/bench_indexes.py --rows 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sandbox.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.contrib.auth.models import Group  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.db.models import Max  # noqa: E402
+from django.utils import timezone as django_timezone  # noqa: E402
+from subscriptions.models import MONTH, PlanCost, SubscriptionPlan  # noqa: E402
+
+from payablesubs.management.commands._bulk import bulk_create_payments  # noqa: E402
+from payablesubs.models import Bill, Payment  # noqa: E402
+
+PLAN_COST = Decimal(2)
+# The billing run prefetches users in chunks of this size (see `BillingContext`)
+CHUNK_SIZE = 500
+
+
+def populate(num_rows, periods, pending_ratio, seed=0):
+    """Creates `num_rows` bills and payments, `periods` per user, and returns the users' ids."""
+    rng = random.Random(seed)
+    now = django_timezone.now()
+    num_users = max(1, num_rows // periods)
+
+    group = Group.objects.create(name="Benchmark Subscribers")
+    plan = SubscriptionPlan.objects.create(plan_name="Bench", plan_description="Benchmark plan", group=group)
+    plan_cost = PlanCost.objects.create(plan=plan, recurrence_period=1, recurrence_unit=MONTH, cost=PLAN_COST)
+
+    user_model = get_user_model()
+    user_model.objects.bulk_create(
+        user_model(username=f"bench{i}", email=f"bench{i}@email.com", password="!") for i in range(num_users)
+    )
+    user_ids = list(user_model.objects.filter(username__startswith="bench").values_list("id", flat=True))
+
+    dates = [now - timedelta(days=31 * period) for period in range(periods)]
+    Bill.objects.bulk_create(
+        (
+            Bill(
+                user_id=user_id,
+                subscription=plan_cost,
+                amount=PLAN_COST,
+                date_transaction=date,
+                status=Bill.SendStatus.PENDING if rng.random() < pending_ratio else Bill.SendStatus.SENT,
+            )
+            for user_id in user_ids
+            for date in dates
+        ),
+        batch_size=2000,
+    )
+    bulk_create_payments(
+        (
+            Payment(
+                user_id=user_id,
+                subscription=plan_cost,
+                amount=PLAN_COST,
+                date_transaction=date,
+                host_payment_id=host_payment_id,
+                method=Payment.PaymentMethod.VENMO,
+            )
+            for host_payment_id, (user_id, date) in enumerate(
+                ((user_id, date) for user_id in user_ids for date in dates), start=1
+            )
+        ),
+        batch_size=2000,
+    )
+    return user_ids
+
+
+def lookups(user_ids, plan_cost):
+    """Returns the billing run's hot queries, by name."""
+    chunk = random.Random(1).sample(user_ids, min(CHUNK_SIZE, len(user_ids)))
+    since = django_timezone.now() - timedelta(days=45)
+    sample_bill = Bill.objects.order_by().filter(user_id=chunk[0]).first()
+    return {
+        "prefetch bills": Bill.objects.filter(user_id__in=chunk, date_transaction__gte=since).order_by(),
+        "prefetch last payments": (
+            Payment.objects.filter(user_id__in=chunk)
+            .order_by()
+            .values("user_id")
+            .annotate(last_date_transaction=Max("date_transaction"))
+        ),
+        "bill for period": Bill.objects.filter(
+            user_id=sample_bill.user_id, subscription=plan_cost, date_transaction=sample_bill.date_transaction
+        ).order_by(),
+        "pending bills": Bill.objects.filter(status=Bill.SendStatus.PENDING).order_by("date_transaction"),
+    }
+
+
+def measure(queries, repeat):
+    results = {}
+    for name, queryset in queries.items():
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = len(list(queryset.all()))
+            best = min(best, time.perf_counter() - start)
+        results[name] = {"rows": rows, "seconds": best, "plan": queryset.explain()}
+    return results
+
+
+def drop_indexes():
+    """Migrates back to before 0008, leaving only the foreign keys' own indexes."""
+    call_command("migrate", "payablesubs", "0007_bill_sending_status", verbosity=0)
+
+
+def _print_results(label, results):
+    print(f"\n{label}")
+    print(f"{'lookup':24} {'rows':>7} {'ms':>9}  plan")
+    for name, stats in results.items():
+        plan_lines = stats["plan"].splitlines() or [""]
+        print(f"{name:24} {stats['rows']:7} {stats['seconds'] * 1000:9.2f}  {plan_lines[0]}")
+        for line in plan_lines[1:]:
+            print(f"{'':43}{line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000, help="how many bills (and payments) to create")
+    parser.add_argument("--periods", type=int, default=100, help="billing periods per user")
+    parser.add_argument("--pending-ratio", type=float, default=0.01, help="share of bills still pending send")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per lookup, of which the fastest is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        user_ids = populate(args.rows, args.periods, args.pending_ratio, seed=args.seed)
+        queries = lookups(user_ids, PlanCost.objects.get())
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")  # so the planner knows how selective the pending status is
+        indexed = measure(queries, args.repeat)
+        drop_indexes()
+        unindexed = measure(queries, args.repeat)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    if args.json:
+        print(json.dumps({"rows": args.rows, "indexed": indexed, "unindexed": unindexed}, indent=2))
+    else:
+        print(f"{args.rows} bills and payments, {args.periods} periods per user")
+        _print_results("With indexes", indexed)
+        _print_results("Without indexes", unindexed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Load tests `PayableManager.process_subscriptions` end to end, with the real clients talking to `fake_apis`.
+
+Unlike `bench_billing.py`, whose mocked clients return instantly, every Venmo and People API call here goes over HTTP
+to a local fake server that adds `--latency` (and optionally fails or throttles requests), so the run's wall time
+reflects the external I/O that dominates real billing runs. Subscribers are populated like `bench_billing.py`, with
+`--expired-ratio` of them expired so their Google contact label is reconciled too.
+
+Usage (from the repository root):
+  python benchmarks/bench_load.py --users 200 --latency 0.05 --throttle-rate 0.02
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sandbox.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from bench_billing import ROOT_VENMO_USER, populate  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.db.models import Count  # noqa: E402
+from django.utils import timezone as django_timezone  # noqa: E402
+from fake_apis import Behavior, FakePeople, FakeVenmo, serve, venmo_transaction, venmo_user  # noqa: E402
+from google.oauth2.credentials import Credentials  # noqa: E402
+from subscriptions.models import UserSubscription  # noqa: E402
+
+import payablesubs.clients.google as google  # noqa: E402
+import payablesubs.clients.venmo as venmo  # noqa: E402
+from payablesubs.management.commands._payable_manager import PayableManager  # noqa: E402
+from payablesubs.models import Bill, Payment  # noqa: E402
+
+BENCH_CONTACT_LABEL = "bench"
+
+
+def _transaction_json(txn):
+    """Converts a `venmo_api` `Transaction` (as made by `bench_billing.populate`) to the JSON Venmo returns."""
+    actor, target = (venmo_user(user.id, user.username) for user in (txn.actor, txn.target))
+    return venmo_transaction(txn.id, txn.payment_type, txn.amount, actor, target, txn.date_completed)
+
+
+def _expire(ratio):
+    """Ends the billing of `ratio` of the subscriptions, so they're processed as expired."""
+    subscriptions = UserSubscription.objects.order_by("id")
+    expired_ids = list(subscriptions.values_list("id", flat=True)[: int(subscriptions.count() * ratio)])
+    UserSubscription.objects.filter(id__in=expired_ids).update(
+        date_billing_end=django_timezone.now() - timedelta(days=1)
+    )
+    return len(expired_ids)
+
+
+def run(args):
+    txns = populate(args.users, args.txns_per_user, args.paid_ratio, args.history_ratio, seed=args.seed)
+    expired = _expire(args.expired_ratio)
+    initial_payments = Payment.objects.count()
+
+    behavior = Behavior(args.latency, args.jitter, args.error_rate, args.throttle_rate, seed=args.seed)
+    venmo_api = FakeVenmo(profile=venmo_user(ROOT_VENMO_USER.id, ROOT_VENMO_USER.username))
+    venmo_api.transactions = [_transaction_json(txn) for txn in txns]
+    with serve(venmo_api, behavior) as venmo_server, serve(FakePeople(), behavior) as people_server:
+        settings.PAYABLESUBS_VENMO_API_HOST = f"{venmo_server.url}/v1"
+        settings.PAYABLESUBS_GOOGLE_API_HOST = f"{people_server.url}/"
+        manager = PayableManager(
+            venmo_client=venmo.build_client("bench-token"),
+            google_client=google.build_client(Credentials(token="bench-token")),
+        )
+        start = time.perf_counter()
+        manager.process_subscriptions()
+        seconds = time.perf_counter() - start
+
+    return {
+        "users": args.users,
+        "expired": expired,
+        "venmo_txns": len(txns),
+        "seconds": seconds,
+        "matched": Payment.objects.count() - initial_payments,
+        "bills": dict(Bill.objects.values_list("status").annotate(count=Count("id")).order_by()),
+        "venmo": {"calls": dict(venmo_server.api.calls), "statuses": dict(venmo_server.api.statuses)},
+        "people": {"calls": dict(people_server.api.calls), "statuses": dict(people_server.api.statuses)},
+        "api_calls": manager.metrics.summary().get("api_calls", {}),
+    }
+
+
+def _print_result(result):
+    print(f"\n{result['users']} users ({result['expired']} expired), {result['venmo_txns']} Venmo transactions")
+    print(f"{result['seconds']:.3f} seconds, {result['matched']} matched payments, bills: {result['bills']}")
+    for service in ("venmo", "people"):
+        print(f"{service:7} calls: {result[service]['calls']}")
+        print(f"{'':7} statuses: {result[service]['statuses']}")
+    if result["api_calls"]:
+        print(f"{'api call':32} {'calls':>7} {'errors':>7} {'seconds':>9} {'max':>7}")
+        for name, stats in result["api_calls"].items():
+            print(
+                f"{name:32} {stats['calls']:7} {stats['errors']:7} {stats['seconds']:9.3f} {stats['max_seconds']:7.3f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--txns-per-user", type=int, default=5, help="synthetic Venmo transactions per user")
+    parser.add_argument("--paid-ratio", type=float, default=0.5, help="share of users that already paid their bill")
+    parser.add_argument("--history-ratio", type=float, default=0.25, help="share of users with a prior payment")
+    parser.add_argument("--expired-ratio", type=float, default=0.1, help="share of subscriptions that have expired")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds each API request waits")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to how many seconds latency varies by")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of API requests failing with a 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of API requests throttled with a 429")
+    parser.add_argument(
+        "--requests-per-second", type=float, default=50, help="rate limit for sending Venmo payment requests"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    logging.getLogger("payablesubs").setLevel(logging.WARNING)
+    settings.PAYABLESUBS_BILLING_ENABLED = True
+    settings.PAYABLESUBS_DRY_RUN = False
+    settings.PAYABLESUBS_METRICS_ENABLED = True
+    settings.PAYABLESUBS_VENMO_REQUESTS_PER_SECOND = args.requests_per_second
+    # i.e.: read by `google` when it's imported, before the benchmark could change the setting
+    google.GOOGLE_CONTACT_GROUP_ID = BENCH_CONTACT_LABEL
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        result = run(args)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        _print_result(result)
+
+
+if __name__ == "__main__":
+    main()
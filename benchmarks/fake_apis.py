@@ -0,0 +1,316 @@
+"""Local stand-ins for the parts of the Venmo and Google People APIs that `payablesubs.clients` uses.
+
+`FakeVenmo` serves `my_profile`, `get_user_by_username`, paged `get_user_transactions` and `request_money`, and
+`FakePeople` serves `searchContacts`, `createContact`, `batchCreateContacts`, `connections.list`, `contactGroups.get`
+and `contactGroups.members.modify`. Both add configurable latency, server errors and 429 throttling (see `Behavior`),
+so that billing runs can be load tested end to end with the real clients, pointed at them with:
+
+  PAYABLESUBS_VENMO_API_HOST = "http://127.0.0.1:8001/v1"
+  PAYABLESUBS_GOOGLE_API_HOST = "http://127.0.0.1:8002/"
+
+Usage (from the repository root):
+  python benchmarks/fake_apis.py --latency 0.2 --jitter 0.1 --error-rate 0.01 --throttle-rate 0.05
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+VENMO_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+DEFAULT_PAGE_SIZE = 50
+
+
+@dataclass
+class Behavior:
+    """How a fake server misbehaves: each request waits `latency` (+/- up to `jitter`) seconds, then fails with a 500
+    (`error_rate`) or a 429 with a `Retry-After` header (`throttle_rate`)."""
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after: int = 1
+    seed: int = None
+
+    def __post_init__(self):
+        self._rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+
+    def outcome(self):
+        """Returns how long to wait, and the status to fail with (or `None`)."""
+        with self._lock:
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            roll = self._rng.random()
+        if roll < self.throttle_rate:
+            return delay, 429
+        if roll < self.throttle_rate + self.error_rate:
+            return delay, 500
+        return delay, None
+
+
+class NotFound(Exception):
+    pass
+
+
+class FakeApi:
+    """Base for the fake APIs, which route each request to a handler and count requests per route and status."""
+
+    routes = ()  # (method, path regex, handler name)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.statuses = Counter()
+
+    def handle(self, method, path, query, body):
+        for route_method, pattern, name in self.routes:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                with self.lock:
+                    self.calls[name] += 1
+                    return getattr(self, name)(query, body, *match.groups())
+        raise NotFound(f"{method} {path}")
+
+    def error(self, status):
+        return {"error": {"code": status, "message": "Fake error"}}
+
+
+def venmo_user(user_id, username):
+    return {"id": str(user_id), "username": username, "display_name": username, "is_group": False, "is_active": True}
+
+
+def venmo_transaction(story_id, action, amount, actor, target, date, note="fake"):
+    """Returns the JSON of a Venmo story (transaction) between the `venmo_user`s `actor` and `target`."""
+    date = datetime.fromtimestamp(date, timezone.utc) if isinstance(date, (int, float)) else date
+    date = date.strftime(VENMO_DATE_FORMAT)
+    return {
+        "id": str(story_id),
+        "type": "payment",
+        "date_created": date,
+        "date_updated": date,
+        "audience": "private",
+        "payment": {
+            "id": str(story_id),
+            "action": action,
+            "amount": float(amount),
+            "status": "settled",
+            "note": note,
+            "date_completed": date,
+            "actor": actor,
+            "target": {"user": target},
+        },
+    }
+
+
+class FakeVenmo(FakeApi):
+    """Fake Venmo API for `profile`, whose transactions (newest first) are `transactions`.
+
+    Any username is found (and given the next id) unless it's in `unknown_usernames`.
+    """
+
+    routes = (
+        ("GET", r"/v1/account", "account"),
+        ("GET", r"/v1/users", "search_users"),
+        ("GET", r"/v1/stories/target-or-actor/([^/]+)", "transactions_page"),
+        ("POST", r"/v1/payments", "payments"),
+    )
+
+    def __init__(self, profile=None, transactions=(), unknown_usernames=()):
+        super().__init__()
+        self.profile = profile or venmo_user(1, "fake-venmo")
+        self.transactions = list(transactions)
+        self.unknown_usernames = set(unknown_usernames)
+        self.requested = []  # the body of each `request_money` call
+        self.user_ids = {}
+
+    def account(self, query, body):
+        return 200, {"data": {"user": self.profile}}
+
+    def search_users(self, query, body):
+        username = query.get("query", "")
+        if not username or username in self.unknown_usernames:
+            return 200, {"data": []}
+        user_id = self.user_ids.setdefault(username, 100_000 + len(self.user_ids))
+        return 200, {"data": [venmo_user(user_id, username)]}
+
+    def transactions_page(self, query, body, user_id):
+        limit = int(query.get("limit", DEFAULT_PAGE_SIZE))
+        start = 0
+        if query.get("before_id"):
+            ids = [txn["id"] for txn in self.transactions]
+            start = ids.index(query["before_id"]) + 1 if query["before_id"] in ids else len(ids)
+        end = start + limit
+        return 200, {"data": self.transactions[start:end]}
+
+    def payments(self, query, body):
+        self.requested.append(body)
+        payment = {"id": str(len(self.requested)), "action": "charge", "amount": body["amount"], "note": body["note"]}
+        return 200, {"data": {"payment": payment}}
+
+
+class FakePeople(FakeApi):
+    """Fake Google People API with an initially empty address book and contact groups."""
+
+    routes = (
+        ("GET", r"/v1/people:searchContacts", "search_contacts"),
+        ("POST", r"/v1/people:createContact", "create_contact"),
+        ("POST", r"/v1/people:batchCreateContacts", "batch_create_contacts"),
+        ("GET", r"/v1/people/me/connections", "list_connections"),
+        ("GET", r"/v1/contactGroups/([^/:]+)", "get_group"),
+        ("POST", r"/v1/contactGroups/([^/:]+)/members:modify", "modify_members"),
+    )
+
+    def __init__(self):
+        super().__init__()
+        self.contacts = {}  # resourceName -> person
+        self.groups = {}  # contact group id -> member resourceNames
+
+    def _create(self, person):
+        resource_name = f"people/c{len(self.contacts) + 1}"
+        self.contacts[resource_name] = {**person, "resourceName": resource_name}
+        return self.contacts[resource_name]
+
+    def search_contacts(self, query, body):
+        results = [
+            {"person": person}
+            for person in self.contacts.values()
+            if any(email["value"] == query.get("query") for email in person.get("emailAddresses", []))
+        ]
+        return 200, {"results": results} if results else {}
+
+    def create_contact(self, query, body):
+        return 200, self._create(body)
+
+    def batch_create_contacts(self, query, body):
+        return 200, {"createdPeople": [{"person": self._create(c["contactPerson"])} for c in body["contacts"]]}
+
+    def list_connections(self, query, body):
+        page_size = int(query.get("pageSize", 100))
+        start = int(query.get("pageToken", 0))
+        people = list(self.contacts.values())
+        end = start + page_size
+        response = {"connections": people[start:end]}
+        if start + page_size < len(people):
+            response["nextPageToken"] = str(start + page_size)
+        return 200, response
+
+    def get_group(self, query, body, group_id):
+        members = sorted(self.groups.get(group_id, ()))
+        return 200, {"resourceName": f"contactGroups/{group_id}", "memberResourceNames": members}
+
+    def modify_members(self, query, body, group_id):
+        # i.e.: like the real API, unknown (deleted or merged) contacts are listed as not found rather than failing
+        to_add, to_remove = body.get("resourceNamesToAdd", ()), body.get("resourceNamesToRemove", ())
+        not_found = sorted(name for name in {*to_add, *to_remove} if name not in self.contacts)
+        members = self.groups.setdefault(group_id, set())
+        members.update(name for name in to_add if name in self.contacts)
+        members.difference_update(to_remove)
+        return 200, {"notFoundResourceNames": not_found} if not_found else {}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # i.e.: keep-alive, so the clients' connection pooling is exercised too
+    protocol_version = "HTTP/1.1"
+
+    def _respond(self, method):
+        api, behavior = self.server.api, self.server.behavior
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+
+        delay, status = behavior.outcome()
+        time.sleep(delay)
+        headers = {}
+        if status:
+            payload = api.error(status)
+            if status == 429:
+                headers["Retry-After"] = str(behavior.retry_after)
+        else:
+            try:
+                status, payload = api.handle(method, url.path, query, body)
+            except NotFound as e:
+                status, payload = 404, {"error": {"code": 404, "message": str(e)}}
+        with api.lock:
+            api.statuses[status] += 1
+
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        self._respond("GET")
+
+    def do_POST(self):
+        self._respond("POST")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, api, behavior=None, port=0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.api = api
+        self.behavior = behavior or Behavior()
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f"http://{host}:{port}"
+
+
+@contextmanager
+def serve(api, behavior=None, port=0):
+    """Serves `api` from a background thread for the duration of the context, yielding the `FakeServer`."""
+    server = FakeServer(api, behavior, port)
+    thread = threading.Thread(target=server.serve_forever, name=f"fake-{type(api).__name__}", daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--venmo-port", type=int, default=8001)
+    parser.add_argument("--google-port", type=int, default=8002)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds each request waits before responding")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to how many seconds latency varies by")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests failing with a 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests throttled with a 429")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    behavior = Behavior(args.latency, args.jitter, args.error_rate, args.throttle_rate, seed=args.seed)
+    with serve(FakeVenmo(), behavior, args.venmo_port) as venmo, serve(
+        FakePeople(), behavior, args.google_port
+    ) as people:
+        print(f'PAYABLESUBS_VENMO_API_HOST = "{venmo.url}/v1"')
+        print(f'PAYABLESUBS_GOOGLE_API_HOST = "{people.url}/"')
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            print(f"\nVenmo: {dict(venmo.api.calls)} {dict(venmo.api.statuses)}")
+            print(f"People: {dict(people.api.calls)} {dict(people.api.statuses)}")
+
+
+if __name__ == "__main__":
+    main()
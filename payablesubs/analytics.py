@@ -0,0 +1,201 @@
+"""Subscription analytics (MRR, billing, collections, churn and cohorts), aggregated in the database.
+
+Each figure is a single `GROUP BY` query, so computing them costs the same handful of queries regardless of how many
+subscriptions, `Bill`s or `Payment`s there are. Results can be cached for dashboards with
+`PAYABLESUBS_ANALYTICS_CACHE_TIMEOUT`.
+"""
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Exists, OuterRef, Q, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone as django_timezone
+from subscriptions import models as subscription_models
+from subscriptions.models import UserSubscription
+
+from payablesubs.models import Bill, Payment
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = "payablesubs:analytics:{months}"
+DEFAULT_MONTHS = 12
+
+# Average days per month, as used by `PlanCost.next_billing_datetime`
+_DAYS_PER_MONTH = Decimal("30.4368")
+# How many times per month a plan cost is billed, per `recurrence_period` of its `recurrence_unit`
+_BILLINGS_PER_MONTH = {
+    subscription_models.DAY: _DAYS_PER_MONTH,
+    subscription_models.WEEK: _DAYS_PER_MONTH / 7,
+    subscription_models.MONTH: Decimal(1),
+    subscription_models.YEAR: Decimal(1) / 12,
+}
+
+
+def monthly_cost(cost, recurrence_period, recurrence_unit):
+    """Returns what a plan `cost`, billed every `recurrence_period` `recurrence_unit`s, amounts to per month."""
+    billings_per_month = _BILLINGS_PER_MONTH.get(recurrence_unit)
+    if not billings_per_month or not recurrence_period:
+        return Decimal(0)  # i.e.: one-time (or sub-daily, which isn't recurring revenue we bill for)
+    return (cost * billings_per_month / recurrence_period).quantize(Decimal("0.01"))
+
+
+def _total_amount():
+    # i.e.: `Bill.amount` is nullable, so a month whose bills all lack one would otherwise total `None`
+    return Coalesce(Sum("amount"), Decimal(0))
+
+
+def _active_subscriptions():
+    return UserSubscription.objects.filter(active=True, cancelled=False)
+
+
+def mrr_by_plan():
+    """Returns the monthly recurring revenue of active subscriptions, per plan cost."""
+    rows = (
+        _active_subscriptions()
+        .order_by()
+        .values(
+            "subscription_id",
+            "subscription__plan__plan_name",
+            "subscription__cost",
+            "subscription__recurrence_period",
+            "subscription__recurrence_unit",
+        )
+        .annotate(subscribers=Count("id"))
+    )
+    plans = []
+    for row in rows:
+        cost = monthly_cost(
+            row["subscription__cost"], row["subscription__recurrence_period"], row["subscription__recurrence_unit"]
+        )
+        plans.append(
+            {
+                "plan_cost": row["subscription_id"],
+                "plan": row["subscription__plan__plan_name"],
+                "subscribers": row["subscribers"],
+                "mrr": cost * row["subscribers"],
+            }
+        )
+    return sorted(plans, key=lambda p: p["mrr"], reverse=True)
+
+
+def outstanding_bills():
+    """Returns the count and total of `Bill`s that are still unpaid, per month billed.
+
+    A bill is unpaid while its active subscription hasn't moved on to a later billing period, which is what
+    `PayableManager` does once it matches a payment.
+    """
+    unpaid = Exists(
+        _active_subscriptions().filter(
+            user_id=OuterRef("user_id"),
+            subscription_id=OuterRef("subscription_id"),
+            date_billing_next__lte=OuterRef("date_transaction"),
+        )
+    )
+    return list(
+        Bill.objects.filter(unpaid)
+        .annotate(month=TruncMonth("date_transaction"))
+        .order_by("month")
+        .values("month")
+        .annotate(bills=Count("id"), amount=_total_amount())
+    )
+
+
+def billed_by_month(since):
+    """Returns the count and total of `Bill`s created for each month since `since`."""
+    return list(
+        Bill.objects.filter(date_transaction__gte=since)
+        .annotate(month=TruncMonth("date_transaction"))
+        .order_by("month")
+        .values("month")
+        .annotate(bills=Count("id"), amount=_total_amount())
+    )
+
+
+def collected_by_month(since):
+    """Returns the count and total of `Payment`s received for each month since `since`."""
+    return list(
+        Payment.objects.filter(date_transaction__gte=since)
+        .annotate(month=TruncMonth("date_transaction"))
+        .order_by("month")
+        .values("month")
+        .annotate(payments=Count("pk"), amount=_total_amount())
+    )
+
+
+def churn_by_month(since):
+    """Returns how many subscriptions started, and how many ended (or are set to end), each month since `since`."""
+    started = (
+        UserSubscription.objects.filter(date_billing_start__gte=since)
+        .annotate(month=TruncMonth("date_billing_start"))
+        .order_by("month")
+        .values("month")
+        .annotate(count=Count("id"))
+    )
+    ended = (
+        UserSubscription.objects.filter(date_billing_end__gte=since, date_billing_end__lte=django_timezone.now())
+        .annotate(month=TruncMonth("date_billing_end"))
+        .order_by("month")
+        .values("month")
+        .annotate(count=Count("id"))
+    )
+    months = {}
+    for key, rows in (("started", started), ("ended", ended)):
+        for row in rows:
+            months.setdefault(row["month"], {"month": row["month"], "started": 0, "ended": 0})[key] = row["count"]
+    return [months[month] for month in sorted(months)]
+
+
+def cohorts(since):
+    """Returns, per month subscriptions started since `since`, how many started and how many are still active."""
+    return list(
+        UserSubscription.objects.filter(date_billing_start__gte=since)
+        .annotate(cohort=TruncMonth("date_billing_start"))
+        .order_by("cohort")
+        .values("cohort")
+        .annotate(started=Count("id"), active=Count("id", filter=Q(active=True, cancelled=False)))
+    )
+
+
+def compute(months=DEFAULT_MONTHS):
+    """Computes every figure, covering the last `months` months where they're by month."""
+    since = django_timezone.now() - timedelta(days=float(_DAYS_PER_MONTH) * months)
+    plans = mrr_by_plan()
+    outstanding = outstanding_bills()
+    return {
+        "computed": django_timezone.now(),
+        "months": months,
+        "mrr": sum((p["mrr"] for p in plans), Decimal(0)),
+        "active_subscriptions": sum(p["subscribers"] for p in plans),
+        "mrr_by_plan": plans,
+        "outstanding": {
+            "bills": sum(row["bills"] for row in outstanding),
+            "amount": sum((row["amount"] for row in outstanding), Decimal(0)),
+            "by_month": outstanding,
+        },
+        "billed_by_month": billed_by_month(since),
+        "collected_by_month": collected_by_month(since),
+        "churn_by_month": churn_by_month(since),
+        "cohorts": cohorts(since),
+    }
+
+
+def get_analytics(months=DEFAULT_MONTHS, refresh=False):
+    """Returns `compute(months)`, cached for `PAYABLESUBS_ANALYTICS_CACHE_TIMEOUT` seconds (if set).
+
+    Args:
+      refresh: if `True`, recompute (and re-cache) the figures even if they're cached
+    """
+    timeout = getattr(settings, "PAYABLESUBS_ANALYTICS_CACHE_TIMEOUT", None)
+    if not timeout:
+        return compute(months)
+
+    key = CACHE_KEY.format(months=months)
+    analytics = None if refresh else cache.get(key)
+    if analytics is None:
+        analytics = compute(months)
+        cache.set(key, analytics, timeout)
+        logger.debug(f"Cached analytics for {months=} for {timeout}s")
+    return analytics
@@ -0,0 +1,72 @@
+"""Pooled, thread-safe HTTP transports shared by the Venmo and Google clients, so connections are kept alive and
+reused between calls (and threads) rather than paying for a TLS handshake on every request."""
+import logging
+import threading
+
+import httplib2
+import requests
+from django.conf import settings
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.http import HttpRequest
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT_SECONDS = 30
+DEFAULT_CONNECT_RETRIES = 2
+
+logger = logging.getLogger(__name__)
+
+# `httplib2.Http` isn't thread-safe, so each thread gets its own (keep-alive) connection per host
+_local = threading.local()
+
+
+def _timeout():
+    return getattr(settings, "PAYABLESUBS_HTTP_TIMEOUT_SECONDS", DEFAULT_TIMEOUT_SECONDS)
+
+
+class PooledAdapter(HTTPAdapter):
+    """An `HTTPAdapter` with a default timeout, since `requests` otherwise waits forever on a stalled connection."""
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = _timeout()
+        return super().send(request, **kwargs)
+
+
+def pooled_session(session=None):
+    """Mounts a `PooledAdapter` sized by `PAYABLESUBS_HTTP_POOL_SIZE` on `session` (or a new one), and returns it.
+
+    `requests` keeps up to `pool_maxsize` connections per host alive; beyond that, connections opened by concurrent
+    threads are discarded after each request, so the pool should be at least as large as the number of workers.
+    Only connection errors are retried, since a request that reached Venmo may have been acted on.
+    """
+    session = session if session else requests.Session()
+    pool_size = getattr(settings, "PAYABLESUBS_HTTP_POOL_SIZE", DEFAULT_POOL_SIZE)
+    adapter = PooledAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(total=DEFAULT_CONNECT_RETRIES, read=False, status=0, redirect=False),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def thread_http(credentials):
+    """Returns the calling thread's `AuthorizedHttp` for `credentials`, creating it on the thread's first call."""
+    http = getattr(_local, "http", None)
+    if http is None or http.credentials is not credentials:
+        logger.debug(f"Creating HTTP transport for thread {threading.current_thread().name}")
+        http = _local.http = AuthorizedHttp(credentials, http=httplib2.Http(timeout=_timeout()))
+    return http
+
+
+def thread_request_builder(credentials):
+    """Returns a `requestBuilder` for `googleapiclient.discovery.build` that sends each request over the calling
+    thread's `AuthorizedHttp`, so a single `Resource` can be shared between threads."""
+
+    def build_request(_http, *args, **kwargs):
+        return HttpRequest(thread_http(credentials), *args, **kwargs)
+
+    return build_request
@@ -1,13 +1,19 @@
 """Provides reusable access to `google-api-python-client` client"""
 import logging
+from datetime import timedelta
 from pathlib import Path
 
 from django.conf import settings
+from django.utils import timezone
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 
+from payablesubs import metrics
+from payablesubs.clients._http import thread_http, thread_request_builder
+from payablesubs.models import GoogleContact
+
 logger = logging.getLogger(__name__)
 
 # If modifying these scopes, delete the file token.json.
@@ -18,6 +24,14 @@ CREDENTIALS_FILE = CREDENTIALS_FOLDER / "credentials.json"
 TOKEN_FILE = CREDENTIALS_FOLDER / "token.json"
 GOOGLE_CONTACT_GROUP_ID = settings.PAYABLESUBS_GOOGLE_CONTACT_LABEL
 
+# Limits from https://developers.google.com/people/api/rest/v1/
+MAX_CONTACTS = 25000  # the most contacts (and so contact group members) a Google account can have
+CONNECTIONS_PAGE_SIZE = 1000
+BATCH_CREATE_SIZE = 200
+MODIFY_CHUNK_SIZE = 500
+
+DEFAULT_CACHE_TTL_DAYS = 30
+
 _INSTANCE = None
 
 
@@ -33,6 +47,9 @@ def get_client():
 
     Credentials logic taken from: https://developers.google.com/people/quickstart/python
 
+    The client can be shared between threads: each request is sent over the calling thread's own `AuthorizedHttp`,
+    which keeps its connection alive for that thread's later requests.
+
     Returns:
       A Resource object with methods for interacting with the service.
 
@@ -67,24 +84,100 @@ def get_client():
                 logger.debug(f"   ... writing {TOKEN_FILE} to file")
                 token.write(creds.to_json())
 
-        _INSTANCE = build("people", "v1", credentials=creds)
+        _INSTANCE = build_client(creds)
     return _INSTANCE
 
 
+def build_client(credentials):
+    """Returns a new People API client using `credentials`, whose requests are sent over the calling thread's
+    `AuthorizedHttp` to `PAYABLESUBS_GOOGLE_API_HOST` (i.e.: a fake server) if it's set."""
+    host = getattr(settings, "PAYABLESUBS_GOOGLE_API_HOST", None)
+    return build(
+        "people",
+        "v1",
+        http=thread_http(credentials),
+        requestBuilder=thread_request_builder(credentials),
+        static_discovery=True,
+        client_options={"api_endpoint": host} if host else None,
+    )
+
+
+def _execute(request, method):
+    """Executes a People API `request`, recording it as a call to `method`."""
+    with metrics.api_call("google", method):
+        return request.execute()
+
+
+def _get_cached_resource_names(users):
+    """Returns a mapping of user to cached contact resourceName, skipping any older than the configured TTL."""
+    ttl_days = getattr(settings, "PAYABLESUBS_GOOGLE_CONTACT_CACHE_TTL_DAYS", DEFAULT_CACHE_TTL_DAYS)
+    oldest = timezone.now() - timedelta(days=ttl_days)
+    users_by_id = {user.id: user for user in users}
+    cached = GoogleContact.objects.filter(user_id__in=users_by_id, date_cached__gte=oldest)
+    return {users_by_id[contact.user_id]: contact.resource_name for contact in cached}
+
+
+def _get_cached_resource_name(user):
+    return _get_cached_resource_names([user]).get(user)
+
+
+def _cache_resource_names(resource_names):
+    """Caches a mapping of user to contact resourceName."""
+    for user, resource_name in resource_names.items():
+        GoogleContact.objects.update_or_create(user=user, defaults={"resource_name": resource_name})
+
+
+def invalidate_resource_names(users):
+    """Forgets the cached contact resourceNames of `users`, so they're looked up from Google next time."""
+    GoogleContact.objects.filter(user__in=users).delete()
+
+
+def _search_resource_name(user, client, create=False):
+    """Searches Google for `user`'s contact (creating it, if `create`), and caches its resourceName."""
+    search_result = _execute(
+        client.people().searchContacts(query=user.email, readMask="emailAddresses"), "searchContacts"
+    )
+    if not search_result and create:
+        body = {
+            "emailAddresses": [{"value": user.email}],
+            "names": [{"givenName": user.first_name, "familyName": user.last_name}],
+        }
+        logger.info(f"Creating new Google contact for {user}")
+        person = _execute(client.people().createContact(body=body), "createContact")
+    elif not search_result or len(search_result["results"]) != 1:
+        logger.warning(f"Found unexpected {search_result=}")
+        raise Exception(f"{user.email} found unexpected results from Google")
+    else:
+        person = search_result["results"][0]["person"]
+
+    _cache_resource_names({user: person["resourceName"]})
+    return person["resourceName"]
+
+
+def _modify_user_membership(user, client, modification, create=False):
+    """Applies `modification` (`to_add` or `to_remove`) for `user`, using their cached resourceName if possible.
+
+    If the cached resourceName isn't found (i.e.: the contact was deleted or merged), it's invalidated and the
+    contact is searched for instead.
+    """
+    resource_name = _get_cached_resource_name(user)
+    if resource_name:
+        if not _modify_members(client, **{modification: [resource_name]}):
+            return resource_name
+        logger.warning(f"Cached {resource_name=} for {user} wasn't found, searching instead")
+        invalidate_resource_names([user])
+
+    resource_name = _search_resource_name(user, client, create=create)
+    if _modify_members(client, **{modification: [resource_name]}):
+        logger.warning(f"Contact {resource_name} for {user} wasn't found")
+    return resource_name
+
+
 def remove_contact_label(user, client=None):
     if not _is_enabled():
         return
     client = client if client else get_client()
-    search_result = client.people().searchContacts(query=user.email, readMask="emailAddresses").execute()
-    if not search_result or len(search_result["results"]) != 1:
-        logger.warning(f"Found unexpected {search_result=}")
-        raise Exception(f"{user.email} found unexpected results from Google")
-
-    person_resource_name = search_result["results"][0]["person"]["resourceName"]
-    body = {"resourceNamesToRemove": [person_resource_name]}
-    client.contactGroups().members().modify(
-        resourceName=f"contactGroups/{GOOGLE_CONTACT_GROUP_ID}", body=body
-    ).execute()
+    person_resource_name = _modify_user_membership(user, client, "to_remove")
     logger.debug(f"Removed {user} [{person_resource_name}] from contact group {GOOGLE_CONTACT_GROUP_ID}")
 
 
@@ -92,23 +185,173 @@ def add_contact_label(user, client=None):
     if not _is_enabled():
         return
     client = client if client else get_client()
+    person_resource_name = _modify_user_membership(user, client, "to_add", create=True)
+    logger.debug(f"Added {user} [{person_resource_name}] to contact group {GOOGLE_CONTACT_GROUP_ID}")
+
+
+def _chunked(values, size):
+    values = list(values)
+    for start in range(0, len(values), size):
+        end = start + size
+        yield values[start:end]
+
+
+def _get_group_members(client):
+    """Returns the resourceNames of every contact currently in the contact group."""
+    group = _execute(
+        client.contactGroups().get(resourceName=f"contactGroups/{GOOGLE_CONTACT_GROUP_ID}", maxMembers=MAX_CONTACTS),
+        "contactGroups.get",
+    )
+    return set(group.get("memberResourceNames", []))
 
-    search_result = client.people().searchContacts(query=user.email, readMask="emailAddresses").execute()
-    if not search_result:
+
+def _list_contacts_by_email(client):
+    """Returns a mapping of (lowercase) email address to resourceName for every existing contact."""
+    contacts = {}
+    page_token = None
+    while True:
+        request = (
+            client.people()
+            .connections()
+            .list(
+                resourceName="people/me",
+                personFields="emailAddresses",
+                pageSize=CONNECTIONS_PAGE_SIZE,
+                pageToken=page_token,
+            )
+        )
+        response = _execute(request, "connections.list")
+        for person in response.get("connections", []):
+            for email in person.get("emailAddresses", []):
+                contacts.setdefault(email["value"].lower(), person["resourceName"])
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            return contacts
+
+
+def _create_contacts(users, client):
+    """Creates contacts for `users` in batches. Returns a mapping of (lowercase) email to resourceName."""
+    created = {}
+    for batch in _chunked(users, BATCH_CREATE_SIZE):
         body = {
-            "emailAddresses": [{"value": user.email}],
-            "names": [{"givenName": user.first_name, "familyName": user.last_name}],
+            "contacts": [
+                {
+                    "contactPerson": {
+                        "emailAddresses": [{"value": user.email}],
+                        "names": [{"givenName": user.first_name, "familyName": user.last_name}],
+                    }
+                }
+                for user in batch
+            ],
+            "readMask": "emailAddresses",
         }
-        logger.info(f"Creating new Google contact for {user}")
-        person = client.people().createContact(body=body).execute()
-    elif len(search_result["results"]) > 1:
-        raise Exception(f"{user.email} Found results from {len(search_result['results'])} results from Google")
-    else:
-        person = search_result["results"][0]["person"]
+        logger.info(f"Creating {len(batch)} new Google contacts")
+        response = _execute(client.people().batchCreateContacts(body=body), "batchCreateContacts")
+        for created_person in response.get("createdPeople", []):
+            person = created_person["person"]
+            for email in person.get("emailAddresses", []):
+                created[email["value"].lower()] = person["resourceName"]
+    return created
 
-    person_resource_name = person["resourceName"]
-    body = {"resourceNamesToAdd": [person_resource_name]}
-    client.contactGroups().members().modify(
-        resourceName=f"contactGroups/{GOOGLE_CONTACT_GROUP_ID}", body=body
-    ).execute()
-    logger.debug(f"Added {user} [{person_resource_name}] to contact group {GOOGLE_CONTACT_GROUP_ID}")
+
+def _modify_members(client, to_add=(), to_remove=()):
+    """Adds and removes contact group members, in as few `modify` calls as the API allows.
+
+    Returns:
+      The resourceNames that weren't found (i.e.: contacts that were deleted or merged). `modify` still succeeds for
+      the rest, rather than failing the request.
+    """
+    resource_name = f"contactGroups/{GOOGLE_CONTACT_GROUP_ID}"
+    not_found = set()
+    for key, resource_names in (("resourceNamesToAdd", to_add), ("resourceNamesToRemove", to_remove)):
+        for chunk in _chunked(sorted(resource_names), MODIFY_CHUNK_SIZE):
+            request = client.contactGroups().members().modify(resourceName=resource_name, body={key: chunk})
+            response = _execute(request, "members.modify")
+            not_found.update((response or {}).get("notFoundResourceNames", ()))
+    return not_found
+
+
+def _add_members(users, resolved, client, to_add, members=frozenset()):
+    """Adds `to_add` (resourceNames of `users`, as `resolved`) to the contact group, whose current `members` are
+    skipped.
+
+    Users whose cached resourceName isn't found are invalidated, and their contacts looked up and added again.
+
+    Returns:
+      The resourceNames that were added.
+    """
+    not_found = _modify_members(client, to_add=to_add)
+    if not not_found:
+        return set(to_add)
+    stale = [user for user in users if resolved.get(user) in not_found]
+    logger.warning(f"{len(not_found)} cached contacts weren't found, looking up {len(stale)} contacts instead")
+    invalidate_resource_names(stale)
+    fresh = resolve_resource_names(stale, client=client, use_cache=False)
+    resolved.update(fresh)
+    retried = set(fresh.values()) - set(to_add) - members
+    still_not_found = _modify_members(client, to_add=retried)
+    if still_not_found:
+        logger.warning(f"Contacts {sorted(still_not_found)} weren't found")
+    return (set(to_add) - not_found) | (retried - still_not_found)
+
+
+def resolve_resource_names(users, client=None, use_cache=True):
+    """Returns a mapping of user to their contact's resourceName, creating contacts for users that lack one.
+
+    Cached resourceNames are used where available; the rest are resolved by listing all contacts once.
+    """
+    client = client if client else get_client()
+    resolved = _get_cached_resource_names(users) if use_cache else {}
+    uncached = [user for user in users if user not in resolved]
+    if not uncached:
+        return resolved
+
+    contacts = _list_contacts_by_email(client)
+    missing = [user for user in uncached if user.email.lower() not in contacts]
+    if missing:
+        contacts.update(_create_contacts(missing, client))
+    looked_up = {user: contacts[user.email.lower()] for user in uncached if user.email.lower() in contacts}
+    _cache_resource_names(looked_up)
+    resolved.update(looked_up)
+    return resolved
+
+
+def add_contact_labels(users, client=None):
+    """Adds the contacts of `users` to the contact group, creating missing contacts in batches.
+
+    Unlike `add_contact_label`, this resolves every user's contact at once, and adds them in (chunked) `modify` calls.
+    """
+    if not _is_enabled() or not users:
+        return set()
+    client = client if client else get_client()
+
+    resolved = resolve_resource_names(users, client=client)
+    to_add = _add_members(users, resolved, client, set(resolved.values()))
+    logger.info(f"Added {len(to_add)} contacts to contact group {GOOGLE_CONTACT_GROUP_ID}")
+    return to_add
+
+
+def reconcile_contact_label(users, client=None):
+    """Updates the contact group so that its members are exactly the contacts of `users`.
+
+    Rather than a search + modify per user, this fetches the group's members and all contacts once, creates any
+    missing contacts in a batch, and applies the whole difference with (chunked) `modify` calls.
+
+    Returns:
+      A tuple of the resourceNames that were added to and removed from the contact group.
+    """
+    if not _is_enabled():
+        return set(), set()
+    client = client if client else get_client()
+
+    current = _get_group_members(client)
+    resolved = resolve_resource_names(users, client=client)
+    to_add = _add_members(users, resolved, client, set(resolved.values()) - current, members=current)
+
+    # i.e.: `resolved` now holds the looked up resourceNames of any contacts whose cached ones weren't found
+    to_remove = current - set(resolved.values())
+    _modify_members(client, to_remove=to_remove)
+    logger.info(
+        f"Reconciled contact group {GOOGLE_CONTACT_GROUP_ID}: added {len(to_add)} and removed {len(to_remove)} contacts"
+    )
+    return to_add, to_remove
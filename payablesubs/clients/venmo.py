@@ -1,21 +1,148 @@
 """Provides reusable access to `venmo-api` client"""
 import logging
+import threading
+from collections import OrderedDict
+from datetime import timedelta
 from getpass import getpass
 from pathlib import Path
 
-from venmo_api import Client
+from django.conf import settings
+from django.utils import timezone
+from venmo_api import ApiClient, Client, PaymentApi, UserApi
+
+from payablesubs.clients._http import pooled_session
+from payablesubs.models import VenmoUserLookup
 
 CREDENTIALS_FOLDER = Path(".credentials")
 TOKEN_FILE = CREDENTIALS_FOLDER / "venmo.token"
 
+DEFAULT_LOOKUP_TTL_DAYS = 30
+DEFAULT_LOOKUP_NEGATIVE_TTL_HOURS = 24
+DEFAULT_LOOKUP_CACHE_SIZE = 10000
+# Keeps `__in` lookups below SQLite's limit on the number of query parameters
+_QUERY_CHUNK_SIZE = 500
+
 logger = logging.getLogger(__name__)
 _INSTANCE = None
 
+# In-process LRU of username -> (Venmo id or `None`, when it was looked up), in front of `VenmoUserLookup`
+_lookups = OrderedDict()
+_lookups_lock = threading.Lock()
+
+
+class PooledClient(Client):
+    """`venmo-api`'s `Client`, sending over a pooled `requests.Session` (shared between threads) to `host`.
+
+    `Client.__init__` fetches the profile straight away, and keeps its `ApiClient` private, so it's repeated here in
+    order to configure the `ApiClient` first.
+    """
+
+    def __init__(self, access_token, host=None):  # pylint: disable=super-init-not-called
+        api_client = ApiClient(access_token=access_token)
+        if host:
+            api_client.configuration["host"] = host.rstrip("/")
+        pooled_session(api_client.session)
+        self._Client__access_token = api_client.access_token
+        self._Client__api_client = api_client
+        self.user = UserApi(api_client)
+        self._Client__profile = self.user.get_my_profile()
+        self.payment = PaymentApi(profile=self._Client__profile, api_client=api_client)
+
+
+def build_client(access_token):
+    """Returns a new `PooledClient`, sending to `PAYABLESUBS_VENMO_API_HOST` (i.e.: a fake server) if it's set."""
+    return PooledClient(access_token, host=getattr(settings, "PAYABLESUBS_VENMO_API_HOST", None))
+
 
 def get_client():
     global _INSTANCE
     if not _INSTANCE:
         logger.debug("Initializing Venmo client...")
         access_token = TOKEN_FILE.read_text().strip() if TOKEN_FILE.exists() else getpass("Venmo Access Token: ")
-        _INSTANCE = Client(access_token)
+        _INSTANCE = build_client(access_token)
     return _INSTANCE
+
+
+def _chunked(values, size=_QUERY_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        end = start + size
+        yield values[start:end]
+
+
+def _is_fresh(venmo_id, date_cached, now):
+    """Whether a cached lookup is within its TTL. Usernames that weren't found are retried sooner."""
+    if venmo_id:
+        ttl = timedelta(days=getattr(settings, "PAYABLESUBS_VENMO_LOOKUP_TTL_DAYS", DEFAULT_LOOKUP_TTL_DAYS))
+    else:
+        ttl = timedelta(
+            hours=getattr(settings, "PAYABLESUBS_VENMO_LOOKUP_NEGATIVE_TTL_HOURS", DEFAULT_LOOKUP_NEGATIVE_TTL_HOURS)
+        )
+    return date_cached >= now - ttl
+
+
+def _remember(username, venmo_id, date_cached):
+    """Adds a lookup to the in-process LRU. Must be called holding `_lookups_lock`."""
+    _lookups[username] = (venmo_id, date_cached)
+    _lookups.move_to_end(username)
+    max_size = getattr(settings, "PAYABLESUBS_VENMO_LOOKUP_CACHE_SIZE", DEFAULT_LOOKUP_CACHE_SIZE)
+    while len(_lookups) > max_size:
+        _lookups.popitem(last=False)
+
+
+def get_cached_user_ids(usernames):
+    """Returns a mapping of username to cached Venmo id, for each of `usernames` with a lookup still within its TTL.
+
+    Usernames Venmo didn't find map to `None`, so callers can tell them apart from those that need looking up.
+    """
+    now = timezone.now()
+    cached, missing = {}, []
+    with _lookups_lock:
+        for username in set(usernames):
+            entry = _lookups.get(username)
+            if entry and _is_fresh(*entry, now):
+                _lookups.move_to_end(username)
+                cached[username] = entry[0]
+            else:
+                missing.append(username)
+
+    for chunk in _chunked(missing):
+        lookups = VenmoUserLookup.objects.filter(venmo_username__in=chunk)
+        with _lookups_lock:
+            for lookup in lookups:
+                if _is_fresh(lookup.venmo_id, lookup.date_cached, now):
+                    cached[lookup.venmo_username] = lookup.venmo_id
+                    _remember(lookup.venmo_username, lookup.venmo_id, lookup.date_cached)
+    return cached
+
+
+def cache_user_ids(user_ids):
+    """Caches a mapping of username to Venmo id, or to `None` for usernames Venmo doesn't know."""
+    if not user_ids:
+        return
+    now = timezone.now()
+    with _lookups_lock:
+        for username, venmo_id in user_ids.items():
+            _remember(username, venmo_id, now)
+    VenmoUserLookup.objects.bulk_create(
+        [VenmoUserLookup(venmo_username=username, venmo_id=venmo_id) for username, venmo_id in user_ids.items()],
+        update_conflicts=True,
+        unique_fields=["venmo_username"],
+        update_fields=["venmo_id", "date_cached"],
+    )
+
+
+def invalidate_user_ids(usernames):
+    """Forgets the cached lookups of `usernames`, so they're looked up from Venmo next time."""
+    usernames = list(usernames)
+    with _lookups_lock:
+        for username in usernames:
+            _lookups.pop(username, None)
+    for chunk in _chunked(usernames):
+        VenmoUserLookup.objects.filter(venmo_username__in=chunk).delete()
+
+
+def clear_lookup_cache():
+    """Empties the in-process LRU (the `VenmoUserLookup` table is left as is)."""
+    with _lookups_lock:
+        _lookups.clear()
@@ -0,0 +1,33 @@
+"""Deferred formatting for log arguments, so they're only rendered if a handler actually emits the record.
+
+Pass these as %-style arguments (i.e.: `logger.debug("Matched:\\n%s", LazyList(txns, txn_tostring))`), rather than
+interpolating them into an f-string.
+"""
+from django.conf import settings
+
+DEFAULT_LOG_MAX_ITEMS = 20
+
+
+class LazyList:
+    """Renders `items` one per line using `formatter`.
+
+    If `truncate`, only the first `PAYABLESUBS_LOG_MAX_ITEMS` are rendered, followed by a count of those left out.
+    """
+
+    __slots__ = ("items", "formatter", "truncate")
+
+    def __init__(self, items, formatter=str, truncate=True):
+        self.items = items
+        self.formatter = formatter
+        self.truncate = truncate
+
+    def __str__(self):
+        items = self.items
+        if self.truncate:
+            max_items = getattr(settings, "PAYABLESUBS_LOG_MAX_ITEMS", DEFAULT_LOG_MAX_ITEMS)
+            items = self.items[:max_items]
+        lines = [self.formatter(item) for item in items]
+        remaining = len(self.items) - len(lines)
+        if remaining > 0:
+            lines.append(f"... and {remaining} more")
+        return "\n".join(lines)
@@ -0,0 +1,143 @@
+"""Provides an asyncio-based `PayableManager`, which processes subscriptions concurrently"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone as django_timezone
+
+from payablesubs import metrics
+from payablesubs.management.commands._payable_manager import PayableManager
+from payablesubs.management.commands._request_dispatcher import RequestDispatcher
+from payablesubs.models import Bill
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 8
+
+
+class AsyncPayableManager(PayableManager):
+    """Extends `PayableManager` to process subscriptions concurrently on an asyncio event loop.
+
+    Select it with `DFS_MANAGER_CLASS = "payablesubs.management.commands._async_payable_manager.AsyncPayableManager"`.
+
+    Database work goes through Django's async ORM (and `sync_to_async`), so it still happens one query at a time on
+    a single connection. The blocking venmo-api calls run in a thread pool instead, with up to `concurrency`
+    subscriptions in flight at once. Per-subscription semantics (including dry runs) match `PayableManager`.
+    """
+
+    def __init__(self, *args, concurrency=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.concurrency = concurrency or getattr(settings, "PAYABLESUBS_ASYNC_CONCURRENCY", DEFAULT_CONCURRENCY)
+
+    def process_subscriptions(self):
+        with self.metrics.recording():
+            async_to_sync(self.aprocess_subscriptions)()
+        self.metrics.report()
+
+    async def aprocess_subscriptions(self):
+        """Async equivalent of `PayableManager.process_subscriptions`."""
+        self._start_run()
+        current = django_timezone.now()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        expired_subscriptions = [sub async for sub in self._expired_subscriptions(current)]
+        await asyncio.gather(*(bounded(sync_to_async(self.process_expired)(sub)) for sub in expired_subscriptions))
+
+        new_subscriptions = [sub async for sub in self._new_subscriptions(current)]
+        await asyncio.gather(*(bounded(sync_to_async(self.process_new)(sub)) for sub in new_subscriptions))
+
+        due_subscriptions = [sub async for sub in self._due_subscriptions(current)]
+        due_subscriptions = await sync_to_async(self._skip_processed)(due_subscriptions)
+        selected = {sub.id: (sub.date_billing_next, sub.date_billing_end) for sub in due_subscriptions}
+        if due_subscriptions:
+            await sync_to_async(self.context.load)(due_subscriptions)
+            await sync_to_async(self._get_txn_index)()
+        # bills are written in bulk up front, since they're claimed (in the database) before being sent
+        bills = await sync_to_async(self._create_bills)(due_subscriptions)
+        dispatcher = RequestDispatcher(self.venmo_client)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="async-manager") as executor:
+            await asyncio.gather(
+                *(
+                    bounded(self.aprocess_due(sub, bill, dispatcher, executor))
+                    for sub, bill in zip(due_subscriptions, bills)
+                )
+            )
+        await sync_to_async(self._flush_due_writes)(due_subscriptions, selected)
+
+        # i.e.: contact label removals, and bills left pending (by this or an earlier run)
+        await sync_to_async(self.drain_outbox)()
+        self._finish_run()
+
+    async def aprocess_due(self, subscription, bill, dispatcher, executor):
+        """Async equivalent of `process_due` for an already created `bill`, whose payment request is sent right away.
+
+        The bill's outbox message is then done once the outbox is drained, since the bill is no longer pending.
+        """
+        logger.debug("Processing due subscription=%r bill=%r", subscription, bill)
+        if self._should_send(bill):
+            await self._asend_bill(bill, dispatcher, executor)
+
+        matched_txn = await sync_to_async(self._check_payments)(subscription, bill)
+        await sync_to_async(self._update_due_subscription)(subscription, matched_txn)
+
+    def _create_bills(self, subscriptions):
+        """Gets (or creates) the bill for each of `subscriptions`, and writes the new ones."""
+        bills = [self._get_or_create_bill(sub) for sub in subscriptions]
+        self._flush_writes()
+        return bills
+
+    @metrics.timed("lock")
+    def _skip_processed(self, subscriptions):
+        """Drops subscriptions another worker is processing (or already has), per `PayableManager._lock_due`.
+
+        Row locks can't be held across the concurrent per-subscription coroutines, so they're released right away.
+        Claiming bills before sending them keeps overlapping workers from sending a payment request twice, while
+        `_flush_due_writes` locks the subscriptions again before writing their payments and changes.
+        """
+        with transaction.atomic():
+            return list(self._lock_due(subscriptions))
+
+    def _flush_due_writes(self, subscriptions, selected):
+        """Writes the payments and changes of `subscriptions`, in the same transaction as locking them again.
+
+        Those another worker processed since they were `selected` (i.e.: that it moved on, or is writing) are
+        dropped rather than written, since that worker's run records the same payment and billing period.
+        """
+        with transaction.atomic():
+            locked = self._lock_unchanged(selected)
+            processed = [sub for sub in subscriptions if sub.id not in locked]
+            for sub in processed:
+                logger.warning(f"Not saving {sub}'s payment or changes, since another worker processed it meanwhile")
+            self.writes.discard_subscriptions(processed)
+            self._flush_writes()
+
+    @staticmethod
+    def _should_send(bill):
+        return (
+            bill
+            and bill.status == Bill.SendStatus.PENDING
+            and settings.PAYABLESUBS_BILLING_ENABLED
+            and not settings.PAYABLESUBS_DRY_RUN
+        )
+
+    async def _asend_bill(self, bill, dispatcher, executor):
+        venmo_account = self.context.get_venmo_account(bill.user_id)
+        if not venmo_account:
+            return  # left pending, for `drain_outbox` to record as failed
+        if not await sync_to_async(dispatcher.claim)([bill]):
+            return
+        loop = asyncio.get_running_loop()
+        attempts, error = await loop.run_in_executor(executor, dispatcher.send_request, bill, venmo_account.venmo_id)
+        if error:
+            logger.error(f"Giving up sending {bill} after {attempts} attempts: {error}")
+            status = Bill.SendStatus.FAILED
+        else:
+            status = Bill.SendStatus.SENT
+        await sync_to_async(dispatcher.record_outcome)(bill, status, attempts, error or "")
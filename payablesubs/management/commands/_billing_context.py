@@ -0,0 +1,105 @@
+"""Run-scoped cache of the billing records `PayableManager` needs while processing due subscriptions."""
+import logging
+
+from django.db.models import Max
+
+from payablesubs.models import Bill, Payment, VenmoAccount
+
+logger = logging.getLogger(__name__)
+
+# Keeps `__in` lookups below SQLite's limit on the number of query parameters
+_QUERY_CHUNK_SIZE = 500
+
+
+def _chunked(values, size=_QUERY_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        end = start + size
+        yield values[start:end]
+
+
+class BillingContext:
+    """Loads `Bill`s, `VenmoAccount`s and `Payment` details for many subscriptions in a handful of queries.
+
+    Subscriptions are loaded in bulk via `load`, after which per-subscription processing only reads from (and
+    records its own changes to) memory.
+    """
+
+    def __init__(self):
+        self._user_ids = set()
+        self._bills = {}
+        self._venmo_accounts = {}
+        self._last_payment_dates = {}
+        self._payment_ids = set()
+        self._earliest_search_date = None
+
+    @staticmethod
+    def _bill_key(user_id, plan_cost_id, date_transaction):
+        return (user_id, plan_cost_id, date_transaction)
+
+    def load(self, subscriptions):
+        """Prefetches the records for any `subscriptions` whose user hasn't been loaded yet."""
+        subscriptions = [s for s in subscriptions if s.user_id not in self._user_ids]
+        user_ids = {s.user_id for s in subscriptions}
+        if not user_ids:
+            return
+
+        earliest_billing_date = min(s.date_billing_next for s in subscriptions)
+        for chunk in _chunked(user_ids):
+            bills = Bill.objects.filter(user_id__in=chunk, date_transaction__gte=earliest_billing_date).order_by()
+            for bill in bills:
+                # unique per key, see the `payablesubs_bill_unique_per_period` constraint
+                self._bills[self._bill_key(bill.user_id, bill.subscription_id, bill.date_transaction)] = bill
+
+            for venmo_account in VenmoAccount.objects.filter(user_id__in=chunk):
+                self._venmo_accounts[venmo_account.user_id] = venmo_account
+
+            last_payments = (
+                Payment.objects.filter(user_id__in=chunk)
+                .order_by()
+                .values("user_id")
+                .annotate(last_date_transaction=Max("date_transaction"))
+            )
+            for row in last_payments:
+                self._last_payment_dates[row["user_id"]] = row["last_date_transaction"]
+
+        for s in subscriptions:
+            search_date = self._last_payment_dates.get(s.user_id) or s.date_billing_start
+            if self._earliest_search_date is None or search_date < self._earliest_search_date:
+                self._earliest_search_date = search_date
+
+        self._user_ids |= user_ids
+        logger.debug(f"Prefetched billing details for {len(user_ids)} users")
+
+    def load_payment_ids(self, host_payment_ids):
+        """Prefetches which of `host_payment_ids` have already been recorded as a `Payment`."""
+        for chunk in _chunked(set(host_payment_ids)):
+            self._payment_ids.update(
+                Payment.objects.filter(host_payment_id__in=chunk).values_list("host_payment_id", flat=True)
+            )
+
+    def get_earliest_search_date(self):
+        """Returns the earliest date any loaded subscription's payment is searched from (see
+        `PayableManager._check_payments`), or `None` if none was loaded."""
+        return self._earliest_search_date
+
+    def get_bill(self, sub):
+        return self._bills.get(self._bill_key(sub.user_id, sub.subscription_id, sub.date_billing_next))
+
+    def add_bill(self, bill):
+        self._bills[self._bill_key(bill.user_id, bill.subscription_id, bill.date_transaction)] = bill
+
+    def get_venmo_account(self, user_id):
+        return self._venmo_accounts.get(user_id)
+
+    def get_last_payment_date(self, user_id):
+        return self._last_payment_dates.get(user_id)
+
+    def is_recorded_payment(self, host_payment_id):
+        return host_payment_id in self._payment_ids
+
+    def add_payment(self, payment):
+        self._payment_ids.add(payment.host_payment_id)
+        last_date = self._last_payment_dates.get(payment.user_id)
+        if not last_date or payment.date_transaction > last_date:
+            self._last_payment_dates[payment.user_id] = payment.date_transaction
@@ -0,0 +1,269 @@
+"""Keeps a warm `PayableManager` running, processing subscriptions as their deadlines come up.
+
+`BillingScheduler` is a min-heap of each subscription's next deadline: its start date while it's new, its next billing
+date while it's paid up, or the end of its grace period while its bill is awaiting payment. `BillingDaemon` sleeps
+until the earliest one, then runs `process_subscriptions` (whose selections are indexed, see migration 0011). While any
+bill is awaiting payment, it also runs every `poll_seconds`, which syncs only the Venmo transactions that are new since
+the last run, so payments are recognized within minutes rather than on the next cron run.
+"""
+import heapq
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone as django_timezone
+from subscriptions.models import UserSubscription
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_SECONDS = 300
+DEFAULT_RESYNC_SECONDS = 3600
+
+SCHEDULE_FIELDS = ("id", "active", "cancelled", "date_billing_start", "date_billing_next", "date_billing_end")
+
+
+def deadline(active, cancelled, date_billing_start, date_billing_next, date_billing_end, now):
+    """Returns when a subscription next needs processing, and whether its bill is awaiting payment.
+
+    The deadline is `None` for cancelled subscriptions, and for active ones without a billing date.
+    """
+    if cancelled:
+        return None, False
+    if not active:
+        return date_billing_start, False
+    if date_billing_next and date_billing_next > now:
+        return min(filter(None, (date_billing_next, date_billing_end))), False
+    # i.e.: billed, but not paid yet, so it's checked for payment until its grace period ends
+    return date_billing_end, date_billing_next is not None
+
+
+class BillingScheduler:
+    """Min-heap of subscriptions keyed by their next deadline. Thread-safe.
+
+    Rescheduling a subscription doesn't remove its previous heap entry. Stale entries are instead skipped when they
+    reach the top of the heap, since they no longer match the subscription's current deadline.
+    """
+
+    def __init__(self):
+        self._heap = []  # (deadline, subscription id)
+        self._deadlines = {}  # subscription id -> its current deadline
+        self._awaiting = set()  # ids of subscriptions whose bill is awaiting payment
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    @property
+    def awaiting_payment(self):
+        return len(self._awaiting)
+
+    def awaiting_ids(self):
+        with self._lock:
+            return set(self._awaiting)
+
+    def _schedule(self, sub_id, when, awaiting):
+        if awaiting:
+            self._awaiting.add(sub_id)
+        else:
+            self._awaiting.discard(sub_id)
+        if when is None:
+            self._deadlines.pop(sub_id, None)
+        elif self._deadlines.get(sub_id) != when:
+            self._deadlines[sub_id] = when
+            heapq.heappush(self._heap, (when, sub_id))
+
+    def schedule(self, subscription, now=None):
+        """(Re)schedules `subscription` by its current dates, waking up `wait`ers."""
+        now = now or django_timezone.now()
+        values = [getattr(subscription, field) for field in SCHEDULE_FIELDS]
+        with self._lock:
+            self._schedule(values[0], *deadline(*values[1:], now))
+        self._changed.set()
+
+    def unschedule(self, sub_id):
+        with self._lock:
+            self._deadlines.pop(sub_id, None)
+            self._awaiting.discard(sub_id)
+        self._changed.set()
+
+    def load(self, queryset=None, now=None):
+        """(Re)schedules the subscriptions of `queryset` (defaults to every one not cancelled) from the database.
+
+        Reloading every subscription also drops those that no longer exist.
+        """
+        now = now or django_timezone.now()
+        full = queryset is None
+        if full:
+            queryset = UserSubscription.objects.filter(cancelled=False)
+        rows = queryset.order_by().values_list(*SCHEDULE_FIELDS)
+        with self._lock:
+            if full:
+                self._heap, self._deadlines, self._awaiting = [], {}, set()
+            for sub_id, *dates in rows.iterator():
+                self._schedule(sub_id, *deadline(*dates, now))
+            if full:
+                self._heap = [(when, sub_id) for sub_id, when in self._deadlines.items()]
+                heapq.heapify(self._heap)
+        self._changed.set()
+
+    def _drop_stale(self):
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def next_deadline(self):
+        """Returns the earliest deadline, or `None` if nothing is scheduled."""
+        with self._lock:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def _pop_due(self, now):
+        due = []
+        self._drop_stale()
+        while self._heap and self._heap[0][0] <= now:
+            _, sub_id = heapq.heappop(self._heap)
+            del self._deadlines[sub_id]
+            due.append(sub_id)
+            self._drop_stale()
+        return due
+
+    def pop_due(self, now):
+        """Removes and returns the ids of the subscriptions whose deadline is at or before `now`."""
+        with self._lock:
+            return self._pop_due(now)
+
+    def defer(self, now, until):
+        """Moves the deadlines at or before `now` to `until`, returning the ids of the subscriptions deferred."""
+        with self._lock:
+            due = self._pop_due(now)
+            for sub_id in due:
+                self._deadlines[sub_id] = until
+                heapq.heappush(self._heap, (until, sub_id))
+        return due
+
+    def wait(self, seconds):
+        """Sleeps for up to `seconds`, returning early if a subscription is (re)scheduled (or `wake` is called)."""
+        self._changed.wait(max(0.0, seconds))
+        self._changed.clear()
+
+    def wake(self):
+        self._changed.set()
+
+
+class BillingDaemon:
+    """Runs `manager.process_subscriptions` whenever a deadline of `scheduler` comes up.
+
+    Subscriptions saved in this process (i.e.: by `process_expired`, or `add_subscription` calls) are rescheduled by
+    `post_save` signals while `connect`ed. Subscriptions changed by bulk updates (i.e.: the billing run's `UnitOfWork`)
+    are reloaded after each run, and changes made by other processes are picked up by a full reload every
+    `resync_seconds`.
+    """
+
+    def __init__(self, manager, scheduler=None, poll_seconds=None, resync_seconds=None):
+        self.manager = manager
+        self.scheduler = scheduler or BillingScheduler()
+        self.poll_seconds = poll_seconds or getattr(settings, "PAYABLESUBS_DAEMON_POLL_SECONDS", DEFAULT_POLL_SECONDS)
+        self.resync_seconds = resync_seconds or getattr(
+            settings, "PAYABLESUBS_DAEMON_RESYNC_SECONDS", DEFAULT_RESYNC_SECONDS
+        )
+        self.runs = 0
+        self._last_run = None
+        self._next_resync = None
+        self._stopped = threading.Event()
+
+    def _on_save(self, sender, instance, **kwargs):
+        self.scheduler.schedule(instance)
+
+    def _on_delete(self, sender, instance, **kwargs):
+        self.scheduler.unschedule(instance.id)
+
+    def connect(self):
+        post_save.connect(self._on_save, sender=UserSubscription, dispatch_uid="payablesubs_billing_daemon")
+        post_delete.connect(self._on_delete, sender=UserSubscription, dispatch_uid="payablesubs_billing_daemon")
+
+    def disconnect(self):
+        post_save.disconnect(sender=UserSubscription, dispatch_uid="payablesubs_billing_daemon")
+        post_delete.disconnect(sender=UserSubscription, dispatch_uid="payablesubs_billing_daemon")
+
+    def next_wakeup(self):
+        """Returns when the next run (or full reload) is due."""
+        wakeups = [self._next_resync, self.scheduler.next_deadline()]
+        if self.scheduler.awaiting_payment and self._last_run:
+            wakeups.append(self._last_run + timedelta(seconds=self.poll_seconds))
+        return min(filter(None, wakeups))
+
+    def _defer_past_deadlines(self, now):
+        """Retries subscriptions whose deadline has passed (i.e.: because their row was locked by another worker, or
+        the run failed) after `poll_seconds`, rather than re-running immediately, over and over."""
+        deferred = self.scheduler.defer(now, now + timedelta(seconds=self.poll_seconds))
+        if deferred:
+            logger.warning(f"{len(deferred)} subscriptions are still due, retrying in {self.poll_seconds} seconds")
+
+    def run_once(self, now):
+        """Processes subscriptions, then reschedules those that were due (or awaiting payment) by their new dates."""
+        due_ids = set(self.scheduler.pop_due(now))
+        logger.info(
+            f"Processing subscriptions for {len(due_ids)} deadlines and {self.scheduler.awaiting_payment} bills "
+            "awaiting payment"
+        )
+        self.manager.process_subscriptions()
+        self.runs += 1
+        self._last_run = django_timezone.now()
+        # i.e.: the subscriptions `process_subscriptions` may have changed with bulk updates, which send no signals
+        due_ids |= self.scheduler.awaiting_ids()
+        self.scheduler.load(UserSubscription.objects.filter(id__in=due_ids), now=self._last_run)
+        self._defer_past_deadlines(self._last_run)
+
+    def step(self):
+        """Reloads the schedule or processes subscriptions if either is due. Returns how many seconds to sleep.
+
+        Like Django's request cycle, database connections that errored or outlived `CONN_MAX_AGE` are closed before
+        and after, so a connection dropped while the daemon slept doesn't fail every later run.
+        """
+        close_old_connections()
+        try:
+            return self._step()
+        finally:
+            close_old_connections()
+
+    def _step(self):
+        now = django_timezone.now()
+        if self._next_resync is None or self._next_resync <= now:
+            self.scheduler.load(now=now)
+            self._next_resync = now + timedelta(seconds=self.resync_seconds)
+            logger.info(
+                f"Scheduled {len(self.scheduler)} subscriptions ({self.scheduler.awaiting_payment} awaiting payment), "
+                f"next due {self.scheduler.next_deadline()}"
+            )
+
+        wakeup = self.next_wakeup()
+        if wakeup <= now or (self.scheduler.awaiting_payment and self._last_run is None):
+            try:
+                self.run_once(now)
+            except Exception:
+                logger.exception(f"Failed processing subscriptions, retrying in {self.poll_seconds} seconds")
+                self._last_run = now
+                self.scheduler.load(now=now)
+                self._defer_past_deadlines(now)
+            wakeup = self.next_wakeup()
+        return (wakeup - django_timezone.now()).total_seconds()
+
+    def run_forever(self, max_runs=None):
+        """Processes subscriptions as their deadlines come up, until `stop` is called (or after `max_runs` runs)."""
+        self.connect()
+        try:
+            while not self._stopped.is_set() and (max_runs is None or self.runs < max_runs):
+                seconds = self.step()
+                if max_runs is not None and self.runs >= max_runs:
+                    break
+                logger.debug(f"Sleeping for up to {seconds:.0f} seconds")
+                self.scheduler.wait(seconds)
+        finally:
+            self.disconnect()
+
+    def stop(self):
+        self._stopped.set()
+        self.scheduler.wake()
@@ -0,0 +1,80 @@
+"""Run-scoped memo of `PlanCost` billing computations, which repeat across subscribers sharing a plan and due date."""
+import logging
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 1024
+
+
+class BillingMemo:
+    """Bounded (least recently used) cache of next billing datetimes and bill durations.
+
+    Both are keyed by `(plan_cost.id, date_billing_next)`, so they're only valid while plan costs don't change, i.e.:
+    for a single run. Call `clear` once the run is done.
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or getattr(settings, "PAYABLESUBS_BILLING_MEMO_SIZE", DEFAULT_MAX_SIZE)
+        self._lock = threading.Lock()
+        self._caches = {}
+        self._stats = {}
+
+    def _get(self, kind, key, compute):
+        with self._lock:
+            cache = self._caches.setdefault(kind, OrderedDict())
+            stats = self._stats.setdefault(kind, {"hits": 0, "misses": 0})
+            if key in cache:
+                cache.move_to_end(key)
+                stats["hits"] += 1
+                return cache[key]
+            stats["misses"] += 1
+        value = compute()
+        with self._lock:
+            cache[key] = value
+            if len(cache) > self.max_size:
+                cache.popitem(last=False)
+        return value
+
+    def next_billing_datetime(self, plan_cost, date_billing_next):
+        """Returns `plan_cost.next_billing_datetime(date_billing_next)`."""
+        return self._get(
+            "next_billing_datetime",
+            (plan_cost.id, date_billing_next),
+            lambda: plan_cost.next_billing_datetime(date_billing_next),
+        )
+
+    def duration(self, plan_cost, date_billing_next):
+        """Returns the months (and year) a bill for `plan_cost` due on `date_billing_next` is for, i.e.: "Mar 2023"."""
+        return self._get(
+            "duration", (plan_cost.id, date_billing_next), lambda: self._duration(plan_cost, date_billing_next)
+        )
+
+    def _duration(self, plan_cost, date_billing_next):
+        bill_end = self.next_billing_datetime(plan_cost, date_billing_next)
+
+        # Massaging billing start/end dates if they are close to month's boundaries
+        # i.e.: A monthly bill that starts on 2/28 should be for the month of Mar; not Feb.
+        adjusted_begin_date = date_billing_next + timedelta(days=7)
+        adjusted_bill_end = bill_end - timedelta(days=7)
+        duration = adjusted_begin_date.strftime("%b")
+        diff = bill_end - date_billing_next
+        if diff.days > 33:  # only include bill's end month if subscription is for > 1 months
+            duration += " - " + adjusted_bill_end.strftime("%b")
+        duration += adjusted_bill_end.strftime(" %Y")
+        return duration
+
+    def stats(self):
+        """Returns the hits, misses and current size of each cache."""
+        with self._lock:
+            return {kind: {**stats, "size": len(self._caches.get(kind, ()))} for kind, stats in self._stats.items()}
+
+    def clear(self):
+        """Empties the caches and resets their stats."""
+        with self._lock:
+            self._caches.clear()
+            self._stats.clear()
@@ -0,0 +1,42 @@
+"""Bulk persistence helpers for models `QuerySet.bulk_create` doesn't support."""
+from django.db import router, transaction
+from subscriptions.models import SubscriptionTransaction
+
+from payablesubs.models import Payment
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def bulk_create_payments(payments, batch_size=DEFAULT_BATCH_SIZE):
+    """Inserts `payments` in a few queries per batch, returning them.
+
+    `bulk_create` doesn't support multi-table inheritance, so the `SubscriptionTransaction` parent rows are bulk
+    created first (their UUID primary keys are generated client-side), then the `Payment` rows are inserted
+    pointing at them.
+    """
+    payments = list(payments)
+    if not payments:
+        return payments
+    using = router.db_for_write(Payment)
+    with transaction.atomic(using=using):
+        parents = [
+            SubscriptionTransaction(
+                id=p.id,
+                user_id=p.user_id,
+                subscription_id=p.subscription_id,
+                date_transaction=p.date_transaction,
+                amount=p.amount,
+            )
+            for p in payments
+        ]
+        SubscriptionTransaction.objects.using(using).bulk_create(parents, batch_size=batch_size)
+        for p in payments:
+            p.subscriptiontransaction_ptr_id = p.id
+        fields = Payment._meta.local_concrete_fields
+        for start in range(0, len(payments), batch_size):
+            end = start + batch_size
+            Payment.objects.using(using)._insert(payments[start:end], fields=fields, using=using)
+    for p in payments:
+        p._state.adding = False
+        p._state.db = using
+    return payments
@@ -0,0 +1,206 @@
+"""Durable outbox for the billing run's external side effects.
+
+Billing writes an `OutboxMessage` for each side effect (i.e.: a bill's Venmo payment request) in the same transaction
+as the change that causes it, so none is lost (or carried out for a change that was rolled back) if a run crashes.
+`OutboxWorker`s then claim and carry them out in batches, outside of the billing transactions, retrying failures with
+exponential backoff.
+
+Each message's `idempotency_key` identifies its side effect, so enqueueing it again is a no-op. Carrying one out twice
+is harmless too: a bill's payment request is only sent by whoever claims the (still PENDING) `Bill`, and contact
+labels are reconciled with the active subscriptions as a whole.
+"""
+import logging
+from datetime import timedelta, timezone
+from uuid import uuid4
+
+from django.conf import settings
+from django.utils import timezone as django_timezone
+from subscriptions.models import UserSubscription
+
+import payablesubs.clients.google as google
+from payablesubs.management.commands._request_dispatcher import RequestDispatcher
+from payablesubs.models import Bill, OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_SECONDS = 60
+DEFAULT_CLAIM_TIMEOUT_SECONDS = 600
+
+
+def bill_request(bill):
+    """Returns the (unsaved) message sending `bill`'s Venmo payment request.
+
+    It's keyed by the bill's period rather than its id, so that a bill another worker already created for the same
+    period (which `UnitOfWork` skips) doesn't get a second request either.
+    """
+    date_transaction = bill.date_transaction.astimezone(timezone.utc).isoformat()
+    return OutboxMessage(
+        kind=OutboxMessage.Kind.VENMO_REQUEST,
+        idempotency_key=f"venmo-request:{bill.user_id}:{bill.subscription_id}:{date_transaction}",
+        payload={"bill_id": str(bill.id)},
+    )
+
+
+def contact_label_removal(subscription):
+    """Returns the (unsaved) message removing the Google contact label of `subscription`'s (now expired) user."""
+    date_end = (
+        subscription.date_billing_end.astimezone(timezone.utc).isoformat() if subscription.date_billing_end else ""
+    )
+    return OutboxMessage(
+        kind=OutboxMessage.Kind.GOOGLE_REMOVE_LABEL,
+        idempotency_key=f"google-remove-label:{subscription.id}:{date_end}",
+        payload={"user_id": subscription.user_id},
+    )
+
+
+def enqueue(messages):
+    """Writes `messages`, skipping any whose side effect was already enqueued. Call it within the transaction of the
+    change causing them."""
+    OutboxMessage.objects.bulk_create(messages, ignore_conflicts=True)
+
+
+class OutboxWorker:
+    """Claims pending `OutboxMessage`s in batches and carries them out, one handler call per kind of message.
+
+    Concurrent workers (i.e.: several `process_outbox` processes) never claim the same message. Handlers get every
+    claimed message of their kind at once, and return the errors of those that failed for good; a handler raising
+    leaves its messages to be retried after a backoff, until they've been attempted `max_attempts` times.
+    """
+
+    def __init__(self, venmo_client=None, google_client=None, batch_size=None, max_attempts=None, retry_seconds=None):
+        self.venmo_client = venmo_client
+        self.google_client = google_client
+        self.batch_size = batch_size or getattr(settings, "PAYABLESUBS_OUTBOX_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+        self.max_attempts = max_attempts or getattr(settings, "PAYABLESUBS_OUTBOX_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)
+        self.retry_seconds = (
+            retry_seconds
+            if retry_seconds is not None
+            else getattr(settings, "PAYABLESUBS_OUTBOX_RETRY_SECONDS", DEFAULT_RETRY_SECONDS)
+        )
+        self.worker_id = uuid4().hex
+        self.handlers = {
+            OutboxMessage.Kind.VENMO_REQUEST: self.send_bill_requests,
+            OutboxMessage.Kind.GOOGLE_REMOVE_LABEL: self.sync_contact_label,
+        }
+
+    @staticmethod
+    def release_stale():
+        """Returns messages claimed longer than `PAYABLESUBS_OUTBOX_CLAIM_TIMEOUT_SECONDS` ago (i.e.: by a worker that
+        crashed) to the queue. Returns how many were released."""
+        timeout = getattr(settings, "PAYABLESUBS_OUTBOX_CLAIM_TIMEOUT_SECONDS", DEFAULT_CLAIM_TIMEOUT_SECONDS)
+        stale = OutboxMessage.objects.filter(
+            status=OutboxMessage.Status.PROCESSING,
+            date_claimed__lt=django_timezone.now() - timedelta(seconds=timeout),
+        )
+        released = stale.update(status=OutboxMessage.Status.PENDING)
+        if released:
+            logger.warning(f"Released {released} outbox messages claimed over {timeout} seconds ago")
+        return released
+
+    def claim(self, kinds=None):
+        """Marks up to `batch_size` available messages (of `kinds`, if given) as PROCESSING by this worker, and
+        returns them. Each is claimed with a conditional update, so no other worker gets it too."""
+        now = django_timezone.now()
+        available = OutboxMessage.objects.filter(status=OutboxMessage.Status.PENDING, date_available__lte=now)
+        if kinds is not None:
+            available = available.filter(kind__in=kinds)
+        ids = list(available.order_by("date_available", "id").values_list("id", flat=True)[: self.batch_size])
+        if not ids:
+            return []
+        OutboxMessage.objects.filter(id__in=ids, status=OutboxMessage.Status.PENDING).update(
+            status=OutboxMessage.Status.PROCESSING, claimed_by=self.worker_id, date_claimed=now
+        )
+        return list(
+            OutboxMessage.objects.filter(
+                id__in=ids, status=OutboxMessage.Status.PROCESSING, claimed_by=self.worker_id
+            ).order_by("id")
+        )
+
+    def process_batch(self, kinds=None):
+        """Claims and carries out one batch of messages. Returns how many were claimed."""
+        messages = self.claim(kinds)
+        by_kind = {}
+        for message in messages:
+            by_kind.setdefault(message.kind, []).append(message)
+        for kind, kind_messages in by_kind.items():
+            try:
+                errors = self.handlers[kind](kind_messages)
+            except Exception as e:
+                logger.exception(f"Failed processing {len(kind_messages)} {kind} outbox messages")
+                self._retry(kind_messages, f"{type(e).__name__}: {e}")
+            else:
+                self._finish(kind_messages, errors)
+        return len(messages)
+
+    def drain(self, kinds=None):
+        """Processes batches until no message (of `kinds`, if given) is available. Returns how many were processed.
+
+        Messages waiting out a retry backoff aren't available, so they're left for a later drain.
+        """
+        self.release_stale()
+        processed = 0
+        while claimed := self.process_batch(kinds):
+            processed += claimed
+        if processed:
+            logger.info(f"Processed {processed} outbox messages")
+        return processed
+
+    def _finish(self, messages, errors):
+        now = django_timezone.now()
+        for message in messages:
+            message.attempts += 1
+            message.date_processed = now
+            if message.id in errors:
+                message.status = OutboxMessage.Status.FAILED
+                message.last_error = errors[message.id]
+                logger.error(f"Gave up on outbox message {message}: {message.last_error}")
+            else:
+                message.status = OutboxMessage.Status.DONE
+        OutboxMessage.objects.bulk_update(messages, ["status", "attempts", "last_error", "date_processed"])
+
+    def _retry(self, messages, error):
+        now = django_timezone.now()
+        for message in messages:
+            message.attempts += 1
+            message.last_error = error
+            if message.attempts >= self.max_attempts:
+                message.status = OutboxMessage.Status.FAILED
+                message.date_processed = now
+                logger.error(f"Gave up on outbox message {message} after {message.attempts} attempts: {error}")
+            else:
+                message.status = OutboxMessage.Status.PENDING
+                message.date_available = now + timedelta(seconds=self.retry_seconds * 2 ** (message.attempts - 1))
+        OutboxMessage.objects.bulk_update(
+            messages, ["status", "attempts", "last_error", "date_available", "date_processed"]
+        )
+
+    def send_bill_requests(self, messages):
+        """Sends the payment requests of the messages' bills that are still PENDING, through a `RequestDispatcher`.
+
+        A bill that's no longer pending was already sent (or is being sent) by someone else, so its message is done.
+        """
+        bill_ids = [message.payload["bill_id"] for message in messages]
+        bills = {
+            str(bill.id): bill for bill in Bill.objects.filter(id__in=bill_ids).select_related("user", "subscription")
+        }
+        pending = [bill for bill in bills.values() if bill.status == Bill.SendStatus.PENDING]
+        if pending:
+            RequestDispatcher(self.venmo_client).dispatch(pending)
+
+        errors = {}
+        for message in messages:
+            bill = bills.get(message.payload["bill_id"])
+            if bill and bill.status == Bill.SendStatus.FAILED:
+                errors[message.id] = bill.send_error or "Failed to send the payment request"
+        return errors
+
+    def sync_contact_label(self, messages):
+        """Reconciles the Google contact label with the active subscriptions, which removes every expired user of
+        `messages` in one pass."""
+        active_subscriptions = UserSubscription.objects.filter(active=True, cancelled=False).select_related("user")
+        active_users = {sub.user for sub in active_subscriptions if sub.user and sub.user.email}
+        _, removed = google.reconcile_contact_label(active_users, client=self.google_client)
+        logger.info(f"Synced Google contacts for {len(messages)} expired subscriptions, removing {len(removed)}")
+        return {}
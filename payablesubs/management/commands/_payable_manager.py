@@ -1,32 +1,61 @@
 """Provides OOTB support to use Venmo for processing and requesting payments"""
 import logging
-from datetime import datetime, timedelta, timezone
+from datetime import timedelta
 
 from django.conf import settings
+from django.db import transaction
 from django.db.models import Q
+from django.db.models.functions import Mod
+from django.utils import timezone as django_timezone
 from subscriptions.management.commands._manager import Manager
+from subscriptions.models import UserSubscription
 
 import payablesubs.clients.google as google
 import payablesubs.clients.venmo as venmo
-from payablesubs.models import Bill, Payment, VenmoAccount
+from payablesubs import metrics
+from payablesubs.logformat import LazyList
+from payablesubs.management.commands._billing_context import BillingContext
+from payablesubs.management.commands._billing_memo import BillingMemo
+from payablesubs.management.commands._outbox import (
+    OutboxWorker,
+    bill_request,
+    contact_label_removal,
+    enqueue,
+)
+from payablesubs.management.commands._txn_index import (
+    STAGED_FIELDS,
+    PaymentRecord,
+    VenmoTransactionIndex,
+)
+from payablesubs.management.commands._unit_of_work import UnitOfWork
+from payablesubs.management.commands._venmo_sync import (
+    staged_payments_to,
+    sync_transactions,
+)
+from payablesubs.models import Bill, OutboxMessage, Payment
 
 logger = logging.getLogger(__name__)
 
-
-def _txn_tostring(t):
-    """Helper __str__ method to print out Venmo `Transaction` API model object passed in `t`."""
-    return (
-        f"{t.actor.username:19} {t.payment_type:6} {t.amount:6} to {t.target.username:19} "
-        f"on {datetime.fromtimestamp(t.date_completed, tz=timezone.utc)} for '{t.note}'"
-    )
+# How many due subscriptions are locked (and processed) per transaction
+LOCK_BATCH_SIZE = 500
 
 
 class PayableManager(Manager):
     """Extends `Manager` functionality with Venmo payments and requests."""
 
-    def __init__(self, venmo_client=None, google_client=None):
+    def __init__(self, venmo_client=None, google_client=None, shard=None, sync_venmo=True):
+        """
+        Args:
+          venmo_client: the `venmo-api` client to use. Defaults to `venmo.get_client()`
+          google_client: the `google-api-python-client` client to use. Defaults to `google.get_client()`
+          shard: an `(index, count)` tuple, to only process the subscriptions of users whose id % count == index
+          sync_venmo: if `False`, match payments against already synced Venmo transactions without fetching new ones
+        """
+        self.shard = shard
+        self.sync_venmo = sync_venmo
+        self.metrics = metrics.get_metrics()
         self.venmo_client = venmo_client
-        self.venmo_txns = []
+        self._start_run()
         if not venmo_client:
             self.venmo_client = venmo.get_client()
 
@@ -34,58 +63,175 @@ class PayableManager(Manager):
         if not google_client:
             self.google_client = google.get_client()
 
+    def _start_run(self):
+        """Resets the state cached for a single run of `process_subscriptions`."""
+        # Venmo transactions are fetched (and indexed) at most once per run
+        self.venmo_txns = None
+        self.context = BillingContext()
+        self.writes = UnitOfWork()
+        self.memo = BillingMemo()
+
+    def _finish_run(self):
+        """Releases the state cached for a single run, once it's done."""
+        logger.debug(f"Billing memo stats: {self.memo.stats()}")
+        self.memo.clear()
+
+    def _in_shard(self, queryset, user_field="user_id"):
+        """Filters `queryset` down to the rows belonging to this manager's shard (if any)."""
+        if not self.shard:
+            return queryset
+        index, count = self.shard
+        return queryset.annotate(shard=Mod(user_field, count)).filter(shard=index)
+
+    # Each selection is a range query on the date its rows are waiting for, ordered by that date (rather than
+    # `UserSubscription`'s default ordering), so it's served by one of migration 0011's indexes and only reads the
+    # subscriptions that need work today.
+    def _expired_subscriptions(self, current):
+        return self._in_shard(
+            UserSubscription.objects.filter(
+                Q(active=True) & Q(cancelled=False) & Q(date_billing_end__lte=current)
+            ).order_by("date_billing_end")
+        )
+
+    def _new_subscriptions(self, current):
+        return self._in_shard(
+            UserSubscription.objects.filter(
+                Q(active=False) & Q(cancelled=False) & Q(date_billing_start__lte=current)
+            ).order_by("date_billing_start")
+        )
+
+    def _due_subscriptions(self, current):
+        return self._in_shard(
+            UserSubscription.objects.filter(Q(active=True) & Q(cancelled=False) & Q(date_billing_next__lte=current))
+            .order_by("date_billing_next")
+            .select_related("user", "subscription", "subscription__plan")
+        )
+
+    def process_subscriptions(self):
+        """Calls all required subscription processing functions.
+
+        Follows `Manager.process_subscriptions`, but prefetches everything due subscriptions need up front.
+        """
+        self._start_run()
+        current = django_timezone.now()
+
+        with self.metrics.recording():
+            with self.metrics.phase("expired"):
+                for subscription in self._expired_subscriptions(current):
+                    self.process_expired(subscription)
+
+            with self.metrics.phase("new"):
+                for subscription in self._new_subscriptions(current):
+                    self.process_new(subscription)
+
+            with self.metrics.phase("prefetch"):
+                due_subscriptions = list(self._due_subscriptions(current))
+                self.context.load(due_subscriptions)
+            for start in range(0, len(due_subscriptions), LOCK_BATCH_SIZE):
+                end = start + LOCK_BATCH_SIZE
+                with transaction.atomic():
+                    with self.metrics.phase("lock"):
+                        locked = list(self._lock_due(due_subscriptions[start:end]))
+                    for subscription in locked:
+                        self.process_due(subscription)
+                    self._flush_writes()
+
+            self.drain_outbox()
+        self._finish_run()
+        self.metrics.report()
+
+    @metrics.timed("flush")
+    def _flush_writes(self):
+        """Writes the `Bill`s, `Payment`s and subscription changes collected since the last flush."""
+        self.writes.flush()
+
+    @metrics.timed("send")
+    def drain_outbox(self):
+        """Carries out the side effects enqueued by this (or an earlier) run, unless `process_outbox` workers do.
+
+        Venmo payment requests are only sent while billing is enabled, and not in 'dry run' mode.
+        """
+        if not getattr(settings, "PAYABLESUBS_OUTBOX_DRAIN_AFTER_RUN", True):
+            return
+        kinds = None
+        if not settings.PAYABLESUBS_BILLING_ENABLED or settings.PAYABLESUBS_DRY_RUN:
+            kinds = [kind for kind in OutboxMessage.Kind if kind != OutboxMessage.Kind.VENMO_REQUEST]
+        OutboxWorker(self.venmo_client, self.google_client).drain(kinds)
+
+    @staticmethod
+    def _lock_unchanged(selected):
+        """Locks the rows of the subscriptions in `selected` (a mapping of id to the `date_billing_next` and
+        `date_billing_end` they were selected with) for the current transaction, so no other worker processes them.
+
+        Returns the ids of those that were locked, skipping any whose lock is held by another worker, or that another
+        worker already moved on since they were selected (i.e.: overlapping shards, or a retried run).
+        """
+        locked = (
+            UserSubscription.objects.select_for_update(skip_locked=True)
+            .filter(id__in=list(selected), active=True, cancelled=False)
+            .order_by()
+            .values_list("id", "date_billing_next", "date_billing_end")
+        )
+        # i.e.: `select_for_update` is a no-op on SQLite
+        return {sub_id for sub_id, date_next, date_end in locked if selected[sub_id] == (date_next, date_end)}
+
+    @classmethod
+    def _lock_due(cls, subscriptions):
+        """Locks the rows of `subscriptions` for the current transaction, per `_lock_unchanged`, returning those that
+        were locked."""
+        locked = cls._lock_unchanged({sub.id: (sub.date_billing_next, sub.date_billing_end) for sub in subscriptions})
+        for sub in subscriptions:
+            if sub.id in locked:
+                yield sub
+            else:
+                logger.info(f"Skipping {sub}, which is locked or was already processed by another worker")
+
     def _generate_note(self, sub):
         plan_cost = sub.subscription
-        bill_end = plan_cost.next_billing_datetime(sub.date_billing_next)
-
-        # Massaging billing start/end dates if they are close to month's boundaries
-        # i.e.: A monthly bill that starts on 2/28 should be for the month of Mar; not Feb.
-        adjusted_begin_date = sub.date_billing_next + timedelta(days=7)
-        adjusted_bill_end = bill_end - timedelta(days=7)
-        duration = adjusted_begin_date.strftime("%b")
-        diff = bill_end - sub.date_billing_next
-        if diff.days > 33:  # only include bill's end month if subscription is for > 1 months
-            duration += " - " + adjusted_bill_end.strftime("%b")
-        duration += adjusted_bill_end.strftime(" %Y")
+        duration = self.memo.duration(plan_cost, sub.date_billing_next)
         note = f"{sub.user.first_name}'s {plan_cost.plan.plan_name} subscription for {duration}"
         return note
 
+    @metrics.timed("bill", per_subscription=True)
     def _get_or_create_bill(self, sub):
         user = sub.user
         plan_cost = sub.subscription
         amount_due = plan_cost.cost
-        query_bill = Bill.objects.filter(
-            Q(user=user) & Q(subscription=sub.subscription) & Q(date_transaction=sub.date_billing_next)
-        )
-        if query_bill.count() > 0:
-            if query_bill.count() > 1:
-                logger.error(f"Found multiple bills for sub={sub}: {query_bill}")
-            bill = query_bill.first()
-        else:
-            venmo_account = VenmoAccount.objects.filter(user=user).first()
+        bill = self.context.get_bill(sub)
+        if not bill:
+            venmo_account = self.context.get_venmo_account(user.id)
             if not venmo_account:
                 logger.warning(f"No VenmoAccount details for {user=}")
                 return False
 
             note = self._generate_note(sub)
-            if settings.PAYABLESUBS_BILLING_ENABLED and not settings.PAYABLESUBS_DRY_RUN:
-                logger.debug(f"Sending Venmo request with note: {note}")
-                self.venmo_client.payment.request_money(float(amount_due), note, venmo_account.venmo_id)
-            else:
+            bill = Bill(
+                user=user,
+                subscription=plan_cost,
+                amount=amount_due,
+                date_transaction=sub.date_billing_next,
+                note=note,
+            )
+            if not settings.PAYABLESUBS_BILLING_ENABLED:
                 logger.warning(f"Billing feature disabled. Not sending bill with note: {note}")
-            bill = Bill(user=user, subscription=plan_cost, amount=amount_due, date_transaction=sub.date_billing_next)
-            if not settings.PAYABLESUBS_DRY_RUN:
-                bill.save()
+                bill.status = Bill.SendStatus.NOT_SENT
+
+            if settings.PAYABLESUBS_DRY_RUN:
+                logger.warning(f"Not saving (or sending) bill with note while in 'dry run' mode: {note}")
+            else:
+                self.writes.add_bill(bill)
+                if bill.status == Bill.SendStatus.PENDING:
+                    self.writes.add_message(bill_request(bill))
+                self.context.add_bill(bill)
 
         return bill
 
     @staticmethod
     def _parse_txn_data(txn):
-        """Parse out `Payment.data` Venmo fields we want to persist in our backend."""
-        payer = txn.actor if txn.payment_type == "pay" else txn.target
+        """Parse out `Payment.data` Venmo fields we want to persist in our backend from `PaymentRecord` `txn`."""
         return {
-            "venmo_id": str(payer.id),
-            "venmo_username": payer.username,
+            "venmo_id": txn.counterparty_id,
+            "venmo_username": txn.counterparty_username,
             "amount": txn.amount,
             "payment_type": txn.payment_type,
             "date_created": txn.date_created,
@@ -93,57 +239,56 @@ class PayableManager(Manager):
             "date_completed": txn.date_completed,
         }
 
+    @metrics.timed("venmo sync")
+    def _get_txn_index(self):
+        """Returns the `VenmoTransactionIndex` of payments to us, syncing new Venmo transactions on first use."""
+        if self.venmo_txns is None:
+            with metrics.api_call("venmo", "my_profile"):
+                venmo_profile = self.venmo_client.my_profile()
+            logger.info(f"Syncing recent transactions associated with {venmo_profile.username}...")
+            persist = not settings.PAYABLESUBS_DRY_RUN
+            new_txns = sync_transactions(self.venmo_client, venmo_profile, persist=persist) if self.sync_venmo else []
+
+            # converted once into compact records, rather than `venmo_api` models with nested actor/target users. Only
+            # payments the prefetched subscriptions could match are loaded, rather than the entire staged history.
+            username = venmo_profile.username
+            since = self.context.get_earliest_search_date()
+            staged = staged_payments_to(venmo_profile, since).values_list(*STAGED_FIELDS)
+            records = [PaymentRecord.from_staged_values(values, username) for values in staged.iterator()]
+            if not persist:
+                records += [PaymentRecord.from_api_model(t, username) for t in new_txns]
+            self.venmo_txns = VenmoTransactionIndex(records)
+            self.context.load_payment_ids(t.id for t in self.venmo_txns.txns)
+            logger.debug(
+                "%d VENMO transactions are payments to us.\n%s", len(self.venmo_txns), LazyList(self.venmo_txns.txns)
+            )
+        return self.venmo_txns
+
+    @metrics.timed("match", per_subscription=True)
     def _check_payments(self, sub, current_bill):
         """Looks through recent `txns` to see if `current_bill` has been paid already."""
-        # populate recent venmo txns if we haven't already
-        if not self.venmo_txns:
-            venmo_profile = self.venmo_client.my_profile()
-            logger.info(f"Populating recent transactions associated with {venmo_profile.username}...")
-            txns = self.venmo_client.user.get_user_transactions(venmo_profile.id)
-
-            logger.debug(f"Found {len(txns)} VENMO transactions.")
-            # for t in txns:
-            #     logger.debug(_txn_tostring(t))
-
-            # We only care about "payments" to us, or completed "charges" we initiated...
-            # i.e.: We shouldn't match a payment we made to someone, or a charge initiated from someone else.
-            self.venmo_txns = [
-                t
-                for t in txns
-                if (t.payment_type == "pay" and t.target.username == venmo_profile.username)
-                or (t.payment_type == "charge" and t.actor.username == venmo_profile.username)
-            ]
-            txn_strs = [f"{_txn_tostring(t)}" for t in self.venmo_txns]
-            big_txn_str = "\n".join(txn_strs)
-            logger.debug(f"{len(self.venmo_txns)} / {len(txns)} from VENMO are payments to us.\n{big_txn_str}")
-
-        last_payment = Payment.objects.filter(user=sub.user).order_by("-date_transaction").first()
-        search_begin_date = last_payment.date_transaction if last_payment else sub.date_billing_start
-
-        venmo_acct = VenmoAccount.objects.filter(user=sub.user).first()
+        txn_index = self._get_txn_index()
+
+        last_payment_date = self.context.get_last_payment_date(sub.user_id)
+        search_begin_date = last_payment_date if last_payment_date else sub.date_billing_start
+
+        venmo_acct = self.context.get_venmo_account(sub.user_id)
         if not venmo_acct:
             logger.warning(f"There's no Venmo account details for {sub.user}!")
             return False
 
-        matched_txns = [
-            t
-            for t in self.venmo_txns
-            if (
-                (t.payment_type == "pay" and t.actor.username == venmo_acct.venmo_username)
-                or (t.payment_type == "charge" and t.target.username == venmo_acct.venmo_username)
-            )
-            and (datetime.fromtimestamp(t.date_completed, tz=timezone.utc) > search_begin_date)
-            and (t.amount == float(sub.subscription.cost))
-        ]
+        matched_txns = txn_index.find(venmo_acct.venmo_username, sub.subscription.cost, search_begin_date)
         logger.debug(
-            f"Matched {len(matched_txns)} transactions for {sub=} with {search_begin_date=}:\n"
-            f"{[_txn_tostring(t) for t in matched_txns]}"
+            "Matched %d transactions for sub=%s with search_begin_date=%s:\n%s",
+            len(matched_txns),
+            sub,
+            search_begin_date,
+            LazyList(matched_txns),
         )
 
         for t in matched_txns:
-            already_matched_txn = Payment.objects.filter(host_payment_id=t.id).first()
-            if already_matched_txn:
-                logger.warning(f"Already matched Payment {t.id=}: {_txn_tostring(t)}")
+            if self.context.is_recorded_payment(t.id):
+                logger.warning(f"Already matched Payment {t.id=}: {t}")
             else:
                 return Payment(
                     host_payment_id=t.id,
@@ -151,41 +296,53 @@ class PayableManager(Manager):
                     user=sub.user,
                     amount=sub.subscription.cost,
                     method=Payment.PaymentMethod.VENMO,
-                    date_transaction=datetime.fromtimestamp(t.date_completed, tz=timezone.utc),
+                    date_transaction=t.date_completed_datetime,
                     data=PayableManager._parse_txn_data(t),
                 )
         return None
 
     def process_due(self, subscription):
+        """Bills `subscription` and checks for its payment. Writes are collected in `self.writes` until flushed."""
+        self.context.load([subscription])
         bill = self._get_or_create_bill(subscription)
-        logger.debug(f"Processing due {subscription=} {bill=}")
+        logger.debug("Processing due subscription=%r bill=%r", subscription, bill)
         matched_txn = self._check_payments(subscription, bill)
+        self._update_due_subscription(subscription, matched_txn)
 
+    @metrics.timed("save", per_subscription=True)
+    def _update_due_subscription(self, subscription, matched_txn):
+        """Records `matched_txn` and moves `subscription` to its next billing period, or starts its grace period."""
         if settings.PAYABLESUBS_DRY_RUN:
             logger.warning(f"Not updating subscription or saving matched {matched_txn} while in 'dry run' mode...")
         elif matched_txn:
             # Update subscription details
-            matched_txn.save()
+            self.writes.add_payment(matched_txn)
+            self.context.add_payment(matched_txn)
             cost = subscription.subscription
-            next_billing = cost.next_billing_datetime(subscription.date_billing_next)
+            next_billing = self.memo.next_billing_datetime(cost, subscription.date_billing_next)
             subscription.date_billing_last = matched_txn.date_transaction
             subscription.date_billing_next = next_billing
             subscription.date_billing_end = None
-            subscription.save()
-            logger.info(f"{subscription} payment={matched_txn} processed successfully")
+            self.writes.update_subscription(subscription, "date_billing_last", "date_billing_next", "date_billing_end")
+            logger.info("%s payment=%s processed successfully", subscription, matched_txn)
         else:
             sub_end_date = subscription.date_billing_end
             grace_days = subscription.subscription.plan.grace_period
             end_dt = sub_end_date if sub_end_date else subscription.date_billing_next + timedelta(days=grace_days)
-            logger.info(f"{subscription} will automatically end on {end_dt}")
+            logger.info("%s will automatically end on %s", subscription, end_dt)
 
             if not subscription.date_billing_end:
                 subscription.date_billing_end = end_dt
-                subscription.save()
+                self.writes.update_subscription(subscription, "date_billing_end")
+
+    def process_expired(self, subscription):
+        # the subscription's changes are committed along with the side effects `notify_expired` enqueues
+        with transaction.atomic():
+            super().process_expired(subscription)
 
     def notify_expired(self, subscription):
-        # remove subscribed user of the associated label in Google contacts
-        email = subscription.user.email
-        logger.debug(f"Processing expired {subscription}: [{email=}]")
-        google.remove_contact_label(subscription.user, client=self.google_client)
-        logger.info(f"Successfully removed {email} from Google")
+        # subscribed users are removed from the associated label in Google contacts in one batch, once the outbox is
+        # drained
+        logger.debug(f"Processing expired {subscription}: [email={subscription.user.email}]")
+        if google.GOOGLE_CONTACT_GROUP_ID is not None:
+            enqueue([contact_label_removal(subscription)])
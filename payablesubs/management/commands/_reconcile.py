@@ -0,0 +1,144 @@
+"""Vectorized (NumPy) reconciliation of staged Venmo transactions against all outstanding `Bill`s at once."""
+import logging
+
+import numpy as np
+
+from payablesubs.management.commands._txn_index import to_cents
+
+logger = logging.getLogger(__name__)
+
+# Epoch seconds fit in 34 bits until the year 2514, leaving the high bits of an int64 for a group code
+_GROUP_STRIDE = 1 << 34
+
+
+def _epochs(dates):
+    return np.fromiter((int(d.timestamp()) for d in dates), dtype=np.int64, count=len(dates))
+
+
+def _group_codes(*keys_lists):
+    """Encodes each list of hashable keys as int64 codes, consistently across the lists."""
+    codes = {}
+    return [
+        np.fromiter((codes.setdefault(key, len(codes)) for key in keys), dtype=np.int64, count=len(keys))
+        for keys in keys_lists
+    ]
+
+
+def window_join(left_groups, left_start, left_end, right_groups, right_times):
+    """Finds, for each left row, the right rows in the same group with `left_start <= time < left_end`.
+
+    Returns:
+      A tuple of `order` (the right rows' indexes, sorted by group then time), and the `lo`/`hi` arrays such that
+      `order[lo[i]:hi[i]]` are the matching right rows for left row `i`.
+    """
+    order = np.lexsort((right_times, right_groups))
+    combined = right_groups[order] * _GROUP_STRIDE + right_times[order]
+    lo = np.searchsorted(combined, left_groups * _GROUP_STRIDE + left_start, side="left")
+    hi = np.searchsorted(combined, left_groups * _GROUP_STRIDE + left_end, side="left")
+    return order, lo, hi
+
+
+class Reconciliation:
+    """Result of reconciling `PaymentRecord`s against outstanding bills.
+
+    Attributes:
+      matched: `(bill, record)` pairs, where each is the other's only candidate
+      ambiguous: `(bill, records)` pairs, for bills with several candidate transactions (or whose only candidate
+        is also the only candidate of another bill)
+      unmatched_bills: bills without any candidate transaction (or without an amount to match one on)
+      unmatched_txns: records that aren't a candidate for any bill
+      settled_bills: how many bills were skipped, since a `Payment` already covers them
+    """
+
+    def __init__(self, matched, ambiguous, unmatched_bills, unmatched_txns, settled_bills):
+        self.matched = matched
+        self.ambiguous = ambiguous
+        self.unmatched_bills = unmatched_bills
+        self.unmatched_txns = unmatched_txns
+        self.settled_bills = settled_bills
+
+    def summary(self):
+        return {
+            "matched": [{"bill": str(bill.id), "host_payment_id": record.id} for bill, record in self.matched],
+            "ambiguous": [
+                {"bill": str(bill.id), "host_payment_ids": [r.id for r in records]} for bill, records in self.ambiguous
+            ],
+            "unmatched_bills": [str(bill.id) for bill in self.unmatched_bills],
+            "unmatched_txns": [record.id for record in self.unmatched_txns],
+            "settled_bills": self.settled_bills,
+        }
+
+
+def reconcile(records, bills, payments, venmo_usernames, seconds_before, seconds_after):
+    """Matches `PaymentRecord`s to `bills` on counterparty, amount and time window.
+
+    A record is a candidate for a bill if it's from the bill's user (per `venmo_usernames`, a mapping of user id to
+    Venmo username), for the bill's amount, and completed within `[date_transaction - seconds_before,
+    date_transaction + seconds_after)`. Bills with a `Payment` for the same user and plan cost in that window are
+    settled already, and records already recorded as a `Payment` are ignored.
+
+    Args:
+      records: `PaymentRecord`s of payments to us
+      bills: `Bill`s to reconcile
+      payments: existing `Payment`s (only `host_payment_id`, `user_id`, `subscription_id` and `date_transaction`
+        are used)
+      venmo_usernames: mapping of user id to Venmo username
+      seconds_before: how long before a bill's date a payment may be made
+      seconds_after: how long after a bill's date a payment may be made
+    """
+    recorded_ids = {p.host_payment_id for p in payments}
+    records = [r for r in records if r.id not in recorded_ids]
+    bill_starts = _epochs([b.date_transaction for b in bills]) - seconds_before
+    bill_ends = bill_starts + seconds_before + seconds_after
+
+    # drop bills already settled by a `Payment` in their window
+    bill_groups, payment_groups = _group_codes(
+        [(b.user_id, b.subscription_id) for b in bills], [(p.user_id, p.subscription_id) for p in payments]
+    )
+    _, lo, hi = window_join(
+        bill_groups, bill_starts, bill_ends, payment_groups, _epochs([p.date_transaction for p in payments])
+    )
+    outstanding = np.flatnonzero(hi == lo)
+    settled_bills = len(bills) - len(outstanding)
+    # bills without an amount can't be matched on it, so they're reported as unmatched
+    unpriced = [bills[i] for i in outstanding if bills[i].amount is None]
+    if unpriced:
+        logger.warning(f"Skipping {len(unpriced)} outstanding bills without an amount")
+    outstanding = np.array([i for i in outstanding if bills[i].amount is not None], dtype=np.int64)
+    bills = [bills[i] for i in outstanding]
+    bill_starts, bill_ends = bill_starts[outstanding], bill_ends[outstanding]
+
+    bill_groups, txn_groups = _group_codes(
+        [(venmo_usernames.get(b.user_id), to_cents(b.amount)) for b in bills],
+        [(r.counterparty_username, r.cents) for r in records],
+    )
+    txn_times = np.fromiter((r.date_completed for r in records), dtype=np.int64, count=len(records))
+    order, lo, hi = window_join(bill_groups, bill_starts, bill_ends, txn_groups, txn_times)
+    counts = hi - lo
+
+    # bills with a single candidate match it, unless another bill's single candidate is the same record
+    single = np.flatnonzero(counts == 1)
+    single_txns = order[lo[single]]
+    claims = np.bincount(single_txns, minlength=len(records))
+    unique = claims[single_txns] == 1
+    matched = [(bills[b], records[t]) for b, t in zip(single[unique], single_txns[unique])]
+    ambiguous_bills = np.concatenate([single[~unique], np.flatnonzero(counts > 1)])
+    ambiguous = []
+    for b in ambiguous_bills:
+        start, end = lo[b], hi[b]
+        ambiguous.append((bills[b], [records[t] for t in order[start:end]]))
+
+    # records outside of every bill's window
+    coverage = np.zeros(len(records) + 1, dtype=np.int64)
+    np.add.at(coverage, lo, 1)
+    np.add.at(coverage, hi, -1)
+    uncovered = order[np.cumsum(coverage[:-1]) == 0]
+    unmatched_txns = [records[t] for t in np.sort(uncovered)]
+
+    unmatched_bills = [bills[b] for b in np.flatnonzero(counts == 0)] + unpriced
+    logger.info(
+        f"Reconciled {len(records)} transactions against {len(bills) + len(unpriced)} outstanding bills: "
+        f"{len(matched)} matched, {len(ambiguous)} ambiguous, {len(unmatched_bills)} bills and {len(unmatched_txns)} "
+        "transactions unmatched"
+    )
+    return Reconciliation(matched, ambiguous, unmatched_bills, unmatched_txns, settled_bills)
@@ -0,0 +1,88 @@
+"""Writers that stream management command reports row by row, as text, CSV or JSON."""
+import csv
+import json
+from abc import ABC, abstractmethod
+
+TEXT = "text"
+CSV = "csv"
+JSON = "json"
+FORMATS = (TEXT, CSV, JSON)
+
+MIMETYPES = {TEXT: "text/plain", CSV: "text/csv", JSON: "application/json"}
+
+
+class Tee:
+    """File-like object that writes to every one of `streams`."""
+
+    def __init__(self, *streams):
+        self.streams = streams
+
+    def write(self, text):
+        for stream in self.streams:
+            stream.write(text)
+
+
+class ReportWriter(ABC):
+    """Writes rows (tuples of values for `fields`) to `stream` as they're produced, without keeping any of them.
+
+    Every write is a complete line, so `stream` may also be a Django `OutputWrapper`.
+    """
+
+    def __init__(self, stream, fields):
+        self.stream = stream
+        self.fields = fields
+        self.rows = 0
+
+    def begin(self):
+        pass
+
+    def write(self, row):
+        self._write(row)
+        self.rows += 1
+
+    @abstractmethod
+    def _write(self, row):
+        """Writes `row` to `stream`."""
+
+    def end(self):
+        pass
+
+
+class TextWriter(ReportWriter):
+    """One `str(row)` line per row (i.e.: per model instance, rather than per tuple of values)."""
+
+    def _write(self, row):
+        self.stream.write(f"{row}\n")
+
+
+class CsvWriter(ReportWriter):
+    """A header line, followed by one CSV line per row."""
+
+    def __init__(self, stream, fields):
+        super().__init__(stream, fields)
+        self._csv = csv.writer(stream, lineterminator="\n")
+
+    def begin(self):
+        self._csv.writerow(self.fields)
+
+    def _write(self, row):
+        self._csv.writerow(row)
+
+
+class JsonWriter(ReportWriter):
+    """A JSON array of objects, one per line."""
+
+    def _write(self, row):
+        prefix = "," if self.rows else "["
+        self.stream.write(prefix + json.dumps(dict(zip(self.fields, row)), default=str) + "\n")
+
+    def end(self):
+        self.stream.write("]\n" if self.rows else "[]\n")
+
+
+_WRITERS = {TEXT: TextWriter, CSV: CsvWriter, JSON: JsonWriter}
+
+
+def get_writer(report_format, stream, fields):
+    """Returns the `ReportWriter` for `report_format` (one of `FORMATS`)."""
+    return _WRITERS[report_format](stream, fields)
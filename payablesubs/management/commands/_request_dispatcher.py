@@ -0,0 +1,168 @@
+"""Sends the Venmo payment requests for pending `Bill`s through a bounded, rate-limited thread pool."""
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.utils import timezone
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import ConnectTimeout
+from urllib3.exceptions import NewConnectionError
+from venmo_api import HttpCodeError
+
+from payablesubs import metrics
+from payablesubs.models import Bill, VenmoAccount
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_REQUESTS_PER_SECOND = 2.0
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_SECONDS = 1.0
+
+# `HttpCodeError` only keeps its message, which includes the response's status code
+_STATUS_CODE = re.compile(r"-> (\d{3}) ")
+
+
+def never_reached_venmo(error):
+    """Whether `error` proves its request was never acted on by Venmo, so it's safe to send again.
+
+    That's the case when the connection couldn't be opened (i.e.: refused, or timed out connecting) or when Venmo
+    rate limited the request. Any other error (i.e.: a read timeout, or a 5xx response) may have come after Venmo
+    accepted the request, so sending it again could request the payment twice.
+    """
+    if isinstance(error, ConnectTimeout):
+        return True
+    if isinstance(error, RequestsConnectionError):
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+    if isinstance(error, HttpCodeError):
+        match = _STATUS_CODE.search(str(error))
+        return bool(match) and match.group(1) == "429"
+    return False
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` acquisitions per second, with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available, then consumes it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class RequestDispatcher:
+    """Sends Venmo payment requests for `Bill`s concurrently, retrying those that never reached Venmo with exponential
+    backoff.
+
+    Requests are sent from worker threads, while every `Bill`'s outcome is recorded from the calling thread.
+    """
+
+    def __init__(self, venmo_client, workers=None, requests_per_second=None, retries=None, backoff=None):
+        self.venmo_client = venmo_client
+        self.workers = workers or getattr(settings, "PAYABLESUBS_VENMO_REQUEST_WORKERS", DEFAULT_WORKERS)
+        rate = requests_per_second or getattr(
+            settings, "PAYABLESUBS_VENMO_REQUESTS_PER_SECOND", DEFAULT_REQUESTS_PER_SECOND
+        )
+        self.bucket = TokenBucket(rate)
+        self.retries = (
+            retries if retries is not None else getattr(settings, "PAYABLESUBS_VENMO_REQUEST_RETRIES", DEFAULT_RETRIES)
+        )
+        self.backoff = backoff if backoff is not None else DEFAULT_BACKOFF_SECONDS
+
+    def send_request(self, bill, venmo_id):
+        """Sends `bill`'s payment request. Returns the number of attempts made, and the last error (if any).
+
+        Only errors where the request never reached Venmo are retried (see `never_reached_venmo`).
+        """
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            self.bucket.acquire()
+            try:
+                logger.debug("Sending Venmo request with note: %s", bill.note)
+                with metrics.api_call("venmo", "request_money"):
+                    accepted = self.venmo_client.payment.request_money(float(bill.amount), bill.note, venmo_id)
+                if accepted is not False:
+                    return attempt + 1, None
+                return attempt + 1, "Venmo rejected the payment request"
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                if not never_reached_venmo(e):
+                    return attempt + 1, error
+            logger.warning(f"Attempt {attempt + 1} sending {bill} failed: {error}")
+        return self.retries + 1, error
+
+    @staticmethod
+    def claim(bills):
+        """Marks `bills` as SENDING, returning just those this worker claimed (i.e.: that were still PENDING).
+
+        This keeps concurrent workers (i.e.: shards) from sending the same payment request twice. A bill left
+        SENDING by a crashed worker isn't retried automatically, since its request may have been sent already.
+        """
+        claimed = []
+        for bill in bills:
+            if Bill.objects.filter(id=bill.id, status=Bill.SendStatus.PENDING).update(status=Bill.SendStatus.SENDING):
+                bill.status = Bill.SendStatus.SENDING
+                claimed.append(bill)
+        return claimed
+
+    def dispatch(self, bills):
+        """Sends payment requests for `bills`, recording each `Bill`'s outcome. Returns the number sent."""
+        bills = self.claim(bills)
+        if not bills:
+            return 0
+
+        user_ids = {bill.user_id for bill in bills}
+        venmo_ids = dict(VenmoAccount.objects.filter(user_id__in=user_ids).values_list("user_id", "venmo_id"))
+
+        sent = 0
+        logger.info(f"Sending {len(bills)} Venmo payment requests using {self.workers} workers...")
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="venmo-request") as pool:
+            futures = {}
+            for bill in bills:
+                venmo_id = venmo_ids.get(bill.user_id)
+                if not venmo_id:
+                    logger.warning(f"No VenmoAccount details for {bill}")
+                    self.record_outcome(bill, Bill.SendStatus.FAILED, 0, "No VenmoAccount details")
+                    continue
+                futures[pool.submit(self.send_request, bill, venmo_id)] = bill
+
+            for future in as_completed(futures):
+                bill = futures[future]
+                attempts, error = future.result()
+                if error:
+                    logger.error(f"Giving up sending {bill} after {attempts} attempts: {error}")
+                    self.record_outcome(bill, Bill.SendStatus.FAILED, attempts, error)
+                else:
+                    sent += 1
+                    self.record_outcome(bill, Bill.SendStatus.SENT, attempts)
+        logger.info(f"Sent {sent} / {len(bills)} Venmo payment requests")
+        return sent
+
+    @staticmethod
+    def record_outcome(bill, status, attempts, error=""):
+        """Saves the outcome of sending `bill`'s payment request."""
+        bill.status = status
+        bill.send_attempts += attempts
+        bill.send_error = error
+        bill.date_sent = timezone.now() if status == Bill.SendStatus.SENT else None
+        bill.save(update_fields=["status", "send_attempts", "send_error", "date_sent"])
@@ -0,0 +1,171 @@
+"""Lookup index over recent Venmo transactions used to match payments against due subscriptions."""
+import logging
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import ROUND_HALF_UP, Decimal
+
+logger = logging.getLogger(__name__)
+
+# The `StagedVenmoTransaction` fields `PaymentRecord.from_staged_values` expects, in order
+STAGED_FIELDS = (
+    "host_txn_id",
+    "payment_type",
+    "amount",
+    "actor_id",
+    "actor_username",
+    "target_id",
+    "target_username",
+    "date_created",
+    "date_updated",
+    "date_completed",
+)
+
+
+def to_cents(amount):
+    """Converts a `Decimal` (or float) dollar `amount` to integer cents."""
+    return int((Decimal(str(amount)) * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+class PaymentRecord:
+    """Compact, pre-normalized form of a Venmo transaction that paid us.
+
+    `payment_type` is the direction: a "pay" from the counterparty, or a completed "charge" we initiated.
+    """
+
+    __slots__ = (
+        "id",
+        "payment_type",
+        "counterparty_id",
+        "counterparty_username",
+        "cents",
+        "date_created",
+        "date_updated",
+        "date_completed",
+    )
+
+    def __init__(
+        self,
+        txn_id,
+        payment_type,
+        counterparty_id,
+        counterparty_username,
+        cents,
+        date_created,
+        date_updated,
+        date_completed,
+    ):
+        self.id = txn_id
+        self.payment_type = payment_type
+        self.counterparty_id = counterparty_id
+        self.counterparty_username = counterparty_username
+        self.cents = cents
+        self.date_created = date_created
+        self.date_updated = date_updated
+        self.date_completed = date_completed
+
+    @classmethod
+    def _from_fields(
+        cls,
+        username,
+        txn_id,
+        payment_type,
+        amount,
+        actor_id,
+        actor_username,
+        target_id,
+        target_username,
+        date_created,
+        date_updated,
+        date_completed,
+    ):
+        """Returns a record, or `None` if the transaction isn't a completed payment to `username`.
+
+        We only care about "payments" to us, or completed "charges" we initiated...
+        i.e.: We shouldn't match a payment we made to someone, or a charge initiated from someone else.
+        """
+        if date_completed is None:
+            return None
+        if payment_type == "pay" and target_username == username:
+            counterparty_id, counterparty_username = actor_id, actor_username
+        elif payment_type == "charge" and actor_username == username:
+            counterparty_id, counterparty_username = target_id, target_username
+        else:
+            return None
+        return cls(
+            int(txn_id),
+            payment_type,
+            str(counterparty_id),
+            counterparty_username,
+            to_cents(amount),
+            date_created,
+            date_updated,
+            date_completed,
+        )
+
+    @classmethod
+    def from_api_model(cls, txn, username):
+        """Returns a record for a `venmo_api` `Transaction`, or `None` if it isn't a payment to `username`."""
+        return cls._from_fields(
+            username,
+            txn.id,
+            txn.payment_type,
+            txn.amount,
+            txn.actor.id,
+            txn.actor.username,
+            txn.target.id,
+            txn.target.username,
+            txn.date_created,
+            txn.date_updated,
+            txn.date_completed,
+        )
+
+    @classmethod
+    def from_staged_values(cls, values, username):
+        """Returns a record for a `StagedVenmoTransaction.values_list(*STAGED_FIELDS)` row, or `None`."""
+        return cls._from_fields(username, *values)
+
+    @property
+    def amount(self):
+        return self.cents / 100
+
+    @property
+    def date_completed_datetime(self):
+        return datetime.fromtimestamp(self.date_completed, tz=timezone.utc)
+
+    def __str__(self):
+        return (
+            f"{self.counterparty_username:19} {self.payment_type:6} {self.amount:6} [{self.id}] "
+            f"on {self.date_completed_datetime}"
+        )
+
+
+class VenmoTransactionIndex:
+    """Indexes `PaymentRecord`s by (counterparty username, amount in cents).
+
+    Each key maps to a list of records sorted by `date_completed`, so finding the payments a subscriber made after
+    a given date is a dictionary lookup plus a bisect, rather than a scan over every transaction.
+    """
+
+    def __init__(self, records):
+        self.txns = [r for r in records if r is not None]
+        buckets = defaultdict(list)
+        for r in self.txns:
+            buckets[(r.counterparty_username, r.cents)].append(r)
+
+        self._keys = {}
+        for key, bucket in buckets.items():
+            bucket.sort(key=lambda r: r.date_completed)
+            self._keys[key] = ([r.date_completed for r in bucket], bucket)
+
+    def __len__(self):
+        return len(self.txns)
+
+    def find(self, venmo_username, amount, after):
+        """Returns records from `venmo_username` for `amount` (in dollars) completed after `after`, oldest first."""
+        entry = self._keys.get((venmo_username, to_cents(amount)))
+        if not entry:
+            return []
+        timestamps, bucket = entry
+        start = bisect_right(timestamps, after.timestamp())
+        return bucket[start:]
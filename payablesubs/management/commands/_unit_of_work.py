@@ -0,0 +1,77 @@
+"""Write-behind unit of work, so a batch of due subscriptions is persisted in a handful of bulk queries."""
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from subscriptions.models import UserSubscription
+
+from payablesubs.management.commands._bulk import (
+    DEFAULT_BATCH_SIZE,
+    bulk_create_payments,
+)
+from payablesubs.models import Bill, OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+class UnitOfWork:
+    """Collects new `Bill`s, `Payment`s and `OutboxMessage`s, and changed `UserSubscription` fields, until `flush`
+    writes them in bulk.
+
+    Until then, nothing is written: callers that need to read their own writes back (i.e.: `BillingContext`) keep
+    track of them in memory.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._bills = []
+        self._payments = []
+        self._messages = []
+        self._subscriptions = {}
+
+    def __len__(self):
+        return len(self._bills) + len(self._payments) + len(self._messages) + len(self._subscriptions)
+
+    def add_bill(self, bill):
+        self._bills.append(bill)
+
+    def add_payment(self, payment):
+        self._payments.append(payment)
+
+    def add_message(self, message):
+        """Adds an `OutboxMessage`, which is written in the same transaction as the changes causing it."""
+        self._messages.append(message)
+
+    def update_subscription(self, subscription, *fields):
+        """Records that `fields` of `subscription` changed, to be saved by `flush`."""
+        _, changed = self._subscriptions.setdefault(subscription.id, (subscription, set()))
+        changed.update(fields)
+
+    def discard_subscriptions(self, subscriptions):
+        """Drops the `Payment`s and changes collected for `subscriptions` (i.e.: that another worker processed)."""
+        plan_costs = {(sub.user_id, sub.subscription_id) for sub in subscriptions}
+        self._payments = [p for p in self._payments if (p.user_id, p.subscription_id) not in plan_costs]
+        for sub in subscriptions:
+            self._subscriptions.pop(sub.id, None)
+
+    def flush(self):
+        """Writes everything collected so far in one transaction, with a few bulk queries per model."""
+        if not len(self):
+            return
+        by_fields = defaultdict(list)
+        for subscription, fields in self._subscriptions.values():
+            by_fields[tuple(sorted(fields))].append(subscription)
+
+        with transaction.atomic():
+            # a bill another worker created for the same period already covers it
+            Bill.objects.bulk_create(self._bills, batch_size=self.batch_size, ignore_conflicts=True)
+            bulk_create_payments(self._payments, batch_size=self.batch_size)
+            # i.e.: the side effects of a bill that was skipped above were already enqueued along with it
+            OutboxMessage.objects.bulk_create(self._messages, batch_size=self.batch_size, ignore_conflicts=True)
+            for fields, subscriptions in by_fields.items():
+                UserSubscription.objects.bulk_update(subscriptions, fields, batch_size=self.batch_size)
+        logger.debug(
+            f"Flushed {len(self._bills)} bills, {len(self._payments)} payments, {len(self._messages)} outbox messages "
+            f"and {len(self._subscriptions)} subscription updates"
+        )
+        self._bills, self._payments, self._messages, self._subscriptions = [], [], [], {}
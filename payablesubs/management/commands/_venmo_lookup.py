@@ -0,0 +1,78 @@
+"""Resolves Venmo usernames to Venmo user ids concurrently, through a bounded and rate-limited thread pool."""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+import payablesubs.clients.venmo as venmo
+from payablesubs import metrics
+from payablesubs.management.commands._request_dispatcher import (
+    DEFAULT_REQUESTS_PER_SECOND,
+    DEFAULT_WORKERS,
+    TokenBucket,
+)
+from payablesubs.models import VenmoAccount
+
+logger = logging.getLogger(__name__)
+
+_FAILED = object()  # a lookup that failed (i.e.: a network error), which isn't cached
+
+
+class VenmoUserResolver:
+    """Looks up the Venmo id of usernames, through the lookups cached by `venmo.get_cached_user_ids`.
+
+    Usernames already stored in a `VenmoAccount` aren't looked up again, and those Venmo doesn't know are cached too,
+    so retrying a typo'd username doesn't call the API again until its (shorter) TTL expires. Usernames whose lookup
+    failed (i.e.: a network error) are kept in `failed` instead, to tell them apart from those Venmo doesn't know.
+    """
+
+    def __init__(self, venmo_client, workers=None, requests_per_second=None):
+        self.venmo_client = venmo_client
+        self.workers = workers or getattr(settings, "PAYABLESUBS_VENMO_REQUEST_WORKERS", DEFAULT_WORKERS)
+        self.bucket = TokenBucket(
+            requests_per_second
+            or getattr(settings, "PAYABLESUBS_VENMO_REQUESTS_PER_SECOND", DEFAULT_REQUESTS_PER_SECOND)
+        )
+        self.failed = set()
+
+    def _lookup(self, username):
+        """Returns `username`'s Venmo id, `None` if Venmo doesn't know it, or `_FAILED` if the lookup failed."""
+        self.bucket.acquire()
+        try:
+            with metrics.api_call("venmo", "get_user_by_username"):
+                venmo_user = self.venmo_client.user.get_user_by_username(username)
+        except Exception as e:
+            logger.warning(f"Failed to look up Venmo user {username}: {type(e).__name__}: {e}")
+            return _FAILED
+        if not venmo_user:
+            logger.warning(f"No Venmo user found for {username}")
+            return None
+        return str(venmo_user.id)
+
+    def resolve(self, usernames):
+        """Returns a mapping of each of `usernames` to its Venmo id, leaving out those that couldn't be found."""
+        usernames = set(usernames)
+        resolved = venmo.get_cached_user_ids(usernames)
+        missing = usernames - resolved.keys()
+        if missing:
+            stored = dict(
+                VenmoAccount.objects.filter(venmo_username__in=missing).values_list("venmo_username", "venmo_id")
+            )
+            venmo.cache_user_ids(stored)
+            resolved.update(stored)
+            missing -= stored.keys()
+        if missing:
+            missing = sorted(missing)
+            logger.info(f"Looking up {len(missing)} Venmo users using {self.workers} workers...")
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="venmo-lookup") as pool:
+                looked_up = dict(zip(missing, pool.map(self._lookup, missing)))
+            failed = {username for username, venmo_id in looked_up.items() if venmo_id is _FAILED}
+            looked_up = {username: venmo_id for username, venmo_id in looked_up.items() if username not in failed}
+            self.failed = (self.failed - looked_up.keys()) | failed
+            venmo.cache_user_ids(looked_up)
+            resolved.update(looked_up)
+        return {username: venmo_id for username, venmo_id in resolved.items() if venmo_id}
+
+    def resolve_one(self, username):
+        """Returns `username`'s Venmo id, or `None` if it couldn't be found (or its lookup failed, per `failed`)."""
+        return self.resolve([username]).get(username)
@@ -0,0 +1,132 @@
+"""Incrementally syncs Venmo transactions into the local `StagedVenmoTransaction` table."""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.db.models.functions import Coalesce
+from subscriptions.models import SubscriptionPlan
+
+from payablesubs import metrics
+from payablesubs.models import StagedVenmoTransaction, VenmoSyncCursor
+
+logger = logging.getLogger(__name__)
+
+
+# Fields of an already staged transaction that change as Venmo completes (or updates) it
+UPDATED_FIELDS = ["amount", "note", "date_updated", "date_completed"]
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def _rescan_since(cursor):
+    """Returns the epoch seconds from which transactions are fetched again, or `None` without a dated cursor.
+
+    A charge requested before the last sync may only have been completed (paid) since, so that's as far back as the
+    oldest charge we requested that's still pending, and at least the largest plan's grace period behind the cursor
+    (or `PAYABLESUBS_VENMO_SYNC_OVERLAP_SECONDS`, if set).
+    """
+    if not cursor or cursor.last_date_created is None:
+        return None
+    overlap = getattr(settings, "PAYABLESUBS_VENMO_SYNC_OVERLAP_SECONDS", None)
+    if overlap is None:
+        max_grace_days = SubscriptionPlan.objects.aggregate(days=Coalesce(Max("grace_period"), 0))["days"]
+        overlap = max_grace_days * SECONDS_PER_DAY
+    oldest_pending = StagedVenmoTransaction.objects.filter(
+        payment_type="charge", actor_id=cursor.venmo_id, date_completed__isnull=True
+    ).aggregate(date=Min("date_created"))["date"]
+    since = cursor.last_date_created - overlap
+    return since if oldest_pending is None else min(since, oldest_pending)
+
+
+def _reached_cursor(page, cursor, since):
+    """Whether `page` (newest first) goes back far enough that older pages don't need fetching.
+
+    That's once a page goes back past `since` (i.e.: the re-fetch window behind the cursor). Cursors without a date
+    (i.e.: from before it was recorded) are reached by the page that contains their transaction.
+    """
+    if not cursor or cursor.last_txn_id is None:
+        return False
+    if since is None:
+        return any(int(txn.id) == cursor.last_txn_id for txn in page)
+    return any(txn.date_created is not None and txn.date_created < since for txn in page)
+
+
+def _fetch_new_transactions(venmo_client, venmo_profile, cursor):
+    """Yields `venmo_profile`'s transactions (newest first) that are new or may have changed since `cursor`."""
+    max_pages = getattr(settings, "PAYABLESUBS_VENMO_SYNC_MAX_PAGES", None)
+    since = _rescan_since(cursor)
+    with metrics.api_call("venmo", "get_user_transactions"):
+        page = venmo_client.user.get_user_transactions(venmo_profile.id)
+    pages = 1
+    while page:
+        txns = [txn for txn in page if txn is not None]
+        for txn in txns:
+            if since is None or txn.date_created is None or txn.date_created >= since:
+                yield txn
+        if _reached_cursor(txns, cursor, since):
+            return
+
+        # `venmo_api` returns a `Page`, which knows how to fetch the next (older) page of transactions
+        get_next_page = getattr(page, "get_next_page", None)
+        if not callable(get_next_page) or (max_pages and pages >= max_pages):
+            return
+        with metrics.api_call("venmo", "get_user_transactions"):
+            page = get_next_page()
+        pages += 1
+
+
+def sync_transactions(venmo_client, venmo_profile, persist=True):
+    """Fetches transactions newer than the persisted cursor for `venmo_profile` (and those in the re-fetch window
+    behind it, per `_rescan_since`), staging them and advancing the cursor.
+
+    Pages are fetched before the cursor is locked, so the lock (and the transaction holding it) is only held while
+    staging. Concurrent syncs may fetch the same transactions, which are upserted.
+
+    Args:
+      venmo_client: the `venmo-api` client used to fetch transactions
+      venmo_profile: the `venmo_api` `User` whose transactions are synced
+      persist: if `False` (i.e.: dry run), new transactions aren't saved and the cursor isn't advanced
+
+    Returns:
+      The fetched `venmo_api` `Transaction`s, newest first.
+    """
+    venmo_id = str(venmo_profile.id)
+    cursor = VenmoSyncCursor.objects.filter(venmo_id=venmo_id).first()
+    logger.debug(f"Syncing Venmo transactions for {venmo_profile.username} since {cursor=}")
+    new_txns = list(_fetch_new_transactions(venmo_client, venmo_profile, cursor))
+    logger.info(f"Fetched {len(new_txns)} new (or recently changed) VENMO transactions for {venmo_profile.username}")
+    if not persist or not new_txns:
+        return new_txns
+
+    # i.e.: a transaction first staged while pending is updated once it's completed
+    StagedVenmoTransaction.objects.bulk_create(
+        [StagedVenmoTransaction.from_api_model(t) for t in new_txns],
+        update_conflicts=True,
+        unique_fields=["host_txn_id"],
+        update_fields=UPDATED_FIELDS,
+    )
+    newest = max(new_txns, key=lambda t: (t.date_created or 0, int(t.id)))
+    with transaction.atomic():
+        cursor = VenmoSyncCursor.objects.select_for_update().filter(venmo_id=venmo_id).first()
+        # a concurrent sync may have advanced the cursor further already
+        if cursor and cursor.last_date_created is not None and cursor.last_date_created > (newest.date_created or 0):
+            return new_txns
+        VenmoSyncCursor.objects.update_or_create(
+            venmo_id=venmo_id,
+            defaults={"last_txn_id": newest.id, "last_date_created": newest.date_created},
+        )
+    return new_txns
+
+
+def staged_payments_to(venmo_profile, since=None):
+    """Returns the staged transactions that are payments to (or completed charges from) `venmo_profile`, optionally
+    just those completed after the `since` datetime."""
+    username = venmo_profile.username
+    staged = StagedVenmoTransaction.objects.filter(
+        (Q(payment_type="pay") & Q(target_username=username)) | (Q(payment_type="charge") & Q(actor_username=username)),
+        date_completed__isnull=False,
+    )
+    if since is not None:
+        staged = staged.filter(date_completed__gt=int(since.timestamp()))
+    return staged
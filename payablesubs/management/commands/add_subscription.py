@@ -7,11 +7,13 @@ from getpass import getpass
 
 from django.contrib.auth.models import User
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils.translation import gettext_lazy as _
 from subscriptions.models import SubscriptionPlan, UserSubscription
 
 import payablesubs.clients.google as google
 import payablesubs.clients.venmo as venmo
+from payablesubs.management.commands._venmo_lookup import VenmoUserResolver
 from payablesubs.models import VenmoAccount
 
 logger = logging.getLogger(__name__)
@@ -53,14 +55,6 @@ class Command(BaseCommand):
         venmo_username = options["venmo_username"]
         logger.info(f"Adding subscriber using:\n{options}")
 
-        user = User.objects.filter(email=email).first()
-        if not user:
-            logger.debug(f"User with {email} doesn't exist. Creating a new user...")
-            password = getpass()
-            user = User.objects.create_user(
-                username=email, first_name=first_name, last_name=last_name, email=email, password=password
-            )
-
         plan = SubscriptionPlan.objects.filter(plan_name=plan_name).first()
         if not plan:
             raise RuntimeError(f"No '{plan_name}' SubscriptionPlan found.")
@@ -73,20 +67,41 @@ class Command(BaseCommand):
             raise RuntimeError(f"No PlanCost exists for '{plan_name}' with cost={args_cost}.")
 
         plan_cost = plan_costs.first() if not args_cost else plan_costs.filter(cost=args_cost).first()
-        new_sub = UserSubscription.objects.create(
-            user=user,
-            subscription=plan_cost,
-            date_billing_start=start_date,
-            date_billing_end=None,
-            date_billing_last=None,
-            date_billing_next=start_date,
-        )
 
+        # i.e.: looked up before anything is created, so a failed lookup doesn't leave a subscription behind
+        venmo_id = None
         if venmo_username:
-            logger.debug(f"Storing {user}'s {venmo_username=} ...")
-            from_venmo = self.venmo_client.user.get_user_by_username(venmo_username)
-            venmo_acct = VenmoAccount.objects.create(user=user, venmo_username=venmo_username, venmo_id=from_venmo.id)
-            logger.info(f"Created {venmo_acct}")
+            resolver = VenmoUserResolver(self.venmo_client)
+            venmo_id = resolver.resolve_one(venmo_username)
+            if venmo_username in resolver.failed:
+                raise RuntimeError(f"Failed to look up Venmo user {venmo_username=}. Try again later.")
+            if not venmo_id:
+                raise RuntimeError(f"No Venmo user found for {venmo_username=}.")
+
+        user = User.objects.filter(email=email).first()
+        password = None
+        if not user:
+            logger.debug(f"User with {email} doesn't exist. Creating a new user...")
+            password = getpass()
+
+        with transaction.atomic():
+            if not user:
+                user = User.objects.create_user(
+                    username=email, first_name=first_name, last_name=last_name, email=email, password=password
+                )
+            new_sub = UserSubscription.objects.create(
+                user=user,
+                subscription=plan_cost,
+                date_billing_start=start_date,
+                date_billing_end=None,
+                date_billing_last=None,
+                date_billing_next=start_date,
+            )
+
+            if venmo_id:
+                logger.debug(f"Storing {user}'s {venmo_username=} ...")
+                venmo_acct = VenmoAccount.objects.create(user=user, venmo_username=venmo_username, venmo_id=venmo_id)
+                logger.info(f"Created {venmo_acct}")
 
         logger.info(f"Created new '{new_sub}'")
 
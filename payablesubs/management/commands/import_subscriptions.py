@@ -0,0 +1,202 @@
+"""Django management command to import many subscribers (users, subscriptions and Venmo accounts) from a file."""
+# see: https://docs.djangoproject.com/en/4.1/howto/custom-management-commands/
+import csv
+import json
+import logging
+from datetime import date, datetime, time
+from decimal import Decimal
+from itertools import islice
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone as django_timezone
+from django.utils.translation import gettext_lazy as _
+from subscriptions.models import PlanCost, UserSubscription
+
+import payablesubs.clients.google as google
+import payablesubs.clients.venmo as venmo
+from payablesubs.management.commands._venmo_lookup import VenmoUserResolver
+from payablesubs.models import VenmoAccount
+
+logger = logging.getLogger(__name__)
+
+CSV = "csv"
+JSONL = "jsonl"
+FIELDS = ("first_name", "last_name", "email", "plan", "start_date", "cost", "venmo_username")
+DEFAULT_BATCH_SIZE = 500
+# `sandbox/init_db.py`'s convention for subscribers without a Venmo account
+NO_VENMO_USERNAME = "N/A"
+
+
+def read_rows(path, file_format):
+    """Yields each row of the CSV (with a header line) or JSON Lines file at `path` as a dict, without loading it."""
+    with open(path, newline="") as f:
+        if file_format == CSV:
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _batched(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    """Django management command to import many subscribers from a file."""
+
+    help = (
+        "Imports subscribers from a CSV (with a header line) or JSON Lines file with the fields: "
+        f"{', '.join(FIELDS)}. Only first_name, last_name, email and plan are required. Users are created without a "
+        "usable password."
+    )
+
+    def __init__(self, venmo_client=None, google_client=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.venmo_client = venmo_client
+        self.google_client = google_client
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help=_("The CSV or JSON Lines file to import"))
+        parser.add_argument(
+            "--format",
+            choices=[CSV, JSONL],
+            help=_("The file's format. Defaults to its extension"),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=_("How many rows are imported per transaction"),
+        )
+        parser.add_argument("--no-google", action="store_true", help=_("Don't add the imported users' Google contacts"))
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or (JSONL if Path(path).suffix in (".jsonl", ".json") else CSV)
+        self.resolver = VenmoUserResolver(self.venmo_client if self.venmo_client else venmo.get_client())
+        self.plan_costs = self._load_plan_costs()
+
+        imported_users = []
+        skipped = 0
+        for batch in _batched(read_rows(path, file_format), options["batch_size"]):
+            parsed = self._parse_batch(batch)
+            skipped += len(batch) - len(parsed)
+            # i.e.: looked up (and cached) before the batch's transaction, so it isn't held open during the API calls
+            venmo_ids = self.resolver.resolve(venmo_username for *_, venmo_username in parsed if venmo_username)
+            with transaction.atomic():
+                users, batch_skipped = self._import_batch(parsed, venmo_ids)
+            imported_users += users
+            skipped += batch_skipped
+            logger.info(f"Imported {len(imported_users)} subscribers so far ({skipped} rows skipped)")
+
+        if imported_users and not options["no_google"]:
+            google.add_contact_labels(imported_users, client=self.google_client)
+        self.stdout.write(f"Imported {len(imported_users)} subscribers, skipped {skipped} rows")
+
+    @staticmethod
+    def _load_plan_costs():
+        """Returns a mapping of plan name to its `PlanCost`s, ordered like `SubscriptionPlan.costs`."""
+        plan_costs = {}
+        for plan_cost in PlanCost.objects.select_related("plan"):
+            plan_costs.setdefault(plan_cost.plan.plan_name, []).append(plan_cost)
+        if not plan_costs:
+            raise CommandError("No PlanCost exists to subscribe users to")
+        return plan_costs
+
+    def _plan_cost(self, row):
+        plan_costs = self.plan_costs.get(row["plan"])
+        if not plan_costs:
+            raise ValueError(f"No PlanCost exists for '{row['plan']}' SubscriptionPlan")
+        if not row.get("cost"):
+            return plan_costs[0]
+        cost = Decimal(str(row["cost"]))
+        for plan_cost in plan_costs:
+            if plan_cost.cost == cost:
+                return plan_cost
+        raise ValueError(f"No PlanCost exists for '{row['plan']}' with {cost=}")
+
+    def _parse(self, row):
+        """Returns the row's (normalized) email, plan cost, start date and Venmo username. Raises `ValueError`."""
+        email = (row.get("email") or "").strip()
+        if not email or not row.get("first_name") or not row.get("plan"):
+            raise ValueError("email, first_name and plan are required")
+        start_date = date.fromisoformat(row["start_date"]) if row.get("start_date") else django_timezone.localdate()
+        start_date = django_timezone.make_aware(datetime.combine(start_date, time.min))
+        venmo_username = (row.get("venmo_username") or "").strip()
+        if venmo_username == NO_VENMO_USERNAME:
+            venmo_username = None
+        return email, self._plan_cost(row), start_date, venmo_username or None
+
+    def _parse_batch(self, rows):
+        """Returns each of `rows` that's valid, followed by what `_parse` returns for it. Invalid rows are logged."""
+        parsed = []
+        for row in rows:
+            try:
+                parsed.append((row, *self._parse(row)))
+            except (ValueError, KeyError) as e:
+                logger.error(f"Skipping {row=}: {e}")
+        return parsed
+
+    def _import_batch(self, parsed, venmo_ids):
+        """Creates the users, subscriptions and Venmo accounts of `parsed` rows, whose Venmo usernames are resolved by
+        `venmo_ids`. Returns the imported users and how many rows were skipped (i.e.: already subscribed)."""
+        user_model = get_user_model()
+        skipped = 0
+
+        emails = {email for _row, email, *_rest in parsed}
+        users = {user.email: user for user in user_model.objects.filter(email__in=emails)}
+        new_users = []
+        for row, email, *_rest in parsed:
+            if email not in users:
+                user = user_model(
+                    username=email, first_name=row["first_name"], last_name=row.get("last_name", ""), email=email
+                )
+                user.set_unusable_password()
+                users[email] = user
+                new_users.append(user)
+        user_model.objects.bulk_create(new_users)
+        # i.e.: not every database backend sets the primary keys of bulk created rows
+        users = {user.email: user for user in user_model.objects.filter(email__in=emails)}
+
+        subscribed = set(
+            UserSubscription.objects.filter(user__in=users.values()).values_list("user_id", "subscription_id")
+        )
+        has_venmo = set(VenmoAccount.objects.filter(user__in=users.values()).values_list("user_id", flat=True))
+
+        subscriptions, venmo_accounts, imported = [], [], []
+        for row, email, plan_cost, start_date, venmo_username in parsed:
+            user = users[email]
+            if (user.id, plan_cost.id) in subscribed:
+                logger.warning(f"Skipping {email}, who's already subscribed to {plan_cost}")
+                skipped += 1
+                continue
+            subscribed.add((user.id, plan_cost.id))
+            subscriptions.append(
+                UserSubscription(
+                    user=user,
+                    subscription=plan_cost,
+                    date_billing_start=start_date,
+                    date_billing_end=None,
+                    date_billing_last=None,
+                    date_billing_next=start_date,
+                )
+            )
+            if venmo_username and user.id not in has_venmo:
+                if venmo_username in venmo_ids:
+                    has_venmo.add(user.id)
+                    venmo_accounts.append(
+                        VenmoAccount(user=user, venmo_username=venmo_username, venmo_id=venmo_ids[venmo_username])
+                    )
+                else:
+                    logger.warning(f"Not storing {email}'s Venmo account, since {venmo_username=} wasn't found")
+            imported.append(user)
+
+        UserSubscription.objects.bulk_create(subscriptions)
+        VenmoAccount.objects.bulk_create(venmo_accounts)
+        return imported, skipped
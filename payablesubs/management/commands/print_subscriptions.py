@@ -1,18 +1,50 @@
 """Django management command to print latest subscription details."""
 # see: https://docs.djangoproject.com/en/4.1/howto/custom-management-commands/
 import logging
+import tempfile
+from contextlib import ExitStack
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, send_mail
 from django.core.management.base import BaseCommand
 from django.utils.translation import gettext_lazy as _
 from subscriptions.models import UserSubscription
 
+from payablesubs.management.commands._report import (
+    FORMATS,
+    MIMETYPES,
+    TEXT,
+    Tee,
+    get_writer,
+)
+
 logger = logging.getLogger(__name__)
 timezone = ZoneInfo(settings.TIME_ZONE)
 
+# Report column names, and the `UserSubscription` fields they're read from
+REPORT_FIELDS = (
+    ("email", "user__email"),
+    ("first_name", "user__first_name"),
+    ("last_name", "user__last_name"),
+    ("plan", "subscription__plan__plan_name"),
+    ("cost", "subscription__cost"),
+    ("active", "active"),
+    ("cancelled", "cancelled"),
+    ("date_billing_start", "date_billing_start"),
+    ("date_billing_last", "date_billing_last"),
+    ("date_billing_next", "date_billing_next"),
+    ("date_billing_end", "date_billing_end"),
+)
+DEFAULT_CHUNK_SIZE = 2000
+# Emailed reports are buffered in memory up to this size, then spooled to a temporary file
+EMAIL_SPOOL_MAX_SIZE = 1024 * 1024
+
+
+def _localize(value):
+    return value.astimezone(timezone) if isinstance(value, datetime) else value
+
 
 class Command(BaseCommand):
     """Django management command to print latest subscription details."""
@@ -39,14 +71,24 @@ class Command(BaseCommand):
             "--email-to",
             help=_("The email address to send the subscription details to"),
         )
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            default=TEXT,
+            help=_("Log the report as text (one line per subscription), or write it as CSV or JSON"),
+        )
+        parser.add_argument(
+            "--output", help=_("Write the report to this file, rather than stdout (or only the log, for text)")
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=_("How many subscriptions are fetched from the database at a time"),
+        )
 
-    def handle(self, *args, **options):
-        cost = options["cost"]
-        include_inactive = options["include_inactive"]
-        email_to = options["email_to"]
-        logger.debug(f"Processing request with {cost=} {include_inactive=} {email_to=}")
-
-        subs = UserSubscription.objects.all().order_by("-subscription__cost", "user__email")
+    def _subscriptions(self, cost, include_inactive):
+        subs = UserSubscription.objects.order_by("-subscription__cost", "user__email")
         if include_inactive:
             logger.warning("Including inactive subscriptions in report!")
         else:
@@ -56,13 +98,67 @@ class Command(BaseCommand):
             subs = subs.filter(subscription__cost__gt=0)
         elif cost == Command._FREE:
             subs = subs.filter(subscription__cost=0)
+        return subs
+
+    def handle(self, *args, **options):
+        cost = options["cost"]
+        include_inactive = options["include_inactive"]
+        email_to = options["email_to"]
+        report_format = options.get("format", TEXT)
+        logger.debug(f"Processing request with {cost=} {include_inactive=} {email_to=} {report_format=}")
+
+        subs = self._subscriptions(cost, include_inactive)
+        count = subs.count()
+        chunk_size = options.get("chunk_size", DEFAULT_CHUNK_SIZE)
 
-        sub_strs = [f"{sub}" for sub in subs]
-        big_str = "\n".join(sub_strs)
-        logger.info(f"There are {len(subs)} subscriptions using {cost=}:\n{big_str}")
+        with ExitStack() as stack:
+            output = options.get("output")
+            streams = []
+            if output:
+                streams.append(stack.enter_context(open(output, "w", newline="")))
+            elif report_format != TEXT:
+                streams.append(self.stdout)
+            # i.e.: text reports are logged, like they're emailed, once they're complete
+            spool = None
+            if email_to or report_format == TEXT:
+                spool = stack.enter_context(tempfile.SpooledTemporaryFile(EMAIL_SPOOL_MAX_SIZE, mode="w+"))
+                streams.append(spool)
 
-        if email_to:
-            now = datetime.now(tz=timezone)
-            subject = f"[TheFlimm] {now.strftime('%B %Y')} has {len(subs)} {cost.lower()} subscribers"
-            logger.info(f"Sending email with {subject=} to {email_to}")
-            send_mail(subject, big_str, None, [email_to])
+            # rows are streamed straight from the database cursor, so memory doesn't grow with the subscribers
+            writer = get_writer(report_format, Tee(*streams), [name for name, _ in REPORT_FIELDS])
+            writer.begin()
+            if report_format == TEXT:
+                rows = subs.select_related("user", "subscription__plan").iterator(chunk_size=chunk_size)
+            else:
+                rows = (
+                    [_localize(value) for value in row]
+                    for row in subs.values_list(*(field for _, field in REPORT_FIELDS)).iterator(chunk_size=chunk_size)
+                )
+            for row in rows:
+                writer.write(row)
+            writer.end()
+
+            report = None
+            if spool:
+                spool.seek(0)
+                report = spool.read()
+            if report_format == TEXT:
+                report = report.rstrip("\n")
+                logger.info("There are %d subscriptions using cost=%r:\n%s", count, cost, report)
+            else:
+                logger.info(f"There are {count} subscriptions using {cost=}")
+            if email_to:
+                self._email(email_to, cost, count, report_format, report)
+
+    def _email(self, email_to, cost, count, report_format, report):
+        now = datetime.now(tz=timezone)
+        subject = f"[TheFlimm] {now.strftime('%B %Y')} has {count} {cost.lower()} subscribers"
+        logger.info(f"Sending email with {subject=} to {email_to}")
+        if report_format == TEXT:
+            send_mail(subject, report, None, [email_to])
+        else:
+            message = EmailMessage(
+                subject, f"{count} subscriptions attached as {report_format.upper()}.", to=[email_to]
+            )
+            message.attach(f"subscriptions.{report_format}", report, MIMETYPES[report_format])
+            message.send()
@@ -0,0 +1,65 @@
+"""Django management command to carry out the side effects enqueued in the outbox by billing runs."""
+# see: https://docs.djangoproject.com/en/4.1/howto/custom-management-commands/
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils.translation import gettext_lazy as _
+
+import payablesubs.clients.google as google
+import payablesubs.clients.venmo as venmo
+from payablesubs.management.commands._outbox import OutboxWorker
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Django management command to carry out the side effects enqueued in the outbox by billing runs."""
+
+    help = (
+        "Sends the Venmo payment requests and Google contact label changes enqueued by billing runs. Set "
+        "PAYABLESUBS_OUTBOX_DRAIN_AFTER_RUN = False to leave them to this command, rather than the billing run."
+    )
+
+    def __init__(self, venmo_client=None, google_client=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.venmo_client = venmo_client
+        self.google_client = google_client
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=1, help=_("How many workers drain the outbox concurrently"))
+        parser.add_argument(
+            "--loop", action="store_true", help=_("Keep polling for new messages, rather than exiting once drained")
+        )
+        parser.add_argument(
+            "--interval", type=float, default=10.0, help=_("Seconds to wait between polls, with --loop")
+        )
+
+    def _drain(self):
+        worker = OutboxWorker(self.venmo_client, self.google_client)
+        try:
+            return worker.drain()
+        finally:
+            # i.e.: each thread has its own database connection
+            connection.close()
+
+    def drain(self, workers):
+        if workers == 1:
+            return OutboxWorker(self.venmo_client, self.google_client).drain()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="outbox-worker") as pool:
+            futures = [pool.submit(self._drain) for _worker in range(workers)]
+            return sum(future.result() for future in futures)
+
+    def handle(self, *args, **options):
+        if not self.venmo_client:
+            self.venmo_client = venmo.get_client()
+        if not self.google_client:
+            self.google_client = google.get_client()
+
+        processed = self.drain(options["workers"])
+        while options["loop"]:
+            time.sleep(options["interval"])
+            processed += self.drain(options["workers"])
+        self.stdout.write(f"Processed {processed} outbox messages")
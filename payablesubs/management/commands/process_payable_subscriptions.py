@@ -0,0 +1,60 @@
+"""Django management command to process (a shard of) subscriptions via task runner."""
+# see: https://docs.djangoproject.com/en/4.1/howto/custom-management-commands/
+import importlib
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext_lazy as _
+from subscriptions.conf import SETTINGS
+
+from payablesubs.management.commands._payable_manager import PayableManager
+
+logger = logging.getLogger(__name__)
+
+
+def parse_shard(value):
+    """Parses a `--shard` value like `0/4` into an `(index, count)` tuple."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise CommandError(f"Invalid {value=}. Expected a shard like '0/4'")
+    if count < 1 or not 0 <= index < count:
+        raise CommandError(f"Invalid {value=}. Expected 0 <= index < count")
+    return index, count
+
+
+class Command(BaseCommand):
+    """Django management command to process (a shard of) subscriptions via task runner."""
+
+    help = (
+        "Processes subscriptions to handle renewal and expiries, like `process_subscriptions`. "
+        "Supports splitting the work across several workers with --shard."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--shard",
+            type=parse_shard,
+            help=_("Only process subscriptions of users whose id %% COUNT == INDEX, given as INDEX/COUNT (i.e.: 0/4)"),
+        )
+        parser.add_argument(
+            "--no-venmo-sync",
+            action="store_true",
+            help=_("Match payments against already synced Venmo transactions, without fetching new ones"),
+        )
+
+    def handle(self, *args, **options):
+        shard = options["shard"]
+        sync_venmo = not options["no_venmo_sync"]
+        manager_class = getattr(
+            importlib.import_module(SETTINGS["management_manager"]["module"]),
+            SETTINGS["management_manager"]["class"],
+        )
+        if not issubclass(manager_class, PayableManager):
+            raise CommandError(f"{manager_class} configured by DFS_MANAGER_CLASS doesn't extend PayableManager")
+
+        logger.info(f"Processing subscriptions using {manager_class.__name__} with {shard=} {sync_venmo=}")
+        manager = manager_class(shard=shard, sync_venmo=sync_venmo)
+        self.stdout.write("Processing subscriptions... ", ending="")
+        manager.process_subscriptions()
+        self.stdout.write("Complete!")
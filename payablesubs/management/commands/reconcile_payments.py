@@ -0,0 +1,138 @@
+"""Django management command to reconcile all staged Venmo transactions against outstanding bills at once."""
+# see: https://docs.djangoproject.com/en/4.1/howto/custom-management-commands/
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from subscriptions.models import UserSubscription
+
+import payablesubs.clients.venmo as venmo
+from payablesubs.management.commands._billing_memo import BillingMemo
+from payablesubs.management.commands._bulk import bulk_create_payments
+from payablesubs.management.commands._payable_manager import PayableManager
+from payablesubs.management.commands._txn_index import STAGED_FIELDS, PaymentRecord
+from payablesubs.management.commands._venmo_sync import (
+    staged_payments_to,
+    sync_transactions,
+)
+from payablesubs.models import Bill, Payment, VenmoAccount
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class Command(BaseCommand):
+    """Django management command to reconcile all staged Venmo transactions against outstanding bills at once."""
+
+    help = (
+        "Matches every synced Venmo transaction against every outstanding Bill in one vectorized pass "
+        "(requires NumPy), reporting matched, ambiguous and unmatched bills and transactions. "
+        "Use --commit to record the matches as Payments, moving the subscriptions whose current bill they pay on to "
+        "their next billing period."
+    )
+
+    def __init__(self, venmo_client=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.venmo_client = venmo_client
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days-before",
+            type=int,
+            default=7,
+            help=_("How many days before a bill's date a payment can match it"),
+        )
+        parser.add_argument(
+            "--days-after",
+            type=int,
+            default=31,
+            help=_("How many days after a bill's date a payment can match it"),
+        )
+        parser.add_argument(
+            "--no-venmo-sync",
+            action="store_true",
+            help=_("Reconcile against already synced Venmo transactions, without fetching new ones"),
+        )
+        parser.add_argument("--output", help=_("Write the matched, ambiguous and unmatched sets to this JSON file"))
+        parser.add_argument("--commit", action="store_true", help=_("Create Payments for the matched transactions"))
+
+    def handle(self, *args, **options):
+        try:
+            from payablesubs.management.commands._reconcile import reconcile
+        except ImportError:
+            raise CommandError("reconcile_payments requires NumPy: pip install payable-subscriptions[reconcile]")
+
+        venmo_client = self.venmo_client if self.venmo_client else venmo.get_client()
+        venmo_profile = venmo_client.my_profile()
+        if not options["no_venmo_sync"]:
+            sync_transactions(venmo_client, venmo_profile)
+
+        staged = staged_payments_to(venmo_profile).values_list(*STAGED_FIELDS)
+        records = [PaymentRecord.from_staged_values(values, venmo_profile.username) for values in staged.iterator()]
+        bills = list(Bill.objects.order_by().only("id", "user_id", "subscription_id", "amount", "date_transaction"))
+        payments = list(
+            Payment.objects.order_by().only("host_payment_id", "user_id", "subscription_id", "date_transaction")
+        )
+        venmo_usernames = dict(VenmoAccount.objects.values_list("user_id", "venmo_username"))
+
+        result = reconcile(
+            records,
+            bills,
+            payments,
+            venmo_usernames,
+            options["days_before"] * SECONDS_PER_DAY,
+            options["days_after"] * SECONDS_PER_DAY,
+        )
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(result.summary(), output, indent=2)
+
+        self.stdout.write(
+            f"{len(result.matched)} matched, {len(result.ambiguous)} ambiguous, "
+            f"{len(result.unmatched_bills)} unmatched bills, {len(result.unmatched_txns)} unmatched transactions "
+            f"({result.settled_bills} bills already paid)"
+        )
+        if options["commit"]:
+            with transaction.atomic():
+                created = bulk_create_payments(
+                    Payment(
+                        host_payment_id=record.id,
+                        subscription_id=bill.subscription_id,
+                        user_id=bill.user_id,
+                        amount=bill.amount,
+                        method=Payment.PaymentMethod.VENMO,
+                        date_transaction=record.date_completed_datetime,
+                        data=PayableManager._parse_txn_data(record),
+                    )
+                    for bill, record in result.matched
+                )
+                advanced = self.advance_subscriptions(result.matched)
+            self.stdout.write(f"Created {len(created)} Payments, advancing {advanced} subscriptions")
+
+    @staticmethod
+    def advance_subscriptions(matched):
+        """Moves the subscriptions whose current bill is paid by a matched record on to their next billing period,
+        like a billing run matching the payment would (see `PayableManager._update_due_subscription`). Otherwise, the
+        next run wouldn't find the payment (it only looks past the latest `Payment`), and would expire them.
+
+        Returns how many subscriptions were advanced.
+        """
+        paid = {(bill.user_id, bill.subscription_id, bill.date_transaction): record for bill, record in matched}
+        subscriptions = UserSubscription.objects.filter(
+            active=True, cancelled=False, user_id__in={user_id for user_id, _sub_id, _date in paid}
+        ).select_related("subscription")
+        memo = BillingMemo()
+        advanced = []
+        for sub in subscriptions:
+            record = paid.get((sub.user_id, sub.subscription_id, sub.date_billing_next))
+            if not record:
+                continue
+            sub.date_billing_last = record.date_completed_datetime
+            sub.date_billing_next = memo.next_billing_datetime(sub.subscription, sub.date_billing_next)
+            sub.date_billing_end = None
+            advanced.append(sub)
+        UserSubscription.objects.bulk_update(advanced, ["date_billing_last", "date_billing_next", "date_billing_end"])
+        return len(advanced)
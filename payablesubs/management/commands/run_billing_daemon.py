@@ -0,0 +1,69 @@
+"""Django management command to keep processing subscriptions as their billing deadlines come up."""
+# see: https://docs.djangoproject.com/en/4.1/howto/custom-management-commands/
+import importlib
+import logging
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext_lazy as _
+from subscriptions.conf import SETTINGS
+
+from payablesubs.management.commands._billing_daemon import BillingDaemon
+from payablesubs.management.commands._payable_manager import PayableManager
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Django management command to keep processing subscriptions as their billing deadlines come up."""
+
+    help = (
+        "Runs until stopped (i.e.: SIGTERM), processing subscriptions when they're due, expire or start, and polling "
+        "Venmo for the payment of bills awaiting it. Replaces running `process_payable_subscriptions` from cron."
+    )
+
+    def __init__(self, manager=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.manager = manager
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            help=_("Seconds between Venmo polls while bills are awaiting payment (PAYABLESUBS_DAEMON_POLL_SECONDS)"),
+        )
+        parser.add_argument(
+            "--resync-interval",
+            type=float,
+            help=_(
+                "Seconds between full reloads of the schedule from the database (PAYABLESUBS_DAEMON_RESYNC_SECONDS)"
+            ),
+        )
+        parser.add_argument("--max-runs", type=int, help=_("Exit after processing subscriptions this many times"))
+
+    def _get_manager(self):
+        manager_class = getattr(
+            importlib.import_module(SETTINGS["management_manager"]["module"]),
+            SETTINGS["management_manager"]["class"],
+        )
+        if not issubclass(manager_class, PayableManager):
+            raise CommandError(f"{manager_class} configured by DFS_MANAGER_CLASS doesn't extend PayableManager")
+        # i.e.: created once, so its clients stay initialized (and their connections open) between runs
+        return manager_class()
+
+    def handle(self, *args, **options):
+        if not self.manager:
+            self.manager = self._get_manager()
+        daemon = BillingDaemon(
+            self.manager, poll_seconds=options["poll_interval"], resync_seconds=options["resync_interval"]
+        )
+
+        previous_handler = signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+        logger.info(f"Starting billing daemon using {type(self.manager).__name__}")
+        try:
+            daemon.run_forever(max_runs=options["max_runs"])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+        self.stdout.write(f"Billing daemon stopped after {daemon.runs} runs")
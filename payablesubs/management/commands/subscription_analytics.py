@@ -0,0 +1,76 @@
+"""Django management command to print subscription analytics (MRR, outstanding bills, collections, churn, cohorts)."""
+# see: https://docs.djangoproject.com/en/4.1/howto/custom-management-commands/
+import json
+import logging
+
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext_lazy as _
+
+from payablesubs import analytics
+
+logger = logging.getLogger(__name__)
+
+TEXT = "text"
+JSON = "json"
+
+
+def _month(value):
+    return value.strftime("%Y-%m")
+
+
+class Command(BaseCommand):
+    """Django management command to print subscription analytics."""
+
+    help = (
+        "Prints monthly recurring revenue per plan, outstanding bills, and billed / collected totals, churn and "
+        "cohorts by month; all aggregated in the database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months",
+            type=int,
+            default=analytics.DEFAULT_MONTHS,
+            help=_("How many months the by-month figures cover"),
+        )
+        parser.add_argument("--format", choices=[TEXT, JSON], default=TEXT, help=_("Print as text or JSON"))
+        parser.add_argument(
+            "--refresh",
+            action="store_true",
+            help=_("Recompute the figures, even if cached (see PAYABLESUBS_ANALYTICS_CACHE_TIMEOUT)"),
+        )
+
+    def handle(self, *args, **options):
+        results = analytics.get_analytics(options["months"], refresh=options["refresh"])
+        if options["format"] == JSON:
+            self.stdout.write(json.dumps(results, default=str, indent=2))
+        else:
+            self._write_text(results)
+
+    def _write_text(self, results):
+        write = self.stdout.write
+        write(f"Computed {results['computed']:%Y-%m-%d %H:%M}, covering the last {results['months']} months")
+        write(f"\nMRR: ${results['mrr']:.2f} from {results['active_subscriptions']} active subscriptions")
+        for plan in results["mrr_by_plan"]:
+            write(f"  {plan['plan']:30} {plan['subscribers']:7} subscribers  ${plan['mrr']:10.2f}")
+
+        outstanding = results["outstanding"]
+        write(f"\nOutstanding: {outstanding['bills']} bills, ${outstanding['amount']:.2f}")
+        for row in outstanding["by_month"]:
+            write(f"  {_month(row['month'])} {row['bills']:7} bills  ${row['amount']:10.2f}")
+
+        billed = {row["month"]: row for row in results["billed_by_month"]}
+        collected = {row["month"]: row for row in results["collected_by_month"]}
+        write(f"\n{'month':9} {'billed':>12} {'collected':>12}")
+        for month in sorted(billed.keys() | collected.keys()):
+            billed_amount = billed[month]["amount"] if month in billed else 0
+            collected_amount = collected[month]["amount"] if month in collected else 0
+            write(f"{_month(month):9} {billed_amount:12.2f} {collected_amount:12.2f}")
+
+        write(f"\n{'month':9} {'started':>8} {'ended':>8}")
+        for row in results["churn_by_month"]:
+            write(f"{_month(row['month']):9} {row['started']:8} {row['ended']:8}")
+
+        write(f"\n{'cohort':9} {'started':>8} {'active':>8}")
+        for row in results["cohorts"]:
+            write(f"{_month(row['cohort']):9} {row['started']:8} {row['active']:8}")
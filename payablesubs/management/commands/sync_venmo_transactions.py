@@ -0,0 +1,28 @@
+"""Django management command to sync new Venmo transactions into the local store."""
+# see: https://docs.djangoproject.com/en/4.1/howto/custom-management-commands/
+import logging
+
+from django.core.management.base import BaseCommand
+
+import payablesubs.clients.venmo as venmo
+from payablesubs.management.commands._venmo_sync import sync_transactions
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Django management command to sync new Venmo transactions into the local store."""
+
+    help = (
+        "Fetches Venmo transactions newer than the last sync. "
+        "Run this once before `process_payable_subscriptions --no-venmo-sync` shards share the result."
+    )
+
+    def __init__(self, venmo_client=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.venmo_client = venmo_client
+
+    def handle(self, *args, **options):
+        venmo_client = self.venmo_client if self.venmo_client else venmo.get_client()
+        new_txns = sync_transactions(venmo_client, venmo_client.my_profile())
+        self.stdout.write(f"Synced {len(new_txns)} new Venmo transactions")
@@ -0,0 +1,243 @@
+"""Records per-phase durations, DB query counts and external API calls for each billing run.
+
+Enable with `PAYABLESUBS_METRICS_ENABLED`. When disabled, `get_metrics` returns `NULL_METRICS`, whose context managers
+do nothing.
+"""
+import functools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# How many of the slowest subscriptions are included in the logged summary
+SLOWEST_SUBSCRIPTIONS = 10
+
+_NULL_CONTEXT = nullcontext()
+_active = None  # the `RunMetrics` currently recording, if any
+
+
+class NullMetrics:
+    """Stands in for `RunMetrics` when instrumentation is disabled."""
+
+    enabled = False
+
+    def recording(self):
+        return _NULL_CONTEXT
+
+    def phase(self, name, subscription=None):
+        return _NULL_CONTEXT
+
+    def api_call(self, service, method):
+        return _NULL_CONTEXT
+
+    def summary(self, all_subscriptions=False):
+        return {}
+
+    def report(self):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+def get_metrics():
+    """Returns a new `RunMetrics` if instrumentation is enabled, or `NULL_METRICS` otherwise."""
+    if getattr(settings, "PAYABLESUBS_METRICS_ENABLED", False):
+        return RunMetrics()
+    return NULL_METRICS
+
+
+def api_call(service, method):
+    """Records a call to an external API with the `RunMetrics` currently recording (if any)."""
+    return _active.api_call(service, method) if _active else _NULL_CONTEXT
+
+
+def timed(name, per_subscription=False):
+    """Decorates a manager method, recording each call as phase `name` of its `self.metrics`.
+
+    If `per_subscription`, the method's first argument is the `UserSubscription` the time (and queries) count towards.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            subscription = args[0] if per_subscription else None
+            with self.metrics.phase(name, subscription):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class RunMetrics:
+    """Collects metrics for a single run.
+
+    Phase durations and query counts are exclusive of any nested phase. Queries are counted on the connection of the
+    thread that started `recording`, while API calls may be recorded from any thread.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._reset()
+
+    def _reset(self):
+        self.started = None
+        self.seconds = 0.0
+        self.queries = 0
+        self.phases = {}
+        self.api_calls = {}
+        self.subscriptions = {}
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        stack = self._stack()
+        if stack:
+            stack[-1]["queries"] += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def recording(self):
+        """Resets, then records a run. Any `api_call`s made meanwhile are recorded too."""
+        global _active
+        self._reset()
+        self.started = time.time()
+        start = time.perf_counter()
+        _active = self
+        try:
+            with connection.execute_wrapper(self._count_query):
+                yield self
+        finally:
+            _active = None
+            self.seconds = time.perf_counter() - start
+
+    @contextmanager
+    def phase(self, name, subscription=None):
+        stack = self._stack()
+        entry = {"start": time.perf_counter(), "nested": 0.0, "queries": 0}
+        stack.append(entry)
+        try:
+            yield
+        finally:
+            stack.pop()
+            elapsed = time.perf_counter() - entry["start"]
+            if stack:
+                stack[-1]["nested"] += elapsed
+            seconds = elapsed - entry["nested"]
+            with self._lock:
+                stats = self.phases.setdefault(name, {"calls": 0, "seconds": 0.0, "queries": 0})
+                stats["calls"] += 1
+                stats["seconds"] += seconds
+                stats["queries"] += entry["queries"]
+                if subscription is not None:
+                    sub_stats = self.subscriptions.setdefault(subscription.id, {"seconds": 0.0, "queries": 0})
+                    sub_stats["seconds"] += seconds
+                    sub_stats["queries"] += entry["queries"]
+
+    @contextmanager
+    def api_call(self, service, method):
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stats = self.api_calls.setdefault(
+                    f"{service}.{method}", {"calls": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0}
+                )
+                stats["calls"] += 1
+                stats["errors"] += failed
+                stats["seconds"] += elapsed
+                stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+
+    def summary(self, all_subscriptions=False):
+        """Returns the run's metrics as a dict, with either every subscription or just the slowest ones."""
+        subscriptions = [{"id": sub_id, **stats} for sub_id, stats in self.subscriptions.items()]
+        if not all_subscriptions:
+            subscriptions = sorted(subscriptions, key=lambda s: s["seconds"], reverse=True)[:SLOWEST_SUBSCRIPTIONS]
+        return {
+            "started": self.started,
+            "seconds": self.seconds,
+            "queries": self.queries,
+            "phases": self.phases,
+            "api_calls": self.api_calls,
+            "subscriptions_processed": len(self.subscriptions),
+            "subscriptions": subscriptions,
+        }
+
+    def report(self):
+        """Logs the run's summary, and exports it to the configured JSON and Prometheus textfiles (if any)."""
+        logger.info(f"Billing run metrics: {json.dumps(self.summary(), default=str)}")
+
+        json_file = getattr(settings, "PAYABLESUBS_METRICS_JSON_FILE", None)
+        if json_file:
+            _write_atomically(json_file, json.dumps(self.summary(all_subscriptions=True), default=str, indent=2))
+        prometheus_file = getattr(settings, "PAYABLESUBS_METRICS_PROMETHEUS_FILE", None)
+        if prometheus_file:
+            _write_atomically(prometheus_file, self.to_prometheus())
+
+    def to_prometheus(self):
+        """Returns the run's metrics in the Prometheus text exposition format (i.e.: for node_exporter's textfile
+        collector)."""
+        lines = []
+
+        def add(name, help_text, samples):
+            lines.append(f"# HELP payablesubs_{name} {help_text}")
+            lines.append(f"# TYPE payablesubs_{name} gauge")
+            for labels, value in samples:
+                label_str = ",".join(f'{label}="{label_value}"' for label, label_value in labels.items())
+                lines.append(
+                    f"payablesubs_{name}{{{label_str}}} {value}" if label_str else f"payablesubs_{name} {value}"
+                )
+
+        add("run_timestamp_seconds", "When the last billing run started.", [({}, self.started)])
+        add("run_duration_seconds", "Duration of the last billing run.", [({}, self.seconds)])
+        add("run_queries", "Database queries made by the last billing run.", [({}, self.queries)])
+        add("run_subscriptions", "Subscriptions processed by the last billing run.", [({}, len(self.subscriptions))])
+        for key, help_text in (("calls", "Calls"), ("seconds", "Seconds spent"), ("queries", "Database queries")):
+            add(
+                f"phase_{key}",
+                f"{help_text} per phase of the last billing run.",
+                [({"phase": name}, stats[key]) for name, stats in self.phases.items()],
+            )
+        for key, help_text in (
+            ("calls", "Calls"),
+            ("errors", "Failed calls"),
+            ("seconds", "Seconds spent"),
+            ("max_seconds", "Slowest call"),
+        ):
+            samples = []
+            for name, stats in self.api_calls.items():
+                service, method = name.split(".", 1)
+                samples.append(({"service": service, "method": method}, stats[key]))
+            add(f"api_{key}", f"{help_text} per external API method in the last billing run.", samples)
+        return "\n".join(lines) + "\n"
+
+
+def _write_atomically(path, content):
+    """Writes `content` to `path` via a temporary file, so readers never see a partial file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as tmp:
+        tmp.write(content)
+    os.replace(tmp.name, path)
@@ -0,0 +1,137 @@
+# Generated by Django 4.1.4 on 2026-10-17 00:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payablesubs", "0003_payment_delete_venmotransaction"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StagedVenmoTransaction",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "host_txn_id",
+                    models.PositiveBigIntegerField(help_text="Venmo's identifier for this transaction", unique=True),
+                ),
+                (
+                    "payment_type",
+                    models.CharField(
+                        help_text="Venmo's payment type (i.e.: 'pay' or 'charge')",
+                        max_length=16,
+                    ),
+                ),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=4,
+                        help_text="the transaction's amount",
+                        max_digits=19,
+                    ),
+                ),
+                (
+                    "note",
+                    models.TextField(
+                        blank=True,
+                        default="",
+                        help_text="the note attached to the transaction",
+                    ),
+                ),
+                (
+                    "actor_id",
+                    models.CharField(
+                        help_text="Venmo id of the user that initiated the transaction",
+                        max_length=64,
+                    ),
+                ),
+                (
+                    "actor_username",
+                    models.CharField(help_text="Venmo username of the initiating user", max_length=64),
+                ),
+                (
+                    "target_id",
+                    models.CharField(
+                        help_text="Venmo id of the user the transaction is with",
+                        max_length=64,
+                    ),
+                ),
+                (
+                    "target_username",
+                    models.CharField(help_text="Venmo username of the targeted user", max_length=64),
+                ),
+                (
+                    "date_created",
+                    models.BigIntegerField(
+                        help_text="epoch seconds Venmo created the transaction",
+                        null=True,
+                    ),
+                ),
+                (
+                    "date_updated",
+                    models.BigIntegerField(
+                        help_text="epoch seconds Venmo last updated the transaction",
+                        null=True,
+                    ),
+                ),
+                (
+                    "date_completed",
+                    models.BigIntegerField(
+                        help_text="epoch seconds Venmo completed the transaction",
+                        null=True,
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="VenmoSyncCursor",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "venmo_id",
+                    models.CharField(
+                        help_text="the Venmo profile being synced",
+                        max_length=64,
+                        unique=True,
+                    ),
+                ),
+                (
+                    "last_txn_id",
+                    models.PositiveBigIntegerField(help_text="the newest transaction synced", null=True),
+                ),
+                (
+                    "last_date_created",
+                    models.BigIntegerField(
+                        help_text="epoch seconds the newest transaction synced was created",
+                        null=True,
+                    ),
+                ),
+                (
+                    "date_synced",
+                    models.DateTimeField(
+                        auto_now=True,
+                        help_text="the last time transactions were synced",
+                    ),
+                ),
+            ],
+        ),
+    ]
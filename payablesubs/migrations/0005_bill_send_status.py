@@ -0,0 +1,80 @@
+# Generated by Django 4.1.4 on 2026-10-17 00:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payablesubs", "0004_venmo_transaction_sync"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bill",
+            name="date_sent",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="the datetime the payment request was sent",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="bill",
+            name="note",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="the note sent along with the payment request",
+                max_length=255,
+            ),
+        ),
+        migrations.AddField(
+            model_name="bill",
+            name="send_attempts",
+            field=models.PositiveSmallIntegerField(
+                default=0,
+                help_text="how many times sending the payment request was attempted",
+            ),
+        ),
+        migrations.AddField(
+            model_name="bill",
+            name="send_error",
+            field=models.TextField(
+                blank=True,
+                default="",
+                help_text="the last error encountered sending the payment request",
+            ),
+        ),
+        # Bills created before this migration already had their payment request sent inline
+        migrations.AddField(
+            model_name="bill",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending send"),
+                    ("SENT", "Sent"),
+                    ("FAILED", "Failed to send"),
+                    ("NOT_SENT", "Not sent (billing disabled)"),
+                ],
+                default="SENT",
+                help_text="whether the payment request for this bill has been sent",
+                max_length=8,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="bill",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending send"),
+                    ("SENT", "Sent"),
+                    ("FAILED", "Failed to send"),
+                    ("NOT_SENT", "Not sent (billing disabled)"),
+                ],
+                default="PENDING",
+                help_text="whether the payment request for this bill has been sent",
+                max_length=8,
+            ),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.1.4 on 2026-10-17 00:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("payablesubs", "0005_bill_send_status"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GoogleContact",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "resource_name",
+                    models.CharField(
+                        help_text="the contact's Google People resourceName",
+                        max_length=64,
+                    ),
+                ),
+                (
+                    "date_cached",
+                    models.DateTimeField(
+                        auto_now=True,
+                        help_text="when the resourceName was last looked up",
+                    ),
+                ),
+                (
+                    "user",
+                    models.OneToOneField(
+                        help_text="the user associated with this Google contact",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.4 on 2026-10-17 00:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payablesubs", "0006_googlecontact"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="bill",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending send"),
+                    ("SENDING", "Sending"),
+                    ("SENT", "Sent"),
+                    ("FAILED", "Failed to send"),
+                    ("NOT_SENT", "Not sent (billing disabled)"),
+                ],
+                default="PENDING",
+                help_text="whether the payment request for this bill has been sent",
+                max_length=8,
+            ),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.1.4 on 2026-10-17 00:52
+
+from django.db import migrations, models
+from django.db.models import Count
+
+# When deduplicating, keep the bill that got furthest along sending its payment request
+STATUS_PRIORITY = ["SENT", "SENDING", "FAILED", "NOT_SENT", "PENDING"]
+
+
+def delete_duplicate_bills(apps, schema_editor):
+    Bill = apps.get_model("payablesubs", "Bill")
+    duplicates = (
+        Bill.objects.order_by()
+        .values("user_id", "subscription_id", "date_transaction")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        bills = Bill.objects.filter(
+            user_id=duplicate["user_id"],
+            subscription_id=duplicate["subscription_id"],
+            date_transaction=duplicate["date_transaction"],
+        )
+        keep = min(bills, key=lambda b: STATUS_PRIORITY.index(b.status) if b.status in STATUS_PRIORITY else 99)
+        bills.exclude(id=keep.id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payablesubs", "0007_bill_sending_status"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="bill",
+            options={},
+        ),
+        migrations.AddIndex(
+            model_name="bill",
+            index=models.Index(
+                fields=["user", "date_transaction"],
+                name="payablesubs_bill_user_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bill",
+            index=models.Index(
+                condition=models.Q(("status", "PENDING")),
+                fields=["status"],
+                name="payablesubs_bill_pending_idx",
+            ),
+        ),
+        migrations.RunPython(delete_duplicate_bills, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="bill",
+            constraint=models.UniqueConstraint(
+                fields=("user", "subscription", "date_transaction"),
+                name="payablesubs_bill_unique_per_period",
+            ),
+        ),
+    ]
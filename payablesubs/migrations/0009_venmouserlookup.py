@@ -0,0 +1,48 @@
+# Generated by Django 4.1.4 on 2026-10-17 01:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payablesubs", "0008_bill_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VenmoUserLookup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "venmo_username",
+                    models.CharField(
+                        help_text="the Venmo username that was looked up",
+                        max_length=64,
+                        unique=True,
+                    ),
+                ),
+                (
+                    "venmo_id",
+                    models.CharField(
+                        blank=True,
+                        help_text="the username's Venmo user id, if Venmo found one",
+                        max_length=64,
+                        null=True,
+                    ),
+                ),
+                (
+                    "date_cached",
+                    models.DateTimeField(auto_now=True, help_text="when the username was last looked up"),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,146 @@
+# Generated by Django 4.1.4 on 2026-10-17 01:17
+
+from datetime import timezone
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def enqueue_pending_bills(apps, schema_editor):
+    """Enqueues the payment requests of bills still pending send, which the outbox now sends."""
+    Bill = apps.get_model("payablesubs", "Bill")
+    OutboxMessage = apps.get_model("payablesubs", "OutboxMessage")
+    OutboxMessage.objects.bulk_create(
+        (
+            OutboxMessage(
+                kind="VENMO_REQUEST",
+                # i.e.: `_outbox.bill_request`'s key
+                idempotency_key=(
+                    f"venmo-request:{bill.user_id}:{bill.subscription_id}:"
+                    f"{bill.date_transaction.astimezone(timezone.utc).isoformat()}"
+                ),
+                payload={"bill_id": str(bill.id)},
+            )
+            for bill in Bill.objects.filter(status="PENDING").iterator()
+        ),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payablesubs", "0009_venmouserlookup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutboxMessage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("VENMO_REQUEST", "Send a bill's Venmo payment request"),
+                            (
+                                "GOOGLE_REMOVE_LABEL",
+                                "Remove an expired subscriber's Google contact label",
+                            ),
+                        ],
+                        help_text="the side effect to carry out",
+                        max_length=32,
+                    ),
+                ),
+                (
+                    "idempotency_key",
+                    models.CharField(
+                        help_text=(
+                            "identifies the side effect, so enqueueing it again (i.e.: from a retried run) is a no-op"
+                        ),
+                        max_length=255,
+                        unique=True,
+                    ),
+                ),
+                (
+                    "payload",
+                    models.JSONField(
+                        default=dict,
+                        help_text="what the side effect needs (i.e.: the bill's id)",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("PENDING", "Pending"),
+                            ("PROCESSING", "Processing"),
+                            ("DONE", "Done"),
+                            ("FAILED", "Failed"),
+                        ],
+                        default="PENDING",
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveSmallIntegerField(default=0, help_text="how many times processing was attempted"),
+                ),
+                (
+                    "last_error",
+                    models.TextField(
+                        blank=True,
+                        default="",
+                        help_text="the last error encountered processing it",
+                    ),
+                ),
+                (
+                    "claimed_by",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        help_text="the worker processing it (or that last did)",
+                        max_length=32,
+                    ),
+                ),
+                ("date_created", models.DateTimeField(auto_now_add=True)),
+                (
+                    "date_available",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        help_text="when it may next be processed, which failed attempts push back",
+                    ),
+                ),
+                (
+                    "date_claimed",
+                    models.DateTimeField(blank=True, help_text="when a worker last claimed it", null=True),
+                ),
+                (
+                    "date_processed",
+                    models.DateTimeField(
+                        blank=True,
+                        help_text="when it was done (or given up on)",
+                        null=True,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="outboxmessage",
+            index=models.Index(
+                condition=models.Q(("status", "PENDING")),
+                fields=["date_available"],
+                name="payablesubs_outbox_pending_idx",
+            ),
+        ),
+        migrations.RunPython(enqueue_pending_bills, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+# `UserSubscription` belongs to django-flexible-subscriptions, whose migrations we don't control, so its indexes
+# can't be declared on the model (or added with `AddIndex`, which only targets this app's models). They're created
+# here instead, each supporting one of the billing run's selections (see `PayableManager`) and only covering the rows
+# it can select. Partial indexes are supported by PostgreSQL and SQLite.
+USER_SUBSCRIPTION_INDEXES = [
+    ("payablesubs_usersub_due_idx", "date_billing_next", '"active" AND NOT "cancelled"'),
+    ("payablesubs_usersub_end_idx", "date_billing_end", '"active" AND NOT "cancelled"'),
+    ("payablesubs_usersub_new_idx", "date_billing_start", 'NOT "active" AND NOT "cancelled"'),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("subscriptions", "0007_alter_planlist_id_alter_planlistdetail_id_and_more"),
+        ("payablesubs", "0010_outboxmessage"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=f'CREATE INDEX "{name}" ON "subscriptions_usersubscription" ("{field}") WHERE {condition}',
+            reverse_sql=f'DROP INDEX "{name}"',
+        )
+        for name, field, condition in USER_SUBSCRIPTION_INDEXES
+    ]
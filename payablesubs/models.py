@@ -1,7 +1,9 @@
+from decimal import Decimal
 from uuid import uuid4
 
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from subscriptions.models import PlanCost, SubscriptionTransaction
 
@@ -37,6 +39,13 @@ class Payment(SubscriptionTransaction):
 class Bill(models.Model):
     """Track bills in a separate table - but it includes the same fields as the transaction."""
 
+    class SendStatus(models.TextChoices):
+        PENDING = "PENDING", _("Pending send")
+        SENDING = "SENDING", _("Sending")
+        SENT = "SENT", _("Sent")
+        FAILED = "FAILED", _("Failed to send")
+        NOT_SENT = "NOT_SENT", _("Not sent (billing disabled)")
+
     id = models.UUIDField(
         default=uuid4,
         editable=False,
@@ -66,12 +75,44 @@ class Bill(models.Model):
         max_digits=19,
         null=True,
     )
+    note = models.CharField(
+        blank=True,
+        default="",
+        help_text=_("the note sent along with the payment request"),
+        max_length=255,
+    )
+    status = models.CharField(
+        choices=SendStatus.choices,
+        default=SendStatus.PENDING,
+        help_text=_("whether the payment request for this bill has been sent"),
+        max_length=8,
+    )
+    send_attempts = models.PositiveSmallIntegerField(
+        default=0,
+        help_text=_("how many times sending the payment request was attempted"),
+    )
+    send_error = models.TextField(
+        blank=True,
+        default="",
+        help_text=_("the last error encountered sending the payment request"),
+    )
+    date_sent = models.DateTimeField(
+        blank=True,
+        help_text=_("the datetime the payment request was sent"),
+        null=True,
+    )
 
     class Meta:
-        ordering = (
-            "date_transaction",
-            "user",
-        )
+        # no default `ordering`, so billing run queries don't pay for a sort they don't need
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "subscription", "date_transaction"], name="payablesubs_bill_unique_per_period"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["user", "date_transaction"], name="payablesubs_bill_user_date_idx"),
+            models.Index(fields=["status"], name="payablesubs_bill_pending_idx", condition=models.Q(status="PENDING")),
+        ]
 
     def __str__(self):
         return f"user={self.user} plan_cost={self.subscription} due={self.date_transaction}"
@@ -93,3 +134,133 @@ class VenmoAccount(models.Model):
 
     def __str__(self):
         return f"user={self.user} venmo_username={self.venmo_username} venmo_id={self.venmo_id}"
+
+
+class StagedVenmoTransaction(models.Model):
+    """Local copy of a raw Venmo transaction, so each run only needs to fetch transactions newer than its cursor."""
+
+    host_txn_id = models.PositiveBigIntegerField(unique=True, help_text=_("Venmo's identifier for this transaction"))
+    payment_type = models.CharField(max_length=16, help_text=_("Venmo's payment type (i.e.: 'pay' or 'charge')"))
+    amount = models.DecimalField(decimal_places=4, max_digits=19, help_text=_("the transaction's amount"))
+    note = models.TextField(blank=True, default="", help_text=_("the note attached to the transaction"))
+
+    actor_id = models.CharField(max_length=64, help_text=_("Venmo id of the user that initiated the transaction"))
+    actor_username = models.CharField(max_length=64, help_text=_("Venmo username of the initiating user"))
+    target_id = models.CharField(max_length=64, help_text=_("Venmo id of the user the transaction is with"))
+    target_username = models.CharField(max_length=64, help_text=_("Venmo username of the targeted user"))
+
+    date_created = models.BigIntegerField(null=True, help_text=_("epoch seconds Venmo created the transaction"))
+    date_updated = models.BigIntegerField(null=True, help_text=_("epoch seconds Venmo last updated the transaction"))
+    date_completed = models.BigIntegerField(null=True, help_text=_("epoch seconds Venmo completed the transaction"))
+
+    @classmethod
+    def from_api_model(cls, txn):
+        """Creates a (not yet saved) instance from a `venmo_api` `Transaction`."""
+        return cls(
+            host_txn_id=txn.id,
+            payment_type=txn.payment_type,
+            amount=Decimal(str(txn.amount)),
+            note=txn.note or "",
+            actor_id=str(txn.actor.id),
+            actor_username=txn.actor.username,
+            target_id=str(txn.target.id),
+            target_username=txn.target.username,
+            date_created=txn.date_created,
+            date_updated=txn.date_updated,
+            date_completed=txn.date_completed,
+        )
+
+    def __str__(self):
+        return (
+            f"{self.actor_username} {self.payment_type} ${self.amount} to {self.target_username} "
+            f"[host_txn_id={self.host_txn_id}]"
+        )
+
+
+class VenmoSyncCursor(models.Model):
+    """Remembers the newest Venmo transaction synced for a Venmo profile."""
+
+    venmo_id = models.CharField(max_length=64, unique=True, help_text=_("the Venmo profile being synced"))
+    last_txn_id = models.PositiveBigIntegerField(null=True, help_text=_("the newest transaction synced"))
+    last_date_created = models.BigIntegerField(
+        null=True, help_text=_("epoch seconds the newest transaction synced was created")
+    )
+    date_synced = models.DateTimeField(auto_now=True, help_text=_("the last time transactions were synced"))
+
+    def __str__(self):
+        return f"venmo_id={self.venmo_id} last_txn_id={self.last_txn_id} synced={self.date_synced}"
+
+
+class GoogleContact(models.Model):
+    """Caches the Google People `resourceName` of a user's contact, so label changes can skip searching for it."""
+
+    user = models.OneToOneField(
+        get_user_model(),
+        help_text=_("the user associated with this Google contact"),
+        on_delete=models.CASCADE,
+    )
+    resource_name = models.CharField(max_length=64, help_text=_("the contact's Google People resourceName"))
+    date_cached = models.DateTimeField(auto_now=True, help_text=_("when the resourceName was last looked up"))
+
+    def __str__(self):
+        return f"user={self.user} resource_name={self.resource_name}"
+
+
+class VenmoUserLookup(models.Model):
+    """Caches the Venmo user id a username resolved to, or that it didn't resolve to any (`venmo_id` is null)."""
+
+    venmo_username = models.CharField(max_length=64, unique=True, help_text=_("the Venmo username that was looked up"))
+    venmo_id = models.CharField(
+        max_length=64, blank=True, null=True, help_text=_("the username's Venmo user id, if Venmo found one")
+    )
+    date_cached = models.DateTimeField(auto_now=True, help_text=_("when the username was last looked up"))
+
+    def __str__(self):
+        return f"venmo_username={self.venmo_username} venmo_id={self.venmo_id}"
+
+
+class OutboxMessage(models.Model):
+    """An external side effect (i.e.: a bill's Venmo payment request), written in the same transaction as the change
+    that causes it, for an `OutboxWorker` to carry out later."""
+
+    class Kind(models.TextChoices):
+        VENMO_REQUEST = "VENMO_REQUEST", _("Send a bill's Venmo payment request")
+        GOOGLE_REMOVE_LABEL = "GOOGLE_REMOVE_LABEL", _("Remove an expired subscriber's Google contact label")
+
+    class Status(models.TextChoices):
+        PENDING = "PENDING", _("Pending")
+        PROCESSING = "PROCESSING", _("Processing")
+        DONE = "DONE", _("Done")
+        FAILED = "FAILED", _("Failed")
+
+    kind = models.CharField(choices=Kind.choices, max_length=32, help_text=_("the side effect to carry out"))
+    idempotency_key = models.CharField(
+        max_length=255,
+        unique=True,
+        help_text=_("identifies the side effect, so enqueueing it again (i.e.: from a retried run) is a no-op"),
+    )
+    payload = models.JSONField(default=dict, help_text=_("what the side effect needs (i.e.: the bill's id)"))
+    status = models.CharField(choices=Status.choices, default=Status.PENDING, max_length=10)
+    attempts = models.PositiveSmallIntegerField(default=0, help_text=_("how many times processing was attempted"))
+    last_error = models.TextField(blank=True, default="", help_text=_("the last error encountered processing it"))
+    claimed_by = models.CharField(
+        blank=True, default="", max_length=32, help_text=_("the worker processing it (or that last did)")
+    )
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_available = models.DateTimeField(
+        default=timezone.now, help_text=_("when it may next be processed, which failed attempts push back")
+    )
+    date_claimed = models.DateTimeField(blank=True, null=True, help_text=_("when a worker last claimed it"))
+    date_processed = models.DateTimeField(blank=True, null=True, help_text=_("when it was done (or given up on)"))
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["date_available"],
+                name="payablesubs_outbox_pending_idx",
+                condition=models.Q(status="PENDING"),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} key={self.idempotency_key} status={self.status} attempts={self.attempts}"
@@ -9,6 +9,7 @@ from django.utils import timezone
 from django.contrib.auth.models import User, Group
 from subscriptions.models import PlanTag, SubscriptionPlan, PlanCost, MONTH, YEAR, ONCE, PlanList, PlanListDetail, UserSubscription
 from payablesubs.models import VenmoAccount
+from payablesubs.management.commands._venmo_lookup import VenmoUserResolver
 
 TOKEN_KEY = "VENMO_ACCESS_TOKEN"
 
@@ -86,6 +87,7 @@ now = timezone.now()
 next_bill = now + timedelta(days=30)
 access_token = os.environ[TOKEN_KEY] if TOKEN_KEY in os.environ else getpass("Venmo Access Token: ")
 client = Client(access_token)
+resolver = VenmoUserResolver(client)
 with open('initial_users.csv', newline='') as csvfile:
     csv_reader = csv.reader(csvfile)
     for row in csv_reader:
@@ -107,8 +109,11 @@ with open('initial_users.csv', newline='') as csvfile:
             date_billing_next=next_bill
         )
         if "N/A" != venmo_username:
-            from_venmo = client.user.get_user_by_username(venmo_username)
-            VenmoAccount.objects.create( user=user, venmo_username=venmo_username, venmo_id=from_venmo.id)
+            venmo_id = resolver.resolve_one(venmo_username)
+            if not venmo_id:
+                print(f"Skipping VenmoAccount for {user}: no Venmo user found for {venmo_username=}")
+                continue
+            VenmoAccount.objects.create( user=user, venmo_username=venmo_username, venmo_id=venmo_id)
             username_to_venmo_usernames[email] = venmo_username
 
 
@@ -28,6 +28,9 @@ setup(
         'google-auth-httplib2>=0.1.0',
         'google-auth-oauthlib>=0.8.0',
     ],
+    extras_require={
+        'reconcile': ['numpy>=1.21'],
+    },
     tests_require=[
         'pytest>=6.0.0',
     ],
@@ -8,6 +8,8 @@ import venmo_api
 import uuid
 
 import pytest
+
+import payablesubs.clients.venmo as venmo
 from payablesubs.management.commands.add_subscription import Command
 from test_models import create_due_subscription, create_user_and_group, create_venmo_user, create_cost, TEST_PLAN_GRACE_DAYS, create_subscription
 from subscriptions.models import UserSubscription
@@ -23,6 +25,10 @@ MOCK_PROFILE_VENMO_USER = venmo_api.models.user.User(MOCK_PROFILE_VENMO_ID, "roo
 
 pytestmark = pytest.mark.django_db  # pylint: disable=invalid-name
 
+@pytest.fixture(autouse=True)
+def clear_lookup_cache():
+    venmo.clear_lookup_cache()
+
 @pytest.fixture
 def subscription(django_user_model):
     john, _ = create_user_and_group(django_user_model)
@@ -108,3 +114,31 @@ def test_add_sub_right_cost(mock_getpass_func, subscription, command):
 
     assert get_user_model().objects.count() == 2
     assert UserSubscription.objects.count() == 2
+
+@pytest.mark.parametrize("get_user_by_username, message", [
+    (Mock(return_value=None), "No Venmo user found for venmo_username='user-venmo-username'."),
+    (Mock(side_effect=Exception("Connection reset")),
+     "Failed to look up Venmo user venmo_username='user-venmo-username'. Try again later."),
+])
+@mock.patch('payablesubs.management.commands.add_subscription.getpass')
+def test_add_sub_venmo_user_not_resolved(mock_getpass_func, get_user_by_username, message, subscription, command):
+    command.venmo_client.user.get_user_by_username = get_user_by_username
+    args = {
+        "first_name": "Jane",
+        "last_name": "Doe",
+        "email": "janedoe@email.com",
+        "plan": "Test Plan",
+        "start_date": datetime.fromisoformat("2022-01-15"),
+        "cost": None,
+        "venmo_username": MOCK_VENMO_USERNAME,
+    }
+    mock_getpass_func.return_value = 'mocked-password'
+
+    with pytest.raises(RuntimeError) as excinfo:
+        command.handle(**args)
+
+    assert message == str(excinfo.value)
+    # i.e.: nothing was created, so running the command again doesn't subscribe Jane twice
+    assert get_user_model().objects.count() == 1
+    assert UserSubscription.objects.count() == 1
+    mock_getpass_func.assert_not_called()
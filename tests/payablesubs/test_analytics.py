@@ -0,0 +1,117 @@
+"""Tests for the analytics module and subscription_analytics command."""
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone as django_timezone
+from subscriptions import models
+
+from payablesubs import analytics
+from payablesubs.models import Bill, Payment
+from test_models import create_cost, create_subscription, create_user_and_group
+
+pytestmark = pytest.mark.django_db  # pylint: disable=invalid-name
+
+
+@pytest.fixture
+def history(django_user_model):
+    """John's current bill is paid, Jane's isn't, and Jack's subscription ended last month."""
+    now = django_timezone.now()
+    date_start = now - timedelta(days=60)
+    bill_date = now - timedelta(days=1)
+    subscriptions = {}
+    for first_name in ("John", "Jane", "Jack"):
+        user, group = create_user_and_group(django_user_model, first_name=first_name)
+        cost = create_cost(group, amount=Decimal(12), name=f"{first_name} Plan")
+        subscriptions[first_name] = create_subscription(user, cost=cost, date_start=date_start, date_next=bill_date)
+        Bill.objects.create(user=user, subscription=cost, amount=cost.cost, date_transaction=bill_date)
+
+    john = subscriptions["John"]
+    Payment.objects.create(user=john.user, subscription=john.subscription, amount=Decimal(12),
+                           date_transaction=bill_date, host_payment_id=1, method=Payment.PaymentMethod.VENMO)
+    john.date_billing_next = bill_date + timedelta(days=30)
+    john.save()
+
+    jack = subscriptions["Jack"]
+    jack.active = False
+    jack.date_billing_end = now - timedelta(days=1)
+    jack.save()
+    return subscriptions
+
+
+def test_monthly_cost():
+    assert analytics.monthly_cost(Decimal(12), 1, models.MONTH) == Decimal(12)
+    assert analytics.monthly_cost(Decimal(12), 6, models.MONTH) == Decimal(2)
+    assert analytics.monthly_cost(Decimal(120), 1, models.YEAR) == Decimal(10)
+    assert analytics.monthly_cost(Decimal(7), 1, models.WEEK) == Decimal("30.44")
+    assert analytics.monthly_cost(Decimal(12), 1, models.ONCE) == Decimal(0)
+
+
+def test_compute(history):
+    results = analytics.compute()
+    assert results["mrr"] == Decimal(24)
+    assert results["active_subscriptions"] == 2
+    assert {p["plan"] for p in results["mrr_by_plan"]} == {"John Plan", "Jane Plan"}
+
+    # Jane's bill (Jack's subscription is inactive)
+    assert results["outstanding"]["bills"] == 1
+    assert results["outstanding"]["amount"] == Decimal(12)
+
+    assert sum(row["bills"] for row in results["billed_by_month"]) == 3
+    assert sum(row["amount"] for row in results["collected_by_month"]) == Decimal(12)
+    assert sum(row["ended"] for row in results["churn_by_month"]) == 1
+    assert sum(row["started"] for row in results["churn_by_month"]) == 3
+    assert sum(row["active"] for row in results["cohorts"]) == 2
+
+
+def test_compute_bills_without_amount(django_user_model):
+    user, group = create_user_and_group(django_user_model)
+    sub = create_subscription(user, group=group, date_next=django_timezone.now() - timedelta(days=1))
+    sub.active = True
+    sub.save()
+    Bill.objects.create(user=user, subscription=sub.subscription, date_transaction=sub.date_billing_next)
+
+    results = analytics.compute()
+    assert results["outstanding"]["bills"] == 1
+    assert results["outstanding"]["amount"] == Decimal(0)
+    assert [row["amount"] for row in results["billed_by_month"]] == [Decimal(0)]
+
+    out = StringIO()
+    call_command("subscription_analytics", stdout=out)
+    assert "Outstanding: 1 bills, $0.00" in out.getvalue()
+
+
+def test_compute_queries_independent_of_count(history, django_user_model, django_assert_max_num_queries):
+    for i in range(10):
+        user, group = create_user_and_group(django_user_model, first_name=f"Extra{i}")
+        create_subscription(user, group=group)
+    # one aggregate query per figure, and two for churn
+    with django_assert_max_num_queries(7):
+        analytics.compute()
+
+
+def test_get_analytics_cached(history, settings):
+    settings.PAYABLESUBS_ANALYTICS_CACHE_TIMEOUT = 60
+    cache.clear()
+    assert analytics.get_analytics()["active_subscriptions"] == 2
+
+    history["Jane"].delete()
+    assert analytics.get_analytics()["active_subscriptions"] == 2
+    assert analytics.get_analytics(refresh=True)["active_subscriptions"] == 1
+
+
+def test_subscription_analytics_command(history):
+    out = StringIO()
+    call_command("subscription_analytics", stdout=out)
+    assert "MRR: $24.00 from 2 active subscriptions" in out.getvalue()
+    assert "Outstanding: 1 bills, $12.00" in out.getvalue()
+
+    out = StringIO()
+    call_command("subscription_analytics", "--format", "json", stdout=out)
+    results = json.loads(out.getvalue())
+    assert results["mrr"] == "24.00"
+    assert datetime.fromisoformat(results["computed"])
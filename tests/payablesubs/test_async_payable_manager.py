@@ -0,0 +1,109 @@
+"""Tests for the _async_payable_manager module."""
+import time
+from datetime import timedelta
+from unittest.mock import Mock
+
+import pytest
+from django.conf import settings
+
+from subscriptions import models
+from payablesubs.models import Bill, Payment
+from payablesubs.management.commands._async_payable_manager import AsyncPayableManager
+from test_models import create_due_subscription, create_user_and_group, create_venmo_user
+from test_payable_manager import MOCK_PROFILE_VENMO_USER, _create_txn, _venmo_account_to_api_model
+
+REQUEST_LATENCY = 0.2
+
+pytestmark = pytest.mark.django_db  # pylint: disable=invalid-name
+
+
+@pytest.fixture
+def manager():
+    mock_venmo = Mock()
+    mock_venmo.my_profile = Mock(return_value=MOCK_PROFILE_VENMO_USER)
+    mock_venmo.payment.request_money = Mock(return_value=True)
+    mock_venmo.user.get_user_transactions = Mock(return_value=[])
+    return AsyncPayableManager(venmo_client=mock_venmo, google_client=Mock(), concurrency=4)
+
+
+@pytest.fixture
+def subscribers(django_user_model):
+    subscribers = []
+    for first_name in ["John", "Jane", "Jim", "Jill"]:
+        user, group = create_user_and_group(django_user_model, first_name=first_name)
+        venmo_account = create_venmo_user(django_user_model, user)
+        subscribers.append((create_due_subscription(user, group), venmo_account))
+    return subscribers
+
+
+def test_async_due_subscriptions(manager, subscribers):
+    # John paid his subscription; nobody else has
+    john_sub, john_venmo = subscribers[0]
+    john_payment = _create_txn(john_sub.subscription.cost, actor=_venmo_account_to_api_model(john_venmo),
+                               target=MOCK_PROFILE_VENMO_USER, date_completed=john_sub.date_billing_next)
+    manager.venmo_client.user.get_user_transactions = Mock(return_value=[john_payment])
+
+    manager.process_subscriptions()
+
+    assert manager.venmo_client.payment.request_money.call_count == 4
+    assert Bill.objects.filter(status=Bill.SendStatus.SENT).count() == 4
+    assert Payment.objects.get().user == john_sub.user
+    assert models.UserSubscription.objects.get(id=john_sub.id).date_billing_next > john_sub.date_billing_next
+    for sub, _ in subscribers[1:]:
+        assert models.UserSubscription.objects.get(id=sub.id).date_billing_end is not None
+
+
+def test_async_skips_subscriptions_processed_meanwhile(manager, subscribers):
+    """Another worker (i.e.: an overlapping shard) matches John's payment while this run is sending requests."""
+    john_sub, john_venmo = subscribers[0]
+    john_payment = _create_txn(john_sub.subscription.cost, actor=_venmo_account_to_api_model(john_venmo),
+                               target=MOCK_PROFILE_VENMO_USER, date_completed=john_sub.date_billing_next)
+    manager.venmo_client.user.get_user_transactions = Mock(return_value=[john_payment])
+    other_date_next = john_sub.date_billing_next + timedelta(days=31)
+
+    update_due_subscription = manager._update_due_subscription
+
+    def processed_meanwhile(subscription, matched_txn):
+        if subscription.id == john_sub.id:
+            Payment.objects.create(user=john_sub.user, subscription=john_sub.subscription, amount=matched_txn.amount,
+                                   date_transaction=matched_txn.date_transaction,
+                                   host_payment_id=matched_txn.host_payment_id,
+                                   method=Payment.PaymentMethod.VENMO)
+            models.UserSubscription.objects.filter(id=john_sub.id).update(date_billing_next=other_date_next)
+        update_due_subscription(subscription, matched_txn)
+
+    manager._update_due_subscription = processed_meanwhile
+    manager.process_subscriptions()
+
+    # i.e.: the other worker's payment and changes are kept, while everyone else's are still written
+    assert Payment.objects.count() == 1
+    assert models.UserSubscription.objects.get(id=john_sub.id).date_billing_next == other_date_next
+    for sub, _ in subscribers[1:]:
+        assert models.UserSubscription.objects.get(id=sub.id).date_billing_end is not None
+
+
+def test_async_sends_requests_concurrently(manager, subscribers):
+    manager.venmo_client.payment.request_money = Mock(side_effect=lambda *args: time.sleep(REQUEST_LATENCY) or True)
+    settings.PAYABLESUBS_VENMO_REQUESTS_PER_SECOND = 1000
+    try:
+        start = time.monotonic()
+        manager.process_subscriptions()
+        elapsed = time.monotonic() - start
+    finally:
+        del settings.PAYABLESUBS_VENMO_REQUESTS_PER_SECOND
+
+    assert Bill.objects.filter(status=Bill.SendStatus.SENT).count() == 4
+    assert elapsed < REQUEST_LATENCY * len(subscribers)
+
+
+def test_async_dry_run(manager, subscribers):
+    settings.PAYABLESUBS_DRY_RUN = True
+    try:
+        manager.process_subscriptions()
+    finally:
+        settings.PAYABLESUBS_DRY_RUN = False
+
+    manager.venmo_client.payment.request_money.assert_not_called()
+    assert Bill.objects.count() == 0
+    for sub, _ in subscribers:
+        assert models.UserSubscription.objects.get(id=sub.id).date_billing_end is None
@@ -0,0 +1,177 @@
+"""Tests for the _billing_daemon module and run_billing_daemon command."""
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import Mock
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone as django_timezone
+from subscriptions.models import UserSubscription
+
+from payablesubs.management.commands._billing_daemon import BillingDaemon, BillingScheduler, deadline
+from payablesubs.management.commands._payable_manager import PayableManager
+from payablesubs.management.commands.run_billing_daemon import Command
+from test_models import TEST_PLAN_GRACE_DAYS, create_due_subscription, create_subscription, create_user_and_group
+from test_payable_manager import MOCK_PROFILE_VENMO_USER
+
+pytestmark = pytest.mark.django_db  # pylint: disable=invalid-name
+
+NOW = django_timezone.now()
+
+
+@pytest.fixture(autouse=True)
+def close_old_connections(monkeypatch):
+    # i.e.: it would close the connection holding each test's transaction
+    mock = Mock()
+    monkeypatch.setattr("payablesubs.management.commands._billing_daemon.close_old_connections", mock)
+    return mock
+
+
+@pytest.fixture
+def manager():
+    venmo_client = Mock()
+    venmo_client.my_profile = Mock(return_value=MOCK_PROFILE_VENMO_USER)
+    venmo_client.user.get_user_transactions = Mock(return_value=[])
+    venmo_client.payment.request_money = Mock(return_value=True)
+    return PayableManager(venmo_client=venmo_client, google_client=Mock())
+
+
+@pytest.fixture
+def user_and_group(django_user_model):
+    return create_user_and_group(django_user_model)
+
+
+def _upcoming_subscription(user, group, days=3):
+    date_start, date_next = NOW - timedelta(days=30), NOW + timedelta(days=days)
+    sub = create_subscription(user, group=group, date_start=date_start, date_next=date_next)
+    sub.active = True
+    sub.save()
+    return sub
+
+
+def test_deadline():
+    start, due, end = NOW - timedelta(days=30), NOW - timedelta(days=1), NOW + timedelta(days=6)
+    assert deadline(False, True, start, due, end, NOW) == (None, False)
+    assert deadline(False, False, start, None, None, NOW) == (start, False)
+    assert deadline(True, False, start, NOW + timedelta(days=3), None, NOW) == (NOW + timedelta(days=3), False)
+    # i.e.: the bill is awaiting payment until the grace period ends
+    assert deadline(True, False, start, due, end, NOW) == (end, True)
+
+
+def test_scheduler_orders_and_reschedules():
+    scheduler = BillingScheduler()
+    subs = [Mock(id=i, active=True, cancelled=False, date_billing_start=NOW, date_billing_end=None) for i in range(3)]
+    for days, sub in zip([3, 1, 2], subs):
+        sub.date_billing_next = NOW + timedelta(days=days)
+        scheduler.schedule(sub, now=NOW)
+    assert scheduler.next_deadline() == NOW + timedelta(days=1)
+
+    # moving the earliest one back leaves a stale heap entry, which is skipped
+    subs[1].date_billing_next = NOW + timedelta(days=5)
+    scheduler.schedule(subs[1], now=NOW)
+    assert scheduler.next_deadline() == NOW + timedelta(days=2)
+    assert scheduler.pop_due(NOW + timedelta(days=4)) == [2, 0]
+    assert len(scheduler) == 1
+
+    scheduler.unschedule(1)
+    assert scheduler.next_deadline() is None
+
+
+def test_scheduler_load(user_and_group, django_user_model):
+    user, group = user_and_group
+    upcoming = _upcoming_subscription(user, group)
+    other, _ = create_user_and_group(django_user_model, first_name="Jane")
+    due = create_due_subscription(other, group)
+    UserSubscription.objects.filter(id=due.id).update(active=True, date_billing_end=NOW + timedelta(days=2))
+
+    scheduler = BillingScheduler()
+    scheduler.load()
+    assert len(scheduler) == 2
+    assert scheduler.awaiting_ids() == {due.id}
+    assert scheduler.next_deadline() == NOW + timedelta(days=2)
+
+    upcoming.delete()
+    scheduler.load()
+    assert len(scheduler) == 1
+
+
+def test_signals_reschedule_saved_subscriptions(manager, user_and_group):
+    daemon = BillingDaemon(manager)
+    daemon.connect()
+    try:
+        sub = _upcoming_subscription(*user_and_group)
+        assert daemon.scheduler.next_deadline() == sub.date_billing_next
+
+        sub.cancelled = True
+        sub.save()
+        assert len(daemon.scheduler) == 0
+    finally:
+        daemon.disconnect()
+
+
+def test_step_sleeps_until_next_deadline(user_and_group):
+    sub = _upcoming_subscription(*user_and_group)
+    manager = Mock()
+    daemon = BillingDaemon(manager, poll_seconds=60, resync_seconds=10 * 24 * 3600)
+
+    seconds = daemon.step()
+    manager.process_subscriptions.assert_not_called()
+    assert seconds == pytest.approx((sub.date_billing_next - django_timezone.now()).total_seconds(), abs=5)
+
+
+def test_due_subscription_polled_until_paid(manager, user_and_group):
+    sub = _upcoming_subscription(*user_and_group, days=-1)
+    daemon = BillingDaemon(manager, poll_seconds=60)
+
+    # i.e.: billed, then awaiting payment until the end of its grace period
+    assert daemon.step() == pytest.approx(60, abs=5)
+    assert daemon.runs == 1
+    assert daemon.scheduler.awaiting_ids() == {sub.id}
+    date_end = UserSubscription.objects.get(id=sub.id).date_billing_end
+    assert date_end == sub.date_billing_next + timedelta(days=TEST_PLAN_GRACE_DAYS)
+
+    daemon.step()
+    assert daemon.runs == 1
+
+    daemon._last_run -= timedelta(seconds=60)
+    daemon.step()
+    assert daemon.runs == 2
+
+
+def test_failed_run_retried_after_poll_interval(user_and_group):
+    sub = create_due_subscription(*user_and_group)
+    UserSubscription.objects.filter(id=sub.id).update(active=True, date_billing_end=NOW - timedelta(days=1))
+    manager = Mock()
+    manager.process_subscriptions = Mock(side_effect=Exception("Venmo is down"))
+    daemon = BillingDaemon(manager, poll_seconds=60)
+
+    assert daemon.step() == pytest.approx(60, abs=5)
+    assert daemon.step() == pytest.approx(60, abs=5)
+    manager.process_subscriptions.assert_called_once()
+    assert daemon.scheduler.pop_due(django_timezone.now() + timedelta(seconds=60)) == [sub.id]
+
+
+def test_unprocessed_deadline_deferred(user_and_group, close_old_connections):
+    """A subscription left due (i.e.: locked by another worker) is retried after the poll interval, not immediately."""
+    user, group = user_and_group
+    sub = create_subscription(user, group=group, date_start=NOW - timedelta(minutes=1))
+    UserSubscription.objects.filter(id=sub.id).update(active=False)
+    manager = Mock()
+    daemon = BillingDaemon(manager, poll_seconds=60)
+
+    assert daemon.step() == pytest.approx(60, abs=5)
+    assert daemon.step() == pytest.approx(60, abs=5)
+    manager.process_subscriptions.assert_called_once()
+    assert daemon.scheduler.next_deadline() > sub.date_billing_start + timedelta(seconds=60)
+    # before and after each step
+    assert close_old_connections.call_count == 4
+
+
+def test_run_billing_daemon_command(manager, user_and_group):
+    sub = create_due_subscription(*user_and_group)
+    UserSubscription.objects.filter(id=sub.id).update(active=True, date_billing_end=NOW - timedelta(days=1))
+
+    out = StringIO()
+    call_command(Command(manager=manager), max_runs=1, stdout=out)
+    assert "stopped after 1 runs" in out.getvalue()
+    assert UserSubscription.objects.get(id=sub.id).cancelled is True
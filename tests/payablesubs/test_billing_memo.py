@@ -0,0 +1,53 @@
+"""Tests for the _billing_memo module."""
+from datetime import datetime, timezone
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytest
+from subscriptions import models
+
+from payablesubs.management.commands._billing_memo import BillingMemo
+from test_models import create_cost, create_user_and_group
+
+pytestmark = pytest.mark.django_db  # pylint: disable=invalid-name
+
+JAN1_2018 = datetime(2018, 1, 1, 1, 1, 1, tzinfo=timezone.utc)
+FEB1_2018 = datetime(2018, 2, 1, 1, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def plan_cost(django_user_model):
+    _, group = create_user_and_group(django_user_model)
+    return create_cost(group, amount=Decimal(5), recurrence_period=6, recurrence_unit=models.MONTH)
+
+
+def test_next_billing_datetime_memoized(plan_cost):
+    memo = BillingMemo()
+    expected = plan_cost.next_billing_datetime(JAN1_2018)
+    with patch.object(type(plan_cost), "next_billing_datetime", return_value=expected) as next_billing_datetime:
+        assert memo.next_billing_datetime(plan_cost, JAN1_2018) == expected
+        assert memo.next_billing_datetime(plan_cost, JAN1_2018) == expected
+    next_billing_datetime.assert_called_once_with(JAN1_2018)
+    assert memo.stats() == {"next_billing_datetime": {"hits": 1, "misses": 1, "size": 1}}
+
+
+def test_duration(plan_cost):
+    memo = BillingMemo()
+    assert memo.duration(plan_cost, JAN1_2018) == "Jan - Jun 2018"
+    assert memo.duration(plan_cost, JAN1_2018) == "Jan - Jun 2018"
+    assert memo.stats()["duration"] == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_bounded_lru(plan_cost):
+    memo = BillingMemo(max_size=1)
+    memo.next_billing_datetime(plan_cost, JAN1_2018)
+    memo.next_billing_datetime(plan_cost, FEB1_2018)
+    memo.next_billing_datetime(plan_cost, JAN1_2018)
+    assert memo.stats()["next_billing_datetime"] == {"hits": 0, "misses": 3, "size": 1}
+
+
+def test_clear(plan_cost):
+    memo = BillingMemo()
+    memo.duration(plan_cost, JAN1_2018)
+    memo.clear()
+    assert memo.stats() == {}
@@ -0,0 +1,182 @@
+"""Tests for the google client module."""
+from unittest.mock import Mock
+
+import pytest
+
+import payablesubs.clients.google as google
+from payablesubs.models import GoogleContact
+from test_models import create_user_and_group
+
+TEST_CONTACT_LABEL = "abcdefg"
+
+pytestmark = pytest.mark.django_db  # pylint: disable=invalid-name
+
+
+@pytest.fixture(autouse=True)
+def google_enabled():
+    google.GOOGLE_CONTACT_GROUP_ID = TEST_CONTACT_LABEL
+    yield
+    google.GOOGLE_CONTACT_GROUP_ID = None
+
+
+def _client(contacts, members, created=None):
+    """Mocks a People API client with existing `contacts` (email -> resourceName) and contact group `members`."""
+    client = Mock()
+    connections = [{"resourceName": name, "emailAddresses": [{"value": email}]} for email, name in contacts.items()]
+    client.people().connections().list().execute = Mock(return_value={"connections": connections})
+    client.contactGroups().get().execute = Mock(return_value={"memberResourceNames": members})
+    created_people = [
+        {"person": {"resourceName": name, "emailAddresses": [{"value": email}]}} for email, name in (created or {}).items()
+    ]
+    client.people().batchCreateContacts().execute = Mock(return_value={"createdPeople": created_people})
+    client.contactGroups().members().modify().execute = Mock(return_value={})
+    return client
+
+
+def _modify_bodies(client):
+    return [call.kwargs["body"] for call in client.contactGroups().members().modify.call_args_list if call.kwargs]
+
+
+def test_reconcile_adds_and_removes(django_user_model):
+    john, _ = create_user_and_group(django_user_model, first_name="John")
+    jane, _ = create_user_and_group(django_user_model, first_name="Jane")
+    client = _client(
+        contacts={john.email: "people/john", jane.email.upper(): "people/jane", "old@email.com": "people/old"},
+        members=["people/john", "people/old"],
+    )
+
+    added, removed = google.reconcile_contact_label([john, jane], client=client)
+
+    assert added == {"people/jane"}
+    assert removed == {"people/old"}
+    assert _modify_bodies(client) == [{"resourceNamesToAdd": ["people/jane"]}, {"resourceNamesToRemove": ["people/old"]}]
+
+
+def test_reconcile_creates_missing_contacts(django_user_model):
+    john, _ = create_user_and_group(django_user_model, first_name="John")
+    client = _client(contacts={}, members=[], created={john.email: "people/john"})
+
+    added, removed = google.reconcile_contact_label([john], client=client)
+
+    assert added == {"people/john"}
+    assert removed == set()
+    body = client.people().batchCreateContacts.call_args.kwargs["body"]
+    assert body["contacts"][0]["contactPerson"]["emailAddresses"] == [{"value": john.email}]
+
+
+def test_reconcile_no_changes(django_user_model):
+    john, _ = create_user_and_group(django_user_model, first_name="John")
+    client = _client(contacts={john.email: "people/john"}, members=["people/john"])
+
+    assert google.reconcile_contact_label([john], client=client) == (set(), set())
+    assert _modify_bodies(client) == []
+
+
+def test_reconcile_chunks_modify(django_user_model):
+    members = [f"people/{i}" for i in range(google.MODIFY_CHUNK_SIZE + 1)]
+    client = _client(contacts={}, members=members)
+
+    _, removed = google.reconcile_contact_label([], client=client)
+
+    assert len(removed) == len(members)
+    assert [len(body["resourceNamesToRemove"]) for body in _modify_bodies(client)] == [google.MODIFY_CHUNK_SIZE, 1]
+
+
+def test_add_contact_labels_batched(django_user_model):
+    john, _ = create_user_and_group(django_user_model, first_name="John")
+    jane, _ = create_user_and_group(django_user_model, first_name="Jane")
+    client = _client(contacts={john.email: "people/john"}, members=[], created={jane.email: "people/jane"})
+
+    assert google.add_contact_labels([john, jane], client=client) == {"people/john", "people/jane"}
+    assert _modify_bodies(client) == [{"resourceNamesToAdd": ["people/jane", "people/john"]}]
+    client.people().searchContacts.assert_not_called()
+
+
+def test_reconcile_disabled():
+    google.GOOGLE_CONTACT_GROUP_ID = None
+    client = Mock()
+    assert google.reconcile_contact_label([], client=client) == (set(), set())
+    client.contactGroups.assert_not_called()
+
+
+def _search_client(resource_name):
+    client = Mock()
+    client.people().searchContacts().execute = Mock(
+        return_value={"results": [{"person": {"resourceName": resource_name}}]}
+    )
+    client.contactGroups().members().modify().execute = Mock(return_value={})
+    return client
+
+
+def test_add_contact_label_caches_resource_name(django_user_model):
+    john, _ = create_user_and_group(django_user_model, first_name="John")
+    client = _search_client("people/john")
+
+    google.add_contact_label(john, client=client)
+    google.remove_contact_label(john, client=client)
+
+    client.people().searchContacts().execute.assert_called_once()
+    assert GoogleContact.objects.get(user=john).resource_name == "people/john"
+    assert _modify_bodies(client) == [{"resourceNamesToAdd": ["people/john"]}, {"resourceNamesToRemove": ["people/john"]}]
+
+
+def test_expired_cache_searches_again(django_user_model, settings):
+    john, _ = create_user_and_group(django_user_model, first_name="John")
+    GoogleContact.objects.create(user=john, resource_name="people/john")
+    settings.PAYABLESUBS_GOOGLE_CONTACT_CACHE_TTL_DAYS = 0
+    client = _search_client("people/john")
+
+    google.remove_contact_label(john, client=client)
+    client.people().searchContacts().execute.assert_called_once()
+
+
+def test_not_found_cache_invalidated(django_user_model):
+    john, _ = create_user_and_group(django_user_model, first_name="John")
+    GoogleContact.objects.create(user=john, resource_name="people/deleted")
+    client = _search_client("people/john")
+    # i.e.: `modify` succeeds for deleted (or merged) contacts, only listing them as not found
+    client.contactGroups().members().modify().execute = Mock(
+        side_effect=[{"notFoundResourceNames": ["people/deleted"]}, {}]
+    )
+
+    google.remove_contact_label(john, client=client)
+
+    client.people().searchContacts().execute.assert_called_once()
+    assert GoogleContact.objects.get(user=john).resource_name == "people/john"
+    assert _modify_bodies(client) == [
+        {"resourceNamesToRemove": ["people/deleted"]},
+        {"resourceNamesToRemove": ["people/john"]},
+    ]
+
+
+def test_reconcile_not_found_cache_invalidated(django_user_model):
+    john, _ = create_user_and_group(django_user_model, first_name="John")
+    jane, _ = create_user_and_group(django_user_model, first_name="Jane")
+    GoogleContact.objects.create(user=john, resource_name="people/merged")
+    GoogleContact.objects.create(user=jane, resource_name="people/jane")
+    client = _client(contacts={john.email: "people/john"}, members=["people/john-old"])
+    client.contactGroups().members().modify().execute = Mock(
+        side_effect=[{"notFoundResourceNames": ["people/merged"]}, {}, {}]
+    )
+
+    added, removed = google.reconcile_contact_label([john, jane], client=client)
+
+    assert added == {"people/jane", "people/john"}
+    assert removed == {"people/john-old"}
+    assert GoogleContact.objects.get(user=john).resource_name == "people/john"
+    assert _modify_bodies(client) == [
+        {"resourceNamesToAdd": ["people/jane", "people/merged"]},
+        {"resourceNamesToAdd": ["people/john"]},
+        {"resourceNamesToRemove": ["people/john-old"]},
+    ]
+
+
+def test_reconcile_uses_cache(django_user_model):
+    john, _ = create_user_and_group(django_user_model, first_name="John")
+    GoogleContact.objects.create(user=john, resource_name="people/john")
+    client = _client(contacts={}, members=[])
+
+    added, _ = google.reconcile_contact_label([john], client=client)
+
+    assert added == {"people/john"}
+    client.people().connections().list().execute.assert_not_called()
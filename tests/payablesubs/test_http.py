@@ -0,0 +1,85 @@
+"""Tests for the clients' _http module."""
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+from requests.adapters import HTTPAdapter
+from venmo_api import UserApi
+
+import payablesubs.clients.google as google
+import payablesubs.clients.venmo as venmo
+from payablesubs.clients import _http
+
+
+def test_pooled_session_is_sized(settings):
+    settings.PAYABLESUBS_HTTP_POOL_SIZE = 16
+    session = _http.pooled_session()
+    adapter = session.get_adapter("https://api.venmo.com/v1/me")
+    assert isinstance(adapter, _http.PooledAdapter)
+    assert adapter._pool_maxsize == 16
+    # only connection errors are retried
+    assert adapter.max_retries.read is False
+    assert adapter.max_retries.total == _http.DEFAULT_CONNECT_RETRIES
+
+
+def test_pooled_adapter_default_timeout(settings):
+    settings.PAYABLESUBS_HTTP_TIMEOUT_SECONDS = 5
+    adapter = _http.PooledAdapter()
+    with mock.patch.object(HTTPAdapter, "send") as send:
+        adapter.send("request", timeout=None)
+        assert send.call_args.kwargs["timeout"] == 5
+        adapter.send("request", timeout=1)
+        assert send.call_args.kwargs["timeout"] == 1
+
+
+def test_thread_http_per_thread():
+    creds = Credentials(token="token")
+    assert _http.thread_http(creds) is _http.thread_http(creds)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        other = pool.submit(_http.thread_http, creds).result()
+    assert other is not _http.thread_http(creds)
+    assert other.credentials is creds
+
+    # new credentials get a new transport
+    assert _http.thread_http(Credentials(token="other")) is not other
+
+
+def test_shared_resource_uses_calling_threads_http():
+    creds = Credentials(token="token")
+    client = build(
+        "people",
+        "v1",
+        http=_http.thread_http(creds),
+        requestBuilder=_http.thread_request_builder(creds),
+        static_discovery=True,
+    )
+
+    def request_http():
+        return client.contactGroups().get(resourceName="contactGroups/test").http
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        https = [pool.submit(request_http).result() for _ in range(2)]
+    assert request_http() is _http.thread_http(creds)
+    assert all(http is not request_http() for http in https)
+
+
+def test_venmo_client_session_is_pooled(settings):
+    settings.PAYABLESUBS_VENMO_API_HOST = "http://127.0.0.1:8001/v1/"
+    with mock.patch.object(UserApi, "get_my_profile", return_value="profile") as get_my_profile:
+        client = venmo.build_client("token")
+    get_my_profile.assert_called_once()
+    assert client.my_profile() == "profile"
+
+    api_client = client._Client__api_client
+    assert api_client.configuration["host"] == "http://127.0.0.1:8001/v1"
+    assert api_client.session.headers["Authorization"] == "Bearer token"
+    assert isinstance(api_client.session.get_adapter("http://127.0.0.1:8001/v1"), _http.PooledAdapter)
+    assert client.payment is not None
+
+
+def test_google_client_host(settings):
+    settings.PAYABLESUBS_GOOGLE_API_HOST = "http://127.0.0.1:8002/"
+    client = google.build_client(Credentials(token="token"))
+    request = client.people().searchContacts(query="jane@email.com", readMask="emailAddresses")
+    assert request.uri.startswith("http://127.0.0.1:8002/v1/people:searchContacts?")
@@ -0,0 +1,146 @@
+"""Tests for the import_subscriptions module."""
+import json
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+from unittest.mock import Mock
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connections
+from subscriptions.models import UserSubscription
+
+import payablesubs.clients.venmo as venmo
+from payablesubs.management.commands.import_subscriptions import Command
+from payablesubs.models import VenmoAccount
+from test_models import create_cost, create_user_and_group, create_venmo_user
+
+pytestmark = pytest.mark.django_db  # pylint: disable=invalid-name
+
+CSV_HEADER = "first_name,last_name,email,plan,start_date,cost,venmo_username\n"
+
+
+@pytest.fixture(autouse=True)
+def clear_lookup_cache():
+    venmo.clear_lookup_cache()
+
+
+@pytest.fixture
+def plan_costs(django_user_model):
+    _, group = create_user_and_group(django_user_model)
+    monthly = create_cost(group, amount=Decimal(2))
+    yearly = create_cost(group, plan=monthly.plan, amount=Decimal(24))
+    return monthly, yearly
+
+
+@pytest.fixture
+def venmo_client():
+    client = Mock()
+    client.user.get_user_by_username = Mock(side_effect=lambda username: SimpleNamespace(id=f"id-{username}"))
+    return client
+
+
+def _import(venmo_client, path, **options):
+    command = Command(venmo_client=venmo_client, google_client=Mock())
+    options = {"format": None, "batch_size": 2, "no_google": True, **options}
+    with mock.patch("payablesubs.management.commands.import_subscriptions.google") as google:
+        command.handle(path=str(path), **options)
+    return google
+
+
+def test_import_csv(tmp_path, plan_costs, venmo_client):
+    monthly, yearly = plan_costs
+    path = tmp_path / "subscribers.csv"
+    path.write_text(
+        CSV_HEADER
+        + "Jane,Doe,jane@email.com,Test Plan,2022-01-15,,jane-venmo\n"
+        + "Jack,Doe,jack@email.com,Test Plan,2022-01-15,24,N/A\n"
+        + "Jill,Doe,jill@email.com,Test Plan,,,shared-venmo\n"
+        + "Joe,Doe,joe@email.com,Test Plan,,,shared-venmo\n"
+        + "Bad,Doe,bad@email.com,Missing Plan,,,\n"
+    )
+    _import(venmo_client, path)
+
+    assert get_user_model().objects.count() == 5  # including the fixture's user
+    assert UserSubscription.objects.count() == 4
+    assert UserSubscription.objects.get(user__email="jack@email.com").subscription == yearly
+    assert UserSubscription.objects.get(user__email="jane@email.com").subscription == monthly
+    assert not get_user_model().objects.get(email="jane@email.com").has_usable_password()
+
+    assert dict(VenmoAccount.objects.values_list("user__email", "venmo_id")) == {
+        "jane@email.com": "id-jane-venmo",
+        "jill@email.com": "id-shared-venmo",
+        "joe@email.com": "id-shared-venmo",
+    }
+    # each username is looked up once
+    assert venmo_client.user.get_user_by_username.call_count == 2
+
+
+def test_import_jsonl_skips_existing(django_user_model, tmp_path, plan_costs, venmo_client):
+    existing, _ = create_user_and_group(django_user_model, first_name="Jim")
+    create_venmo_user(django_user_model, existing, venmo_username="john-venmo", venmo_id="john-id")
+    path = tmp_path / "subscribers.jsonl"
+    rows = [
+        {"first_name": "John", "last_name": "Doe", "email": existing.email, "plan": "Test Plan",
+         "venmo_username": "john-venmo"},
+        {"first_name": "Jane", "last_name": "Doe", "email": "jane@email.com", "plan": "Test Plan",
+         "venmo_username": "john-venmo"},
+    ]
+    path.write_text("\n".join(json.dumps(row) for row in rows) + "\n")
+
+    _import(venmo_client, path)
+    assert UserSubscription.objects.count() == 2
+    assert VenmoAccount.objects.get(user__email="jane@email.com").venmo_id == "john-id"
+    venmo_client.user.get_user_by_username.assert_not_called()
+
+    # importing again doesn't subscribe anyone twice
+    _import(venmo_client, path)
+    assert UserSubscription.objects.count() == 2
+
+
+def test_import_unknown_venmo_user(tmp_path, plan_costs, venmo_client):
+    venmo_client.user.get_user_by_username = Mock(side_effect=Exception("Not found"))
+    path = tmp_path / "subscribers.csv"
+    path.write_text(CSV_HEADER + "Jane,Doe,jane@email.com,Test Plan,,,jane-venmo\n")
+
+    _import(venmo_client, path)
+    assert UserSubscription.objects.count() == 1
+    assert VenmoAccount.objects.count() == 0
+
+
+def test_import_resolves_venmo_users_outside_transaction(tmp_path, plan_costs, venmo_client):
+    # i.e.: the importing thread's connection, since lookups are made from worker threads
+    importing_connection = connections["default"]
+    atomic_depth = len(importing_connection.atomic_blocks)
+    depths = []
+
+    def get_user_by_username(username):
+        depths.append(len(importing_connection.atomic_blocks))
+        return SimpleNamespace(id=f"id-{username}")
+
+    venmo_client.user.get_user_by_username = Mock(side_effect=get_user_by_username)
+    path = tmp_path / "subscribers.csv"
+    path.write_text(CSV_HEADER + "Jane,Doe,jane@email.com,Test Plan,,,jane-venmo\n")
+
+    _import(venmo_client, path)
+    assert depths == [atomic_depth]
+    assert VenmoAccount.objects.get(user__email="jane@email.com").venmo_id == "id-jane-venmo"
+
+
+def test_import_queries_per_batch(tmp_path, plan_costs, venmo_client, django_assert_max_num_queries):
+    path = tmp_path / "subscribers.csv"
+    path.write_text(
+        CSV_HEADER + "".join(f"User{i},Doe,user{i}@email.com,Test Plan,,,user{i}-venmo\n" for i in range(20))
+    )
+    with django_assert_max_num_queries(20):
+        _import(venmo_client, path, batch_size=20)
+    assert UserSubscription.objects.count() == 20
+
+
+def test_import_adds_google_labels_in_one_call(tmp_path, plan_costs, venmo_client):
+    path = tmp_path / "subscribers.csv"
+    path.write_text(CSV_HEADER + "".join(f"User{i},Doe,user{i}@email.com,Test Plan,,,\n" for i in range(5)))
+
+    google = _import(venmo_client, path, no_google=False)
+    google.add_contact_labels.assert_called_once()
+    assert len(google.add_contact_labels.call_args.args[0]) == 5
@@ -0,0 +1,30 @@
+"""Tests for the logformat module."""
+import logging
+from unittest.mock import Mock
+
+from payablesubs.logformat import LazyList
+
+
+def test_lazy_list_truncates(settings):
+    settings.PAYABLESUBS_LOG_MAX_ITEMS = 2
+    assert str(LazyList([1, 2, 3, 4])) == "1\n2\n... and 2 more"
+    assert str(LazyList([1, 2])) == "1\n2"
+    assert str(LazyList([1, 2, 3], truncate=False)) == "1\n2\n3"
+
+
+def test_lazy_list_formatter():
+    assert str(LazyList(["a", "b"], str.upper)) == "A\nB"
+
+
+def test_not_rendered_unless_emitted(caplog):
+    formatter = Mock(return_value="txn")
+    logger = logging.getLogger("payablesubs.test")
+
+    with caplog.at_level(logging.INFO, logger="payablesubs.test"):
+        logger.debug("Matched:\n%s", LazyList(["txn"], formatter))
+    formatter.assert_not_called()
+
+    with caplog.at_level(logging.DEBUG, logger="payablesubs.test"):
+        logger.debug("Matched:\n%s", LazyList(["txn"], formatter))
+    formatter.assert_called_with("txn")
+    assert "Matched:\ntxn" in caplog.text
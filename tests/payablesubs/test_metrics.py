@@ -0,0 +1,94 @@
+"""Tests for the metrics module."""
+import json
+from unittest.mock import Mock
+
+import pytest
+
+from payablesubs import metrics
+from payablesubs.management.commands._payable_manager import PayableManager
+from test_models import create_due_subscription, create_user_and_group, create_venmo_user
+from test_payable_manager import MOCK_PROFILE_VENMO_USER
+
+pytestmark = pytest.mark.django_db  # pylint: disable=invalid-name
+
+
+@pytest.fixture
+def metrics_enabled(settings):
+    settings.PAYABLESUBS_METRICS_ENABLED = True
+    return settings
+
+
+@pytest.fixture
+def due_subscription(django_user_model):
+    user, group = create_user_and_group(django_user_model)
+    create_venmo_user(django_user_model, user)
+    return create_due_subscription(user, group)
+
+
+def _manager():
+    mock_venmo = Mock()
+    mock_venmo.my_profile = Mock(return_value=MOCK_PROFILE_VENMO_USER)
+    mock_venmo.payment.request_money = Mock(return_value=True)
+    mock_venmo.user.get_user_transactions = Mock(return_value=[])
+    return PayableManager(venmo_client=mock_venmo, google_client=Mock())
+
+
+def test_disabled_by_default(due_subscription):
+    manager = _manager()
+    assert manager.metrics is metrics.NULL_METRICS
+    manager.process_subscriptions()
+    assert manager.metrics.summary() == {}
+
+
+def test_run_summary(metrics_enabled, due_subscription):
+    manager = _manager()
+    manager.process_subscriptions()
+
+    summary = manager.metrics.summary()
+    assert summary["queries"] > 0
+    assert {"prefetch", "lock", "bill", "match", "save", "flush", "send", "venmo sync"} <= summary["phases"].keys()
+    assert summary["phases"]["bill"]["calls"] == 1
+    # the bill is written in bulk, when flushed
+    assert summary["phases"]["bill"]["queries"] == 0
+    assert summary["phases"]["flush"]["queries"] > 0
+    assert summary["api_calls"]["venmo.get_user_transactions"]["calls"] == 1
+    assert summary["api_calls"]["venmo.request_money"]["calls"] == 1
+    assert summary["subscriptions_processed"] == 1
+    assert summary["subscriptions"][0]["id"] == due_subscription.id
+
+
+def test_runs_reset(metrics_enabled, due_subscription):
+    manager = _manager()
+    manager.process_subscriptions()
+    manager.process_subscriptions()
+    assert manager.metrics.summary()["phases"]["prefetch"]["calls"] == 1
+
+
+def test_api_call_errors(metrics_enabled):
+    run = metrics.get_metrics()
+    with run.recording():
+        with pytest.raises(ValueError):
+            with metrics.api_call("venmo", "request_money"):
+                raise ValueError("timed out")
+        with metrics.api_call("venmo", "request_money"):
+            pass
+    assert run.api_calls["venmo.request_money"]["calls"] == 2
+    assert run.api_calls["venmo.request_money"]["errors"] == 1
+
+    # not recording anymore
+    with metrics.api_call("venmo", "request_money"):
+        pass
+    assert run.api_calls["venmo.request_money"]["calls"] == 2
+
+
+def test_export(metrics_enabled, due_subscription, tmp_path):
+    metrics_enabled.PAYABLESUBS_METRICS_JSON_FILE = str(tmp_path / "metrics.json")
+    metrics_enabled.PAYABLESUBS_METRICS_PROMETHEUS_FILE = str(tmp_path / "payablesubs.prom")
+    _manager().process_subscriptions()
+
+    exported = json.loads((tmp_path / "metrics.json").read_text())
+    assert [sub["id"] for sub in exported["subscriptions"]] == [str(due_subscription.id)]
+    prometheus = (tmp_path / "payablesubs.prom").read_text()
+    assert "# TYPE payablesubs_run_duration_seconds gauge" in prometheus
+    assert 'payablesubs_phase_calls{phase="bill"} 1' in prometheus
+    assert 'payablesubs_api_calls{service="venmo",method="request_money"} 1' in prometheus
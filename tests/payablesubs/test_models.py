@@ -104,6 +104,15 @@ def test_bill_creation_date_non_nullable(django_user_model):
     assert "NOT NULL constraint failed" in str(excinfo.value)
     assert "date_transaction" in str(excinfo.value)
 
+
+def test_bill_unique_per_period(django_user_model):
+    sub = _setup_subscription(django_user_model)
+    now = django_timezone.now()
+    Bill.objects.create(user=sub.user, subscription=sub.subscription, date_transaction=now, amount=1)
+    with pytest.raises(IntegrityError) as excinfo:
+        Bill.objects.create(user=sub.user, subscription=sub.subscription, date_transaction=now, amount=1)
+    assert "UNIQUE constraint failed" in str(excinfo.value)
+
 def test_cash_payment_creation(django_user_model):
     sub = _setup_subscription(django_user_model)
 
@@ -0,0 +1,149 @@
+"""Tests for the _outbox module and process_outbox command."""
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import Mock
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone as django_timezone
+
+import payablesubs.clients.google as google
+from payablesubs.management.commands._outbox import OutboxWorker, bill_request, contact_label_removal, enqueue
+from payablesubs.management.commands._payable_manager import PayableManager
+from payablesubs.management.commands.process_outbox import Command
+from payablesubs.models import Bill, OutboxMessage
+from test_models import create_due_subscription, create_user_and_group, create_venmo_user
+from test_payable_manager import MOCK_PROFILE_VENMO_USER
+
+pytestmark = pytest.mark.django_db  # pylint: disable=invalid-name
+
+
+@pytest.fixture
+def venmo_client():
+    client = Mock()
+    client.my_profile = Mock(return_value=MOCK_PROFILE_VENMO_USER)
+    client.user.get_user_transactions = Mock(return_value=[])
+    client.payment.request_money = Mock(return_value=True)
+    return client
+
+
+@pytest.fixture
+def due_subscription(django_user_model):
+    user, group = create_user_and_group(django_user_model)
+    create_venmo_user(django_user_model, user)
+    return create_due_subscription(user, group)
+
+
+@pytest.fixture
+def bill(due_subscription):
+    plan_cost = due_subscription.subscription
+    bill = Bill.objects.create(user=due_subscription.user, subscription=plan_cost, amount=plan_cost.cost,
+                               date_transaction=due_subscription.date_billing_next)
+    enqueue([bill_request(bill)])
+    return bill
+
+
+def _worker(venmo_client, **kwargs):
+    return OutboxWorker(venmo_client, Mock(), retry_seconds=60, **kwargs)
+
+
+def test_billing_run_enqueues_requests_once(settings, venmo_client, due_subscription):
+    settings.PAYABLESUBS_OUTBOX_DRAIN_AFTER_RUN = False
+    PayableManager(venmo_client=venmo_client, google_client=Mock()).process_subscriptions()
+
+    message = OutboxMessage.objects.get()
+    bill = Bill.objects.get()
+    assert message.kind == OutboxMessage.Kind.VENMO_REQUEST
+    assert message.payload == {"bill_id": str(bill.id)}
+    assert bill.status == Bill.SendStatus.PENDING
+    venmo_client.payment.request_money.assert_not_called()
+
+    # enqueueing the same bill's request again (i.e.: from a retried run) is a no-op
+    enqueue([bill_request(bill)])
+    assert OutboxMessage.objects.count() == 1
+
+
+def test_drain_sends_request_once(venmo_client, bill):
+    assert _worker(venmo_client).drain() == 1
+    venmo_client.payment.request_money.assert_called_once()
+    assert Bill.objects.get().status == Bill.SendStatus.SENT
+    message = OutboxMessage.objects.get()
+    assert message.status == OutboxMessage.Status.DONE
+    assert message.attempts == 1
+
+    assert _worker(venmo_client).drain() == 0
+    venmo_client.payment.request_money.assert_called_once()
+
+
+def test_bill_sent_elsewhere_not_sent_again(venmo_client, bill):
+    Bill.objects.filter(id=bill.id).update(status=Bill.SendStatus.SENT)
+    _worker(venmo_client).drain()
+    venmo_client.payment.request_money.assert_not_called()
+    assert OutboxMessage.objects.get().status == OutboxMessage.Status.DONE
+
+
+def test_failed_request_fails_message(venmo_client, bill, settings):
+    settings.PAYABLESUBS_VENMO_REQUEST_RETRIES = 0
+    venmo_client.payment.request_money = Mock(side_effect=Exception("Venmo is down"))
+    _worker(venmo_client).drain()
+    message = OutboxMessage.objects.get()
+    assert message.status == OutboxMessage.Status.FAILED
+    assert "Venmo is down" in message.last_error
+
+
+def test_handler_errors_retried_with_backoff(venmo_client, bill):
+    worker = _worker(venmo_client, max_attempts=2)
+    worker.handlers[OutboxMessage.Kind.VENMO_REQUEST] = Mock(side_effect=Exception("Database hiccup"))
+    assert worker.drain() == 1
+
+    message = OutboxMessage.objects.get()
+    assert message.status == OutboxMessage.Status.PENDING
+    assert message.attempts == 1
+    assert message.date_available > django_timezone.now() + timedelta(seconds=50)
+    # waiting out its backoff
+    assert worker.drain() == 0
+
+    OutboxMessage.objects.update(date_available=django_timezone.now())
+    worker.drain()
+    message = OutboxMessage.objects.get()
+    assert message.status == OutboxMessage.Status.FAILED
+    assert message.attempts == 2
+    venmo_client.payment.request_money.assert_not_called()
+
+
+def test_claimed_messages_not_claimed_again(venmo_client, bill):
+    first, second = _worker(venmo_client), _worker(venmo_client)
+    assert len(first.claim()) == 1
+    assert second.claim() == []
+
+    # until the claim times out (i.e.: its worker crashed)
+    OutboxMessage.objects.update(date_claimed=django_timezone.now() - timedelta(hours=1))
+    assert OutboxWorker.release_stale() == 1
+    assert len(second.claim()) == 1
+
+
+def test_expired_subscription_removes_label(venmo_client, due_subscription):
+    due_subscription.date_billing_end = django_timezone.now() - timedelta(days=1)
+    due_subscription.save()
+    google_client = Mock()
+    google_client.contactGroups().get().execute = Mock(return_value={"memberResourceNames": ["people/1"]})
+    google_client.contactGroups().members().modify.return_value.execute = Mock(return_value={})
+    google.GOOGLE_CONTACT_GROUP_ID = "label"
+    try:
+        PayableManager(venmo_client=venmo_client, google_client=google_client).process_subscriptions()
+        message = OutboxMessage.objects.get(kind=OutboxMessage.Kind.GOOGLE_REMOVE_LABEL)
+        assert message.idempotency_key == contact_label_removal(due_subscription).idempotency_key
+        assert message.status == OutboxMessage.Status.DONE
+    finally:
+        google.GOOGLE_CONTACT_GROUP_ID = None
+
+    google_client.contactGroups().members().modify.assert_called_once_with(
+        resourceName="contactGroups/label", body={"resourceNamesToRemove": ["people/1"]}
+    )
+
+
+def test_process_outbox_command(venmo_client, bill):
+    out = StringIO()
+    call_command(Command(venmo_client=venmo_client, google_client=Mock()), stdout=out)
+    assert "Processed 1 outbox messages" in out.getvalue()
+    assert Bill.objects.get().status == Bill.SendStatus.SENT
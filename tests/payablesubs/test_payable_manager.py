@@ -15,6 +15,7 @@ from datetime import timedelta
 from subscriptions import models
 from payablesubs.models import Bill, Payment
 from payablesubs.management.commands._payable_manager import PayableManager
+from payablesubs.management.commands._outbox import bill_request, enqueue
 
 import payablesubs.clients.google as google
 import venmo_api.models.user
@@ -151,7 +152,8 @@ def test_bills_with_different_plan_cost(django_user_model, manager):
     manager.process_subscriptions()
     request_money_mock = manager.venmo_client.payment.request_money
     assert request_money_mock.call_count == 2
-    call_1, call_2 = request_money_mock.call_args_list[0], request_money_mock.call_args_list[1]
+    # requests are sent concurrently, so order them by amount
+    call_1, call_2 = sorted(request_money_mock.call_args_list, key=lambda call: call.args[0])
 
     amount, note, _ = call_1.args
     assert amount == float(1.0)
@@ -189,6 +191,14 @@ def test_generate_note(django_user_model, manager):
     assert manager._generate_note(jane_sub) == "Jane's Test Plan subscription for Mar - Feb 2023"
 
 
+def test_billing_memo_cleared_after_run(manager, due_subscription, venmo_user):
+    manager._generate_note(due_subscription)
+    assert manager.memo.stats()["duration"]["misses"] == 1
+
+    manager.process_subscriptions()
+    assert manager.memo.stats() == {}
+
+
 def test_due_no_duplicate_bills(manager, due_subscription, venmo_user):
     """Duplicate bills and venmo requests aren't created."""
     manager.process_subscriptions()
@@ -373,19 +383,19 @@ def _init_google_mocks(manager, contact_label, email):
     mock_people = Mock()
     manager.google_client.people = Mock(return_value=mock_people)
 
-    mock_search_contacts = Mock()
-    mock_people.searchContacts = Mock(return_value=mock_search_contacts)
-
-    mock_search_result = {
-        'results': [
+    mock_connections = Mock()
+    mock_people.connections = Mock(return_value=mock_connections)
+    mock_connections.list().execute = Mock(return_value={
+        'connections': [
             {
-                'person': {
-                    'resourceName': 'people/1234',
-                }
+                'resourceName': 'people/1234',
+                'emailAddresses': [{'value': email}],
             }
         ]
-    }
-    mock_search_contacts.execute = Mock(return_value=mock_search_result)
+    })
+
+    mock_group = {'resourceName': f'contactGroups/{contact_label}', 'memberResourceNames': ['people/1234']}
+    manager.google_client.contactGroups().get().execute = Mock(return_value=mock_group)
 
 
 def test_due_cancels_after_grace_period_google_enabled(manager, due_subscription, venmo_user):
@@ -402,9 +412,14 @@ def test_due_cancels_after_grace_period_google_enabled(manager, due_subscription
     finally:
         google.GOOGLE_CONTACT_GROUP_ID = None
 
-    # google integration was disabled... so shouldn't have been called.
-    manager.google_client.people().searchContacts.assert_called_once()
-    manager.google_client.contactGroups().members().modify().execute.assert_called_once()
+    # there are no active subscribers to look up, and the expired user's contact was removed in a single modify call
+    manager.google_client.people().connections().list().execute.assert_not_called()
+    manager.google_client.people().batchCreateContacts.assert_not_called()
+    modify = manager.google_client.contactGroups().members().modify
+    modify.assert_called_once_with(
+        resourceName=f"contactGroups/{test_contact_label}", body={"resourceNamesToRemove": ["people/1234"]}
+    )
+    modify().execute.assert_called_once()
 
 def test_due_resets_after_payment(manager, due_subscription, venmo_user):
     initial_date_billing_next = due_subscription.date_billing_next
@@ -429,3 +444,106 @@ def test_due_resets_after_payment(manager, due_subscription, venmo_user):
     assert latest_sub.cancelled is False
     assert latest_sub.date_billing_next > initial_date_billing_next
     assert latest_sub.date_billing_end is None
+
+def _count_selects(manager):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as ctx:
+        manager.process_subscriptions()
+    return len([q for q in ctx.captured_queries if q["sql"].startswith("SELECT")])
+
+def test_due_prefetch_queries_independent_of_subscriber_count(manager, django_user_model):
+    """Reads needed to process due subscriptions are prefetched, rather than queried per subscriber."""
+    for first_name in ["John", "Jane"]:
+        user, group = create_user_and_group(django_user_model, first_name=first_name)
+        create_venmo_user(django_user_model, user)
+        create_due_subscription(user, group)
+    two_subscriber_selects = _count_selects(manager)
+
+    models.UserSubscription.objects.update(date_billing_end=None)
+    Bill.objects.all().delete()
+    for first_name in ["Jim", "Jill"]:
+        user, group = create_user_and_group(django_user_model, first_name=first_name)
+        create_venmo_user(django_user_model, user)
+        create_due_subscription(user, group)
+    four_subscriber_selects = _count_selects(manager)
+
+    assert Bill.objects.count() == 4
+    assert two_subscriber_selects == four_subscriber_selects
+
+def test_due_matches_previously_synced_payment(manager, bill, venmo_user):
+    """Payments synced during an earlier run are still matched, even once Venmo no longer returns them."""
+    venmo_subscriber = _venmo_account_to_api_model(venmo_user)
+    txn = _create_txn(bill.amount, actor=venmo_subscriber, target=MOCK_PROFILE_VENMO_USER, date_completed=bill.date_transaction)
+    manager.venmo_client.user.get_user_transactions = Mock(return_value=[txn])
+    manager._get_txn_index()  # an earlier run synced the payment...
+
+    manager.venmo_client.user.get_user_transactions = Mock(return_value=[])
+    manager.process_subscriptions()
+    assert Payment.objects.count() == 1
+    assert Payment.objects.first().host_payment_id == txn.id
+
+def test_due_bill_send_status(manager, due_subscription, venmo_user):
+    manager.process_subscriptions()
+    bill = Bill.objects.get()
+    assert bill.status == Bill.SendStatus.SENT
+    assert bill.note == "John's Test Plan subscription for Feb 2018"
+
+def test_due_bill_send_status_billing_disabled(manager, due_subscription, venmo_user):
+    settings.PAYABLESUBS_BILLING_ENABLED = False
+    try:
+        manager.process_subscriptions()
+    finally:
+        settings.PAYABLESUBS_BILLING_ENABLED = True
+
+    assert Bill.objects.get().status == Bill.SendStatus.NOT_SENT
+
+    # Bills created while billing is disabled aren't sent once it's re-enabled
+    manager.process_subscriptions()
+    manager.venmo_client.payment.request_money.assert_not_called()
+
+def test_due_pending_bill_sent(manager, bill, venmo_user):
+    """Bills still pending send (i.e.: from a run that crashed before sending) are sent on the next run."""
+    enqueue([bill_request(bill)])  # i.e.: written along with the bill
+    manager.process_subscriptions()
+    manager.venmo_client.payment.request_money.assert_called_once()
+    assert Bill.objects.get().status == Bill.SendStatus.SENT
+
+def test_selections_only_read_subscriptions_needing_work(manager, django_user_model, due_subscription):
+    """Subscriptions that are neither due, new nor expired aren't loaded, and each selection is served by an index."""
+    from django.db import connection
+
+    user, group = create_user_and_group(django_user_model, first_name="Jane")
+    now = django_timezone.now()
+    create_subscription(user, group=group, date_start=now - timedelta(days=1), date_next=now + timedelta(days=29))
+    models.UserSubscription.objects.update(active=True)
+
+    assert list(manager._due_subscriptions(now)) == [due_subscription]
+    assert list(manager._expired_subscriptions(now)) == []
+    assert list(manager._new_subscriptions(now)) == []
+
+    if connection.vendor == "sqlite":
+        selections = {
+            "payablesubs_usersub_due_idx": manager._due_subscriptions(now),
+            "payablesubs_usersub_end_idx": manager._expired_subscriptions(now),
+            "payablesubs_usersub_new_idx": manager._new_subscriptions(now),
+        }
+        for index, queryset in selections.items():
+            plan = queryset.explain()
+            assert f"USING INDEX {index}" in plan
+            assert "TEMP B-TREE" not in plan
+
+def test_due_txn_index_only_loads_searchable_payments(manager, bill, venmo_user):
+    """Staged payments older than any due subscription's payment search aren't loaded into the index."""
+    from payablesubs.models import StagedVenmoTransaction
+
+    for txn_id, date in enumerate([datetime(2017, 6, 1, tzinfo=timezone.utc), bill.date_transaction], start=1):
+        StagedVenmoTransaction.objects.create(
+            host_txn_id=txn_id, payment_type="pay", amount=Decimal(7), actor_id=venmo_user.venmo_id,
+            actor_username=venmo_user.venmo_username, target_id=MOCK_PROFILE_VENMO_ID,
+            target_username=MOCK_PROFILE_VENMO_USER.username, date_created=int(date.timestamp()),
+            date_completed=int(date.timestamp()),
+        )
+    manager.process_subscriptions()
+    assert [t.id for t in manager.venmo_txns.txns] == [2]
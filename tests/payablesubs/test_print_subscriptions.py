@@ -1,5 +1,14 @@
 """Tests for the print_subscriptions module."""
+import csv
+import json
+import logging
+from io import StringIO
+
 import pytest
+from django.core import mail
+from django.core.management import call_command
+from subscriptions.models import UserSubscription
+
 from payablesubs.management.commands.print_subscriptions import Command
 from test_models import create_user_and_group, create_subscription
 
@@ -20,4 +29,75 @@ def test_print_subscriptions(command, subscription):
         "include_inactive": False,
         "email_to": None,
     }
-    command.handle(**args)
\ No newline at end of file
+    command.handle(**args)
+
+def _create_subscriptions(django_user_model, count):
+    for i in range(count):
+        user, _ = create_user_and_group(django_user_model, first_name=f"John{i}")
+        create_subscription(user)
+
+
+def _report(report_format, **options):
+    out = StringIO()
+    call_command("print_subscriptions", cost="ALL", format=report_format, stdout=out, **options)
+    return out.getvalue()
+
+
+def test_print_subscriptions_csv(django_user_model):
+    _create_subscriptions(django_user_model, 3)
+    rows = list(csv.DictReader(StringIO(_report("csv"))))
+    assert len(rows) == 3
+    assert {row["first_name"] for row in rows} == {"John0", "John1", "John2"}
+    assert rows[0]["plan"] == "Test Plan"
+
+
+def test_print_subscriptions_json(django_user_model):
+    assert json.loads(_report("json")) == []
+
+    _create_subscriptions(django_user_model, 2)
+    rows = json.loads(_report("json"))
+    assert [row["first_name"] for row in rows] == ["John0", "John1"]
+    assert rows[0]["active"] is True
+
+
+def test_print_subscriptions_output_file(django_user_model, tmp_path):
+    _create_subscriptions(django_user_model, 2)
+    output = tmp_path / "report.csv"
+    assert _report("csv", output=str(output)) == ""
+    assert len(output.read_text().splitlines()) == 3
+
+
+def test_print_subscriptions_text_logged(django_user_model, caplog):
+    _create_subscriptions(django_user_model, 2)
+    caplog.set_level(logging.INFO)
+    assert _report("text") == ""
+
+    report = caplog.records[-1].getMessage()
+    assert report.splitlines()[0] == "There are 2 subscriptions using cost='ALL':"
+    assert report.splitlines()[1:] == [str(sub) for sub in UserSubscription.objects.order_by("user__email")]
+
+
+def test_print_subscriptions_queries_independent_of_count(django_user_model, django_assert_max_num_queries, tmp_path):
+    _create_subscriptions(django_user_model, 10)
+    output = tmp_path / "report.txt"
+    # count, then the rows (fetched in chunks by the cursor)
+    with django_assert_max_num_queries(2):
+        _report("text", chunk_size=3, output=str(output))
+    assert len(output.read_text().splitlines()) == 10
+
+
+def test_print_subscriptions_email_attachment(django_user_model):
+    _create_subscriptions(django_user_model, 2)
+    _report("csv", email_to="admin@email.com")
+    assert len(mail.outbox) == 1
+    message = mail.outbox[0]
+    assert "has 2 all subscribers" in message.subject
+    name, content, mimetype = message.attachments[0]
+    assert (name, mimetype) == ("subscriptions.csv", "text/csv")
+    assert len(content.splitlines()) == 3
+
+
+def test_print_subscriptions_email_text(django_user_model):
+    _create_subscriptions(django_user_model, 2)
+    _report("text", email_to="admin@email.com")
+    assert mail.outbox[0].body.splitlines() == [str(sub) for sub in UserSubscription.objects.order_by("user__email")]
@@ -0,0 +1,94 @@
+"""Tests for the process_payable_subscriptions command and sharded `PayableManager` runs."""
+from datetime import timedelta
+from unittest.mock import Mock
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import transaction
+from subscriptions import models
+
+from payablesubs.management.commands._payable_manager import PayableManager
+from payablesubs.management.commands._request_dispatcher import RequestDispatcher
+from payablesubs.management.commands.process_payable_subscriptions import parse_shard
+from payablesubs.models import Bill
+from test_models import create_due_subscription, create_user_and_group, create_venmo_user
+from test_payable_manager import MOCK_PROFILE_VENMO_USER
+
+pytestmark = pytest.mark.django_db  # pylint: disable=invalid-name
+
+
+def _manager(**kwargs):
+    mock_venmo = Mock()
+    mock_venmo.my_profile = Mock(return_value=MOCK_PROFILE_VENMO_USER)
+    mock_venmo.payment.request_money = Mock(return_value=True)
+    mock_venmo.user.get_user_transactions = Mock(return_value=[])
+    return PayableManager(venmo_client=mock_venmo, google_client=Mock(), **kwargs)
+
+
+@pytest.fixture
+def due_subscriptions(django_user_model):
+    subscriptions = []
+    for first_name in ("John", "Jane", "Jack", "Jill"):
+        user, group = create_user_and_group(django_user_model, first_name=first_name)
+        create_venmo_user(django_user_model, user)
+        subscriptions.append(create_due_subscription(user, group))
+    return subscriptions
+
+
+def test_parse_shard():
+    assert parse_shard("0/1") == (0, 1)
+    assert parse_shard("3/4") == (3, 4)
+    for value in ("", "1", "a/4", "4/4", "-1/4", "0/0", "1/2/3"):
+        with pytest.raises(CommandError):
+            parse_shard(value)
+
+
+def test_command_invalid_shard():
+    with pytest.raises(CommandError):
+        call_command("process_payable_subscriptions", "--shard", "2/2")
+
+
+def test_shards_partition_subscriptions(due_subscriptions):
+    shards = [_manager(shard=(index, 2)) for index in range(2)]
+    shards[0].process_subscriptions()
+    first_shard_users = set(Bill.objects.values_list("user_id", flat=True))
+    assert first_shard_users == {sub.user_id for sub in due_subscriptions if sub.user_id % 2 == 0}
+
+    shards[1].process_subscriptions()
+    assert Bill.objects.count() == len(due_subscriptions)
+    assert set(Bill.objects.values_list("user_id", flat=True)) == {sub.user_id for sub in due_subscriptions}
+    sent = sum(manager.venmo_client.payment.request_money.call_count for manager in shards)
+    assert sent == len(due_subscriptions)
+
+
+def test_no_venmo_sync(due_subscriptions):
+    manager = _manager(sync_venmo=False)
+    manager.process_subscriptions()
+    manager.venmo_client.user.get_user_transactions.assert_not_called()
+    assert Bill.objects.count() == len(due_subscriptions)
+
+
+def test_lock_due_skips_changed_subscriptions(due_subscriptions):
+    changed = due_subscriptions[0]
+    models.UserSubscription.objects.filter(id=changed.id).update(
+        date_billing_next=changed.date_billing_next + timedelta(days=31)
+    )
+
+    with transaction.atomic():
+        locked = list(PayableManager._lock_due(due_subscriptions))
+    assert locked == due_subscriptions[1:]
+
+
+def test_claimed_bills_not_sent_again(due_subscriptions):
+    sub = due_subscriptions[0]
+    bill = Bill.objects.create(user=sub.user, subscription=sub.subscription, amount=sub.subscription.cost,
+                               date_transaction=sub.date_billing_next)
+    assert RequestDispatcher.claim([bill]) == [bill]
+
+    stale = Bill.objects.get(id=bill.id)
+    stale.status = Bill.SendStatus.PENDING  # i.e.: as read by another worker before the claim
+    venmo_client = Mock()
+    assert RequestDispatcher(venmo_client, backoff=0).dispatch([stale]) == 0
+    venmo_client.payment.request_money.assert_not_called()
+    assert Bill.objects.get(id=bill.id).status == Bill.SendStatus.SENDING
@@ -0,0 +1,124 @@
+"""Tests for the reconcile_payments command."""
+import json
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from unittest.mock import Mock
+
+import pytest
+from django.core.management import call_command
+
+from subscriptions.models import UserSubscription
+
+from payablesubs.management.commands._bulk import bulk_create_payments
+from payablesubs.models import Bill, Payment
+from test_models import create_due_subscription, create_user_and_group, create_venmo_user
+from test_payable_manager import MOCK_PROFILE_VENMO_USER, _create_txn, _venmo_account_to_api_model
+
+pytest.importorskip("numpy")
+
+from payablesubs.management.commands.reconcile_payments import Command  # noqa: E402
+
+pytestmark = pytest.mark.django_db  # pylint: disable=invalid-name
+
+FEB1_2018 = datetime(2018, 2, 1, 1, 1, 1, tzinfo=timezone.utc)
+
+
+def _subscriber(django_user_model, first_name):
+    user, group = create_user_and_group(django_user_model, first_name=first_name)
+    venmo_account = create_venmo_user(django_user_model, user)
+    sub = create_due_subscription(user, group)
+    Bill.objects.create(user=user, subscription=sub.subscription, amount=sub.subscription.cost,
+                        date_transaction=sub.date_billing_next)
+    return sub, _venmo_account_to_api_model(venmo_account)
+
+
+def _payment(sub, txn_id, date_transaction):
+    return Payment(host_payment_id=txn_id, subscription=sub.subscription, user=sub.user, amount=sub.subscription.cost,
+                   method=Payment.PaymentMethod.VENMO, date_transaction=date_transaction, data={})
+
+
+@pytest.fixture
+def history(django_user_model):
+    john_sub, john = _subscriber(django_user_model, "John")
+    jane_sub, jane = _subscriber(django_user_model, "Jane")
+    jack_sub, _ = _subscriber(django_user_model, "Jack")
+    jill_sub, jill = _subscriber(django_user_model, "Jill")
+    bulk_create_payments([_payment(jill_sub, 50, FEB1_2018 + timedelta(days=1))])
+
+    txns = [
+        _create_txn(1, actor=john, target=MOCK_PROFILE_VENMO_USER, date_completed=FEB1_2018 + timedelta(days=2)),
+        _create_txn(1, actor=jane, target=MOCK_PROFILE_VENMO_USER, date_completed=FEB1_2018 + timedelta(days=2)),
+        _create_txn(1, actor=jane, target=MOCK_PROFILE_VENMO_USER, date_completed=FEB1_2018 + timedelta(days=5)),
+        _create_txn(7, actor=john, target=MOCK_PROFILE_VENMO_USER, date_completed=FEB1_2018 + timedelta(days=3)),
+        _create_txn(1, actor=jill, target=MOCK_PROFILE_VENMO_USER, date_completed=FEB1_2018 + timedelta(days=1)),
+    ]
+    for txn_id, txn in enumerate(txns, start=1):
+        txn.id = txn_id
+        txn.date_created = txn.date_completed + txn_id
+    txns.sort(key=lambda t: t.date_created, reverse=True)
+    venmo_client = Mock()
+    venmo_client.my_profile = Mock(return_value=MOCK_PROFILE_VENMO_USER)
+    venmo_client.user.get_user_transactions = Mock(return_value=txns)
+    return {"john": john_sub, "jane": jane_sub, "jack": jack_sub, "jill": jill_sub, "venmo_client": venmo_client}
+
+
+def test_reconcile_report(history, tmp_path):
+    output = tmp_path / "reconciliation.json"
+    call_command(Command(venmo_client=history["venmo_client"]), "--output", str(output))
+
+    report = json.loads(output.read_text())
+    john_bill = Bill.objects.get(user=history["john"].user)
+    jane_bill = Bill.objects.get(user=history["jane"].user)
+    jack_bill = Bill.objects.get(user=history["jack"].user)
+    assert report["matched"] == [{"bill": str(john_bill.id), "host_payment_id": 1}]
+    assert report["ambiguous"] == [{"bill": str(jane_bill.id), "host_payment_ids": [2, 3]}]
+    assert report["unmatched_bills"] == [str(jack_bill.id)]
+    # john's $7 payment, and jill's payment that's already recorded as a different host payment
+    assert report["unmatched_txns"] == [4, 5]
+    assert report["settled_bills"] == 1
+    assert Payment.objects.count() == 1
+
+
+def test_reconcile_commit(history):
+    command = Command(venmo_client=history["venmo_client"])
+    call_command(command, "--commit")
+
+    payment = Payment.objects.get(host_payment_id=1)
+    assert payment.user == history["john"].user
+    assert payment.subscription == history["john"].subscription
+    assert payment.amount == Decimal(1)
+    assert payment.date_transaction == FEB1_2018 + timedelta(days=2)
+    assert payment.data["venmo_username"] == history["john"].user.venmoaccount.venmo_username
+
+    # john paid his current bill, so his subscription moves on to the next period instead of expiring
+    john_sub = UserSubscription.objects.get(id=history["john"].id)
+    assert john_sub.date_billing_last == FEB1_2018 + timedelta(days=2)
+    assert john_sub.date_billing_next > FEB1_2018
+    assert john_sub.date_billing_end is None
+    assert UserSubscription.objects.get(id=history["jack"].id).date_billing_next == FEB1_2018
+
+    # already recorded, so john's bill is now settled
+    call_command(command, "--commit", "--no-venmo-sync")
+    assert Payment.objects.count() == 2
+
+
+def test_reconcile_bill_without_amount(history, tmp_path):
+    jack_bill = Bill.objects.get(user=history["jack"].user)
+    john_bill = Bill.objects.get(user=history["john"].user)
+    Bill.objects.filter(id=john_bill.id).update(amount=None)
+
+    output = tmp_path / "reconciliation.json"
+    call_command(Command(venmo_client=history["venmo_client"]), "--output", str(output))
+
+    report = json.loads(output.read_text())
+    assert report["matched"] == []
+    assert report["unmatched_bills"] == [str(jack_bill.id), str(john_bill.id)]
+
+
+def test_bulk_create_payments(django_user_model):
+    sub, _ = _subscriber(django_user_model, "John")
+    payments = bulk_create_payments([_payment(sub, txn_id, FEB1_2018) for txn_id in range(3)])
+
+    assert Payment.objects.count() == 3
+    assert {p.host_payment_id for p in Payment.objects.all()} == {0, 1, 2}
+    assert Payment.objects.get(id=payments[0].id).user == sub.user
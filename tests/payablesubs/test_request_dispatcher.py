@@ -0,0 +1,114 @@
+"""Tests for the _request_dispatcher module."""
+import time
+from unittest.mock import Mock
+
+import pytest
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import ConnectTimeout, ReadTimeout
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+from venmo_api import HttpCodeError
+
+from payablesubs.management.commands._request_dispatcher import RequestDispatcher, TokenBucket, never_reached_venmo
+from payablesubs.models import Bill
+from test_models import create_due_subscription, create_user_and_group, create_venmo_user
+
+pytestmark = pytest.mark.django_db  # pylint: disable=invalid-name
+
+
+@pytest.fixture
+def bill(django_user_model):
+    user, group = create_user_and_group(django_user_model)
+    venmo_account = create_venmo_user(django_user_model, user)
+    sub = create_due_subscription(user, group)
+    bill = Bill.objects.create(user=user, subscription=sub.subscription, amount=sub.subscription.cost,
+                               date_transaction=sub.date_billing_next, note="test note")
+    bill.venmo_account = venmo_account
+    return bill
+
+
+def _dispatcher(request_money, retries=2):
+    venmo_client = Mock()
+    venmo_client.payment.request_money = request_money
+    return RequestDispatcher(venmo_client, workers=2, requests_per_second=1000, retries=retries, backoff=0)
+
+
+def test_dispatch_sends_and_records_outcome(bill):
+    request_money = Mock(return_value=True)
+    assert _dispatcher(request_money).dispatch([bill]) == 1
+
+    request_money.assert_called_once_with(float(bill.amount), "test note", str(bill.venmo_account.venmo_id))
+    bill = Bill.objects.get(id=bill.id)
+    assert bill.status == Bill.SendStatus.SENT
+    assert bill.send_attempts == 1
+    assert bill.date_sent is not None
+
+
+def _connection_refused():
+    reason = NewConnectionError(None, "Connection refused")
+    return RequestsConnectionError(MaxRetryError(None, "/v1/payments", reason=reason))
+
+
+def _http_code_error(status_code, reason):
+    return HttpCodeError(response=Mock(status_code=status_code, reason=reason, json=Mock(return_value={})))
+
+
+def test_never_reached_venmo():
+    assert never_reached_venmo(ConnectTimeout("timed out connecting"))
+    assert never_reached_venmo(_connection_refused())
+    assert never_reached_venmo(_http_code_error(429, "Too Many Requests"))
+    # i.e.: Venmo may have accepted these requests before failing
+    assert not never_reached_venmo(ReadTimeout("read timed out"))
+    assert not never_reached_venmo(RequestsConnectionError(ProtocolError("Connection aborted")))
+    assert not never_reached_venmo(_http_code_error(502, "Bad Gateway"))
+    assert not never_reached_venmo(Exception("timed out"))
+
+
+def test_dispatch_retries_requests_that_never_reached_venmo(bill):
+    request_money = Mock(side_effect=[_connection_refused(), _http_code_error(429, "Too Many Requests"), True])
+    assert _dispatcher(request_money).dispatch([bill]) == 1
+
+    assert request_money.call_count == 3
+    bill = Bill.objects.get(id=bill.id)
+    assert bill.status == Bill.SendStatus.SENT
+    assert bill.send_attempts == 3
+
+
+def test_dispatch_gives_up_after_retries(bill):
+    request_money = Mock(side_effect=ConnectTimeout("timed out connecting"))
+    assert _dispatcher(request_money, retries=2).dispatch([bill]) == 0
+
+    assert request_money.call_count == 3
+    bill = Bill.objects.get(id=bill.id)
+    assert bill.status == Bill.SendStatus.FAILED
+    assert bill.send_attempts == 3
+    assert "timed out connecting" in bill.send_error
+    assert bill.date_sent is None
+
+
+@pytest.mark.parametrize("error", [ReadTimeout("read timed out"), _http_code_error(503, "Service Unavailable")])
+def test_dispatch_does_not_retry_requests_that_may_have_reached_venmo(bill, error):
+    request_money = Mock(side_effect=error)
+    assert _dispatcher(request_money, retries=2).dispatch([bill]) == 0
+
+    request_money.assert_called_once()
+    bill = Bill.objects.get(id=bill.id)
+    assert bill.status == Bill.SendStatus.FAILED
+    assert bill.send_attempts == 1
+
+
+def test_dispatch_no_venmo_account(bill):
+    bill.venmo_account.delete()
+    request_money = Mock(return_value=True)
+    assert _dispatcher(request_money).dispatch([bill]) == 0
+
+    request_money.assert_not_called()
+    assert Bill.objects.get(id=bill.id).status == Bill.SendStatus.FAILED
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=20, capacity=1)
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    # the first token is available immediately, the remaining 4 take ~1/20th of a second each
+    assert time.monotonic() - start >= 0.15
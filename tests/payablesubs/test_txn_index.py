@@ -0,0 +1,77 @@
+"""Tests for the _txn_index module."""
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import venmo_api.models.user
+from venmo_api.models.transaction import Transaction
+
+from payablesubs.management.commands._txn_index import PaymentRecord, VenmoTransactionIndex, to_cents
+
+ROOT = venmo_api.models.user.User("1", "root-venmo-username", None, None, None, None, None, None, None, None, None)
+JOHN = venmo_api.models.user.User("2", "john-venmo-username", None, None, None, None, None, None, None, None, None)
+JANE = venmo_api.models.user.User("3", "jane-venmo-username", None, None, None, None, None, None, None, None, None)
+
+JAN1_2018 = datetime(2018, 1, 1, 1, 1, 1, tzinfo=timezone.utc)
+
+
+def _txn(txn_id, amount, actor, target, date_completed, payment_type="pay"):
+    date_completed = int(date_completed.timestamp()) if date_completed else None
+    return Transaction(txn_id, None, date_completed, date_completed, date_completed,
+                       payment_type, float(amount), None, None, "test payment", None, actor, target, None)
+
+
+def _index(txns):
+    return VenmoTransactionIndex(PaymentRecord.from_api_model(t, ROOT.username) for t in txns)
+
+
+def test_index_only_keeps_payments_to_us():
+    txns = [
+        _txn(1, 5, actor=JOHN, target=ROOT, date_completed=JAN1_2018),  # john paid us
+        _txn(2, 5, actor=ROOT, target=JANE, date_completed=JAN1_2018, payment_type="charge"),  # we charged jane
+        _txn(3, 5, actor=ROOT, target=JOHN, date_completed=JAN1_2018),  # we paid john
+        _txn(4, 5, actor=JANE, target=ROOT, date_completed=JAN1_2018, payment_type="charge"),  # jane charged us
+        _txn(5, 5, actor=JOHN, target=ROOT, date_completed=None),  # never completed
+    ]
+    index = _index(txns)
+    assert len(index) == 2
+    assert [t.id for t in index.find(JOHN.username, 5, JAN1_2018 - timedelta(days=1))] == [1]
+    assert [t.id for t in index.find(JANE.username, 5, JAN1_2018 - timedelta(days=1))] == [2]
+
+
+def test_index_find_by_amount_and_date():
+    txns = [
+        _txn(3, 5, actor=JOHN, target=ROOT, date_completed=JAN1_2018 + timedelta(days=60)),
+        _txn(1, 5, actor=JOHN, target=ROOT, date_completed=JAN1_2018),
+        _txn(2, 5, actor=JOHN, target=ROOT, date_completed=JAN1_2018 + timedelta(days=30)),
+        _txn(4, 10, actor=JOHN, target=ROOT, date_completed=JAN1_2018 + timedelta(days=30)),
+    ]
+    index = _index(txns)
+
+    # sorted oldest first, regardless of the order Venmo returned them in
+    assert [t.id for t in index.find(JOHN.username, 5, JAN1_2018 - timedelta(days=1))] == [1, 2, 3]
+    # only transactions completed strictly after the search date
+    assert [t.id for t in index.find(JOHN.username, 5, JAN1_2018)] == [2, 3]
+    assert [t.id for t in index.find(JOHN.username, 10, JAN1_2018)] == [4]
+    assert index.find(JOHN.username, 7, JAN1_2018) == []
+    assert index.find(JANE.username, 5, JAN1_2018) == []
+
+
+def test_index_amounts_in_cents():
+    txns = [
+        _txn(1, 0.1 + 0.2, actor=JOHN, target=ROOT, date_completed=JAN1_2018),  # i.e.: 0.30000000000000004
+        _txn(2, 19.99, actor=JOHN, target=ROOT, date_completed=JAN1_2018),
+    ]
+    index = _index(txns)
+    assert [t.id for t in index.find(JOHN.username, Decimal("0.30"), JAN1_2018 - timedelta(days=1))] == [1]
+    assert [t.id for t in index.find(JOHN.username, Decimal("19.99"), JAN1_2018 - timedelta(days=1))] == [2]
+    assert index.txns[1].cents == 1999 == to_cents(Decimal("19.99"))
+
+
+def test_payment_record_counterparty():
+    paid = PaymentRecord.from_api_model(_txn(1, 5, actor=JOHN, target=ROOT, date_completed=JAN1_2018), ROOT.username)
+    assert (paid.counterparty_id, paid.counterparty_username, paid.cents) == (JOHN.id, JOHN.username, 500)
+    charged = PaymentRecord.from_api_model(
+        _txn(2, 5, actor=ROOT, target=JANE, date_completed=JAN1_2018, payment_type="charge"), ROOT.username
+    )
+    assert (charged.counterparty_id, charged.counterparty_username) == (JANE.id, JANE.username)
+    assert charged.date_completed_datetime == JAN1_2018.replace(microsecond=0)
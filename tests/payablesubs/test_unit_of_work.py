@@ -0,0 +1,52 @@
+"""Tests for the _unit_of_work module."""
+from datetime import timedelta
+
+import pytest
+from subscriptions import models
+
+from payablesubs.management.commands._unit_of_work import UnitOfWork
+from payablesubs.models import Bill, Payment
+from test_models import create_due_subscription, create_user_and_group
+
+pytestmark = pytest.mark.django_db  # pylint: disable=invalid-name
+
+
+@pytest.fixture
+def subscriptions(django_user_model):
+    subscriptions = []
+    for first_name in ("John", "Jane", "Jack"):
+        user, group = create_user_and_group(django_user_model, first_name=first_name)
+        subscriptions.append(create_due_subscription(user, group))
+    return subscriptions
+
+
+def test_flush_writes_in_bulk(subscriptions, django_assert_max_num_queries):
+    writes = UnitOfWork()
+    for i, sub in enumerate(subscriptions):
+        writes.add_bill(Bill(user=sub.user, subscription=sub.subscription, amount=sub.subscription.cost,
+                             date_transaction=sub.date_billing_next))
+        writes.add_payment(Payment(host_payment_id=i, user=sub.user, subscription=sub.subscription,
+                                   amount=sub.subscription.cost, method=Payment.PaymentMethod.VENMO,
+                                   date_transaction=sub.date_billing_next, data={}))
+        sub.date_billing_next += timedelta(days=31)
+        writes.update_subscription(sub, "date_billing_next")
+    subscriptions[0].date_billing_end = subscriptions[0].date_billing_next
+    writes.update_subscription(subscriptions[0], "date_billing_end")
+    assert Bill.objects.count() == 0
+
+    # bills, payment parents, payments, one update per set of changed fields and savepoints; regardless of how many
+    with django_assert_max_num_queries(10):
+        writes.flush()
+
+    assert len(writes) == 0
+    assert Bill.objects.count() == len(subscriptions)
+    assert Payment.objects.count() == len(subscriptions)
+    for sub in subscriptions:
+        saved = models.UserSubscription.objects.get(id=sub.id)
+        assert saved.date_billing_next == sub.date_billing_next
+        assert saved.date_billing_end == sub.date_billing_end
+
+
+def test_flush_nothing(django_assert_num_queries):
+    with django_assert_num_queries(0):
+        UnitOfWork().flush()
@@ -0,0 +1,92 @@
+"""Tests for the _venmo_lookup module and the Venmo username lookup cache."""
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+from django.utils import timezone
+
+import payablesubs.clients.venmo as venmo
+from payablesubs.management.commands._venmo_lookup import VenmoUserResolver
+from payablesubs.models import VenmoUserLookup
+from test_models import create_venmo_user
+
+pytestmark = pytest.mark.django_db  # pylint: disable=invalid-name
+
+
+@pytest.fixture(autouse=True)
+def clear_lookup_cache():
+    venmo.clear_lookup_cache()
+
+
+@pytest.fixture
+def venmo_client():
+    known = {"jane-venmo": "jane-id", "jack-venmo": "jack-id"}
+    client = Mock()
+    client.user.get_user_by_username = Mock(
+        side_effect=lambda username: SimpleNamespace(id=known[username]) if username in known else None
+    )
+    return client
+
+
+def test_resolve_cached_across_resolvers(venmo_client):
+    assert VenmoUserResolver(venmo_client).resolve(["jane-venmo", "jack-venmo"]) == {
+        "jane-venmo": "jane-id",
+        "jack-venmo": "jack-id",
+    }
+    assert VenmoUserResolver(venmo_client).resolve_one("jane-venmo") == "jane-id"
+    assert venmo_client.user.get_user_by_username.call_count == 2
+
+
+def test_resolve_persisted_cache(venmo_client):
+    VenmoUserResolver(venmo_client).resolve_one("jane-venmo")
+    venmo.clear_lookup_cache()
+
+    assert VenmoUserResolver(venmo_client).resolve_one("jane-venmo") == "jane-id"
+    assert venmo_client.user.get_user_by_username.call_count == 1
+    assert VenmoUserLookup.objects.get().venmo_id == "jane-id"
+
+
+def test_resolve_not_found_cached(venmo_client):
+    assert VenmoUserResolver(venmo_client).resolve_one("typo-venmo") is None
+    assert VenmoUserResolver(venmo_client).resolve_one("typo-venmo") is None
+    assert venmo_client.user.get_user_by_username.call_count == 1
+    assert VenmoUserLookup.objects.get(venmo_username="typo-venmo").venmo_id is None
+
+
+def test_resolve_not_found_expires(venmo_client, settings):
+    settings.PAYABLESUBS_VENMO_LOOKUP_NEGATIVE_TTL_HOURS = 1
+    VenmoUserResolver(venmo_client).resolve_one("typo-venmo")
+    VenmoUserLookup.objects.update(date_cached=timezone.now() - timedelta(hours=2))
+    venmo.clear_lookup_cache()
+
+    VenmoUserResolver(venmo_client).resolve_one("typo-venmo")
+    assert venmo_client.user.get_user_by_username.call_count == 2
+
+
+def test_resolve_failures_not_cached(venmo_client):
+    venmo_client.user.get_user_by_username = Mock(side_effect=ConnectionError("timed out"))
+    assert VenmoUserResolver(venmo_client).resolve_one("jane-venmo") is None
+    assert VenmoUserResolver(venmo_client).resolve_one("jane-venmo") is None
+    assert venmo_client.user.get_user_by_username.call_count == 2
+    assert not VenmoUserLookup.objects.exists()
+
+
+def test_resolve_stored_venmo_account(django_user_model, venmo_client):
+    create_venmo_user(django_user_model, venmo_username="john-venmo", venmo_id="john-id")
+    assert VenmoUserResolver(venmo_client).resolve_one("john-venmo") == "john-id"
+    venmo_client.user.get_user_by_username.assert_not_called()
+
+
+def test_lookup_cache_bounded(settings):
+    settings.PAYABLESUBS_VENMO_LOOKUP_CACHE_SIZE = 1
+    venmo.cache_user_ids({"jane-venmo": "jane-id", "jack-venmo": "jack-id"})
+    assert list(venmo._lookups) == ["jack-venmo"]
+    # evicted lookups are still cached in the database
+    assert venmo.get_cached_user_ids(["jane-venmo"]) == {"jane-venmo": "jane-id"}
+
+
+def test_invalidate_user_ids(venmo_client):
+    VenmoUserResolver(venmo_client).resolve_one("jane-venmo")
+    venmo.invalidate_user_ids(["jane-venmo"])
+    assert venmo.get_cached_user_ids(["jane-venmo"]) == {}
@@ -0,0 +1,159 @@
+"""Tests for the _venmo_sync module."""
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock
+
+import pytest
+import venmo_api.models.user
+from subscriptions.models import SubscriptionPlan
+from venmo_api.models.transaction import Transaction
+
+from payablesubs.management.commands._venmo_sync import staged_payments_to, sync_transactions
+from payablesubs.models import StagedVenmoTransaction, VenmoSyncCursor
+
+ROOT = venmo_api.models.user.User("1", "root-venmo-username", None, None, None, None, None, None, None, None, None)
+JOHN = venmo_api.models.user.User("2", "john-venmo-username", None, None, None, None, None, None, None, None, None)
+
+JAN1_2018 = datetime(2018, 1, 1, 1, 1, 1, tzinfo=timezone.utc)
+
+pytestmark = pytest.mark.django_db  # pylint: disable=invalid-name
+
+
+class FakePage(list):
+    """Mimics `venmo_api`'s `Page`: a list that knows how to fetch the next (older) page."""
+
+    def __init__(self, txns, next_page=None):
+        super().__init__(txns)
+        self.next_page = next_page
+        self.fetched = False
+
+    def get_next_page(self):
+        self.fetched = True
+        return self.next_page
+
+
+def _date(days):
+    return int((JAN1_2018 + timedelta(days=days)).timestamp())
+
+
+def _txn(txn_id, days, actor=JOHN, target=ROOT, payment_type="pay", completed_days=None):
+    date, completed = _date(days), _date(days if completed_days is None else completed_days)
+    if completed_days is False:
+        completed = None  # i.e.: a pending charge
+    return Transaction(txn_id, None, completed, date, completed or date, payment_type, 5.0, None, None, "test payment",
+                       None, actor, target, None)
+
+
+def _client(first_page):
+    client = Mock()
+    client.user.get_user_transactions = Mock(return_value=first_page)
+    return client
+
+
+def test_sync_paginates_full_history():
+    older = FakePage([_txn(2, 1), _txn(1, 0)])
+    newest = FakePage([_txn(4, 3), _txn(3, 2)], next_page=older)
+
+    new_txns = sync_transactions(_client(newest), ROOT)
+
+    assert [t.id for t in new_txns] == [4, 3, 2, 1]
+    assert StagedVenmoTransaction.objects.count() == 4
+    cursor = VenmoSyncCursor.objects.get(venmo_id=ROOT.id)
+    assert cursor.last_txn_id == 4
+
+
+def test_sync_stops_at_cursor(settings):
+    settings.PAYABLESUBS_VENMO_SYNC_OVERLAP_SECONDS = 0
+    sync_transactions(_client(FakePage([_txn(2, 1), _txn(1, 0)])), ROOT)
+
+    older = FakePage([_txn(2, 1), _txn(1, 0)])
+    newest = FakePage([_txn(4, 3), _txn(3, 2)], next_page=older)
+    new_txns = sync_transactions(_client(FakePage([_txn(5, 4)], next_page=newest)), ROOT)
+
+    # the cursor's transaction is fetched again, being in the (empty) overlap window
+    assert [t.id for t in new_txns] == [5, 4, 3, 2]
+    assert not older.fetched  # never paginated past the cursor
+    assert StagedVenmoTransaction.objects.count() == 5
+    assert VenmoSyncCursor.objects.get(venmo_id=ROOT.id).last_txn_id == 5
+
+
+def test_sync_stops_at_date_without_cursor_transaction(settings):
+    settings.PAYABLESUBS_VENMO_SYNC_OVERLAP_SECONDS = 0
+    sync_transactions(_client(FakePage([_txn(2, 1)])), ROOT)
+
+    # i.e.: the cursor's transaction is no longer returned by Venmo
+    older = FakePage([_txn(1, 0)])
+    new_txns = sync_transactions(_client(FakePage([_txn(4, 3), _txn(3, 2)], next_page=older)), ROOT)
+
+    assert [t.id for t in new_txns] == [4, 3]
+    assert not older.fetched
+
+
+def test_sync_updates_charges_completed_since_cursor():
+    charge = dict(actor=ROOT, target=JOHN, payment_type="charge")
+    sync_transactions(_client(FakePage([_txn(2, 1), _txn(1, 0, completed_days=False, **charge)])), ROOT)
+    assert sorted(staged_payments_to(ROOT).values_list("host_txn_id", flat=True)) == [2]
+
+    # john paid the charge requested before the last sync, after newer transactions were synced
+    page = FakePage([_txn(3, 5), _txn(2, 1), _txn(1, 0, completed_days=5, **charge)])
+    new_txns = sync_transactions(_client(page), ROOT)
+
+    assert [t.id for t in new_txns] == [3, 2, 1]
+    assert sorted(staged_payments_to(ROOT).values_list("host_txn_id", flat=True)) == [1, 2, 3]
+    assert StagedVenmoTransaction.objects.get(host_txn_id=1).date_completed == _date(5)
+    assert VenmoSyncCursor.objects.get(venmo_id=ROOT.id).last_txn_id == 3
+
+
+def test_sync_refetches_back_to_oldest_pending_charge(settings):
+    settings.PAYABLESUBS_VENMO_SYNC_OVERLAP_SECONDS = 0
+    charge = dict(actor=ROOT, target=JOHN, payment_type="charge")
+    sync_transactions(_client(FakePage([_txn(3, 30), _txn(2, 10, completed_days=False, **charge), _txn(1, 0)])), ROOT)
+
+    # john paid the charge requested 20 days before the last sync, well outside the (empty) overlap window
+    oldest = FakePage([_txn(1, 0)])
+    older = FakePage([_txn(2, 10, completed_days=31, **charge)], next_page=oldest)
+    new_txns = sync_transactions(_client(FakePage([_txn(4, 31), _txn(3, 30)], next_page=older)), ROOT)
+
+    assert [t.id for t in new_txns] == [4, 3, 2]
+    assert StagedVenmoTransaction.objects.get(host_txn_id=2).date_completed == _date(31)
+    assert not oldest.fetched
+
+
+def test_sync_refetches_largest_grace_period():
+    SubscriptionPlan.objects.create(plan_name="Short Plan", grace_period=2)
+    SubscriptionPlan.objects.create(plan_name="Long Plan", grace_period=7)
+    sync_transactions(_client(FakePage([_txn(3, 30), _txn(2, 25), _txn(1, 20)])), ROOT)
+
+    oldest = FakePage([_txn(1, 20)])
+    older = FakePage([_txn(2, 25), _txn(1, 20)], next_page=oldest)
+    new_txns = sync_transactions(_client(FakePage([_txn(4, 31), _txn(3, 30)], next_page=older)), ROOT)
+
+    # i.e.: transactions created within 7 days of the cursor's
+    assert [t.id for t in new_txns] == [4, 3, 2]
+    assert not oldest.fetched
+
+
+def test_sync_dry_run_doesnt_persist():
+    new_txns = sync_transactions(_client(FakePage([_txn(1, 0)])), ROOT, persist=False)
+
+    assert len(new_txns) == 1
+    assert StagedVenmoTransaction.objects.count() == 0
+    assert VenmoSyncCursor.objects.count() == 0
+
+
+def test_staged_payments_to():
+    page = FakePage([
+        _txn(1, 0),  # john paid us
+        _txn(2, 0, actor=ROOT, target=JOHN),  # we paid john
+        _txn(3, 0, actor=ROOT, target=JOHN, payment_type="charge"),  # we charged john
+    ])
+    sync_transactions(_client(page), ROOT)
+
+    staged = staged_payments_to(ROOT)
+    assert sorted(s.host_txn_id for s in staged) == [1, 3]
+    txn = staged.get(host_txn_id=1)
+    assert txn.actor_username == JOHN.username
+    assert txn.target_username == ROOT.username
+    assert txn.amount == 5
+
+    assert list(staged_payments_to(ROOT, since=JAN1_2018 - timedelta(days=1)).values_list("host_txn_id", flat=True))
+    assert not staged_payments_to(ROOT, since=JAN1_2018).exists()